@@ -12,6 +12,14 @@ class Config:
     LOG_DIR = os.path.join(BASE_DIR, 'logs')
     os.makedirs(LOG_DIR, exist_ok=True)
 
+    LOG_DICT = {
+        'json': os.getenv('LOG_JSON', '0') == '1',                          # 每行输出一个json对象，便于日志系统收集
+        # 按模块设置日志级别，例如 LOG_LEVELS="myspiders.base.request=info,database=error"，前缀匹配
+        'levels': dict(one.split('=', 1) for one in os.getenv('LOG_LEVELS', '').split(',') if '=' in one),
+        'when': 'D',                                                        # 日志文件按天分割
+        'backup_count': 3,
+    }
+
     TIMEZONE = 'Asia/Shanghai'
     USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.95 Safari/537.36'
 
@@ -19,6 +27,21 @@ class Config:
         'time_interval': int(os.getenv('TIME_INTERVAL', 720)),              # 定时爬取代理数据时间
     }
 
+    SPIDER_CONSOLE_DICT = {
+        'mode': os.getenv('SPIDER_CONSOLE_MODE', 'sequential'),    # sequential / concurrent / process
+        'concurrency': 30,                                          # 所有spider的总并发数，平均分配给每个spider，不超过spider自身的concurrency
+        'processes': 0,                                             # process模式下的进程数，0表示每个spider模块一个进程
+    }
+
+    SESSION_DICT = {
+        'limit': 100,                       # 连接池总连接数，同一进程中的spider共用
+        'limit_per_host': 0,                # 每个host的连接数，0表示不限制(并发由HostScheduler控制)
+        'ttl_dns_cache': 300,               # DNS缓存秒数，0表示不缓存
+        'keepalive_timeout': 30,            # 空闲连接保留的秒数
+        'force_close': False,               # True时每次请求后关闭连接，不复用
+        'enable_cleanup_closed': True,      # 清理未正常关闭的SSL连接
+    }
+
     HOST_LOCAL = '192.168.3.250'
     MONGO_DICT = {
         'host': HOST_LOCAL,
@@ -26,6 +49,77 @@ class Config:
         'db': PROJECT_NAME,
         'username': 'root',
         'password': '123456',
+        'max_pool_size': 50,                # 每个进程共用一个连接池
+        'min_pool_size': 0,
+        'server_selection_timeout': 5000,
+    }
+
+    MONGO_SINK_DICT = {
+        'batch_size': 500,                  # 缓存满多少条文档时批量写入
+        'flush_interval': 5,                # 距离上次写入超过多少秒时批量写入
+        'retries': 3,                       # 结束时写入失败的文档再重试几次
+        'retry_delay': 2,                   # 结束时每次重试前等待的秒数
+        'spill_dir': os.path.join(BASE_DIR, 'cache', 'mongo_sink'),     # 仍然写入失败的文档保存到这里，下次启动时重新写入
+    }
+
+    INCREMENTAL_DICT = {
+        'enable': os.getenv('INCREMENTAL', '0') == '1',                     # 只写入新增或内容有变化的单词，跳过内容没有变化的页面
+        'pages_collection': 'english_dict_pages',                           # 保存每个页面内容hash的集合
+        'insert_only': ('status',),                                         # 只在新增时写入的字段，不覆盖已有单词的学习状态
+    }
+
+    VOCABULARY_DICT = {
+        # 音标的保存格式: raw 与网页中相同 / ipa 去掉空白，'和:统一为ˈ和ː，首尾统一为[...]
+        # 已有的单词改为ipa前先运行 python -m myspiders.base.cleaning migrate，否则集合中两种格式混在一起(insert模式不更新已有单词)
+        'phonetic_format': os.getenv('PHONETIC_FORMAT', 'raw'),
+    }
+
+    DUPEFILTER_DICT = {
+        'enable': True,                                                     # 回调中产生的重复请求不再进入队列
+        'mode': os.getenv('DUPEFILTER_MODE', 'set'),                        # set: 精确去重 / bloom: 布隆过滤器，内存固定
+        'capacity': 2000000,                                                # bloom模式预计的url数量
+        'error_rate': 0.001,                                                # bloom模式的误判率
+        'persist': os.getenv('DUPEFILTER_PERSIST', '0') == '1',             # 保存指纹，下次运行时跳过已请求过的url
+        'dir': os.path.join(BASE_DIR, 'cache', 'dupefilter'),
+    }
+
+    FRONTIER_DICT = {
+        'enable': os.getenv('FRONTIER', '0') == '1',                        # 保存待爬取的请求，中断后可以继续
+        'dir': os.path.join(BASE_DIR, 'cache', 'frontier'),
+        'batch_size': 500,                                                  # 累计多少条变更时批量写入
+        'flush_interval': 2,                                                # 距离上次写入超过多少秒时批量写入
+    }
+
+    DISTRIBUTED_DICT = {
+        'enable': os.getenv('DISTRIBUTED', '0') == '1',                     # 多个进程/主机共用Redis中的待爬取队列和去重集合
+        'url': os.getenv('REDIS_URL', 'redis://%s:6379/0' % HOST_LOCAL),
+        'key_prefix': PROJECT_NAME,                                         # 队列的key为 <key_prefix>:<spider名称>:queue 等
+        'lease_seconds': 60,                                                # 领取的请求超过多少秒没有确认(节点已退出)时，由其他节点重新领取
+        'prefetch': 0,                                                      # 每个节点最多同时持有的请求数，0表示worker_numbers
+        'poll_interval': 1,                                                 # 暂时没有可领取的请求时，每隔多少秒再检查一次
+    }
+
+    PARSE_EXECUTOR_DICT = {
+        'workers': int(os.getenv('PARSE_WORKERS', 0)),                      # 解析网页的进程数，0表示在event loop中直接解析
+    }
+
+    METRICS_DICT = {
+        'port': int(os.getenv('METRICS_PORT', 0)),                          # 本地HTTP接口 http://127.0.0.1:<port>/metrics，0表示不启动
+        'log_interval': int(os.getenv('METRICS_LOG_INTERVAL', 30)),         # 每隔多少秒输出一行汇总，0表示不输出
+    }
+
+    PROFILER_DICT = {
+        'enable': os.getenv('PROFILE', '0') == '1',                         # 统计handle_request、回调、selector、写入数据库各阶段的用时
+        'tool': os.getenv('PROFILE_TOOL', ''),                              # cprofile / pyinstrument，同时记录整个运行过程
+        'dir': LOG_DIR,                                                     # spider_stages.folded等输出文件的目录
+        'top': 30,                                                          # 结束时输出用时最多的阶段数
+    }
+
+    HTTP_CACHE_DICT = {
+        'enable': os.getenv('HTTP_CACHE', '0') == '1',                      # 是否缓存网页到磁盘
+        'cache_dir': os.path.join(BASE_DIR, 'cache'),
+        'ttl': int(os.getenv('HTTP_CACHE_TTL', 0)),                         # 缓存多少秒内不重新请求，0表示每次都用ETag/Last-Modified验证
+        'offline': os.getenv('HTTP_CACHE_OFFLINE', '0') == '1',             # 离线模式，只使用缓存
     }
 
 
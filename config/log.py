@@ -1,10 +1,36 @@
+import atexit
+import json
 import logging
-from logging import handlers
 import os
+import queue
+from logging import handlers
 from .config import Config
 
 
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行json"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'path': record.pathname,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
 class Logger:
+    """
+    (1) 每个日志文件只配置一次handler：logger上只有一个QueueHandler，屏幕和文件输出由后台线程的QueueListener完成，
+        event loop中记录日志不会等待磁盘写入
+    (2) Logger(name=__name__)得到该日志文件logger的子logger，级别可由Config.LOG_DICT['levels']按模块覆盖
+    (3) Config.LOG_DICT['json']为True时输出json格式
+    """
 
     level_relations = {
         'debug': logging.DEBUG,
@@ -18,26 +44,81 @@ class Logger:
 
     log_file_name = os.path.join(Config.LOG_DIR, Config.PROJECT_NAME + '.log')
 
-    def __init__(self, filename=None, level='info', when='D', backCount=3):
-        # logging.basicConfig(format=self.logging_format, datefmt="%Y:%m:%d %H:%M:%S")  # 此为默认简单设定
+    listeners = {}          # filename -> QueueListener
+    running = set()         # QueueListener正在运行的filename
+
+    def __init__(self, filename=None, level='info', when=None, backCount=None, name=None):
         self.filename = filename or self.log_file_name
-        self.logger = logging.getLogger(self.filename)
-        format_str = logging.Formatter(self.fmt)                                # 设置日志格式
-        self.logger.setLevel(self.level_relations.get(level))                   # 设置日志级别
+        file_logger = logging.getLogger(self.filename)
+        if self.filename not in self.listeners:
+            self.listeners[self.filename] = self._start_listener(file_logger, when, backCount)
+        self.logger = file_logger.getChild(name) if name else file_logger
+        level = (self.module_level(name) or level).strip().lower()
+        if level not in self.level_relations:
+            raise ValueError(f"Unknown log level {level!r} for {name or self.filename}, expected one of: {', '.join(self.level_relations)} "
+                             f"(check Config.LOG_DICT['levels'] / LOG_LEVELS)")
+        self.logger.setLevel(self.level_relations[level])    # 设置日志级别
+
+    def _start_listener(self, file_logger: logging.Logger, when=None, backCount=None) -> handlers.QueueListener:
+        log_config = Config.LOG_DICT
+        format_str = JsonFormatter() if log_config['json'] else logging.Formatter(self.fmt)   # 设置日志格式
         sh = logging.StreamHandler()                                            # 往屏幕上输出
-        sh.setFormatter(format_str)                                             # 设置屏幕上显示的格式
-        th = handlers.TimedRotatingFileHandler(filename=self.filename, when=when, backupCount=backCount, encoding='utf-8')   # 往文件里写入#指定间隔时间自动生成文件的处理器
-        # 实例化TimedRotatingFileHandler
-        # interval是时间间隔，backupCount是备份文件的个数，如果超过这个个数，就会自动删除，when是间隔的时间单位，单位有以下几种：
-        # S 秒
-        # M 分
-        # H 小时、
-        # D 天、
-        # W 每星期（interval==0时代表星期一）
-        # midnight 每天凌晨
-        th.setFormatter(format_str)                                             # 设置文件里写入的格式
-        self.logger.addHandler(sh)                                              # 把对象加到logger里
-        self.logger.addHandler(th)
+        sh.setFormatter(format_str)
+        # 往文件里写入，按when指定的间隔自动生成新文件，超过backupCount个时删除最早的文件
+        # when的单位: S 秒 / M 分 / H 小时 / D 天 / W 每星期（interval==0时代表星期一） / midnight 每天凌晨
+        th = handlers.TimedRotatingFileHandler(
+            filename=self.filename,
+            when=when or log_config['when'],
+            backupCount=log_config['backup_count'] if backCount is None else backCount,
+            encoding='utf-8',
+        )
+        th.setFormatter(format_str)
+
+        log_queue = queue.SimpleQueue()
+        file_logger.addHandler(handlers.QueueHandler(log_queue))              # logger上只有这一个handler
+        file_logger.propagate = False
+        listener = handlers.QueueListener(log_queue, sh, th, respect_handler_level=True)
+        listener.start()
+        self.running.add(self.filename)
+        return listener
+
+    @staticmethod
+    def module_level(name: str = None):
+        """Config.LOG_DICT['levels']中与name最长前缀匹配的级别"""
+        if not name:
+            return None
+        levels = Config.LOG_DICT['levels']
+        parts = name.split('.')
+        for i in range(len(parts), 0, -1):
+            level = levels.get('.'.join(parts[:i]))
+            if level:
+                return level
+        return None
+
+    @classmethod
+    def stop(cls):
+        """写出队列中剩余的日志"""
+        for filename in list(cls.running):
+            cls.listeners[filename].stop()
+            cls.running.discard(filename)
+
+    @classmethod
+    def _restart_after_fork(cls):
+        # fork得到的子进程中没有QueueListener线程，换一个新的队列后重新启动，否则日志会一直留在队列中
+        # 子进程中父进程的线程已标记为结束，stop()不会等待；旧队列中是父进程已经处理的日志，直接丢弃
+        for filename in cls.running:
+            listener = cls.listeners[filename]
+            listener.stop()
+            listener.queue = queue.SimpleQueue()
+            for handler in logging.getLogger(filename).handlers:
+                if isinstance(handler, handlers.QueueHandler):
+                    handler.queue = listener.queue
+            listener.start()
+
+
+atexit.register(Logger.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=Logger._restart_after_fork)
 
 
 if __name__ == '__main__':
@@ -56,5 +137,3 @@ if __name__ == '__main__':
     # 因为日志级别设置了error, 所以所有的高于该级别的日志，都不会被记录下来, 低于该级别的会被记录下来
     logerror.info('logerror的info')
     logerror.critical('logerror的critical')
-
-
@@ -26,7 +26,15 @@ class Rules:
                 Bs4AttrField(target='title', css_select='div.word_main_list_s span', next_request=False, many=False),
                 Bs4TextField(css_select='div.word_main_list_y strong', next_request=False, many=False),
                 Bs4AttrField(target='id', css_select='div.word_main_list_y a', next_request=False, many=False),
-            ]
+            ],
+            engine='lxml',
+            plans={
+                # 单词页面: 每个<li>一行，字段名与Vocabulary的参数一致
+                'words': {
+                    'rows': 2,
+                    'fields': {'name_english': 3, 'name_chinese': 4, 'phonetic': 5, 'voice': 6},
+                },
+            },
         ),
     }
 
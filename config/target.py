@@ -7,19 +7,53 @@ class Target:
             type_main: str,
             type_next: str,
             url: str,
-            selectors: list = None
+            selectors: list = None,
+            engine: str = None,
+            cache_ttl: int = None,
+            plans: dict = None
     ):
         self._bank_name = bank_name
         self._type_main = type_main
         self._type_next = type_next
         self._url = url
         self._selectors = selectors
+        self._engine = engine
+        self._cache_ttl = cache_ttl           # HttpCache的缓存时间(秒)，None时使用HTTP_CACHE_DICT['ttl']
+        # 命名的提取规则 {name: {'rows': 行selector, 'fields': {字段名: selector}, 'cleaners': {字段名: 函数}}}
+        # selector可以是selectors中的下标或者field，第一次调用plan(name)时编译为ExtractionPlan
+        self._plans = plans or {}
+        self._compiled_plans = {}
+        if engine:
+            self._set_engine(engine)
+
+    # engine为'bs4'或'lxml'，统一设置selectors中Bs4*Field的解析引擎
+    def _set_engine(self, engine: str):
+        for selector in self._selectors or []:
+            if hasattr(selector, 'engine'):
+                selector.engine = engine
+
+    def plan(self, name: str):
+        plan = self._compiled_plans.get(name)
+        if plan is None:
+            from myspiders.base import ExtractionPlan       # config先于myspiders.base加载，这里才导入
+            spec = self._plans[name]
+
+            def select(one):
+                return self._selectors[one] if isinstance(one, int) else one
+
+            plan = self._compiled_plans[name] = ExtractionPlan(
+                rows=select(spec['rows']) if spec.get('rows') is not None else None,
+                fields={key: select(one) for key, one in spec['fields'].items()},
+                engine=self._engine,
+                cleaners=spec.get('cleaners'),
+            )
+        return plan
 
     def __repr__(self):
         return f"【bank_name: {self._bank_name}, type_main: {self._type_main}, url: {self._url}】"
 
     def do_dump(self):
-        elements = [one for one in dir(self) if not (one.startswith('__') or one.startswith('_') or one.startswith('do_'))]
+        elements = [one for one in dir(self) if not (one.startswith('__') or one.startswith('_') or one.startswith('do_') or one == 'plan')]
         data = {}
         for name in elements:
             data[name] = getattr(self, name, None)
@@ -64,4 +98,23 @@ class Target:
     @selectors.setter
     def selectors(self, value):
         self._selectors = value
+        if self._engine:
+            self._set_engine(self._engine)
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @engine.setter
+    def engine(self, value):
+        self._engine = value
+        self._set_engine(value)
+
+
+    @property
+    def cache_ttl(self):
+        return self._cache_ttl
 
+    @cache_ttl.setter
+    def cache_ttl(self, value):
+        self._cache_ttl = value
@@ -1,2 +1,3 @@
 from .mongo_database import MongoDatabase
-
+from .mongo_sink import MongoItemSink
+from .incremental import IncrementalIndex
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+from pymongo import UpdateOne, collection
+from pymongo.errors import PyMongoError
+from config import Config, Logger
+
+
+INCREMENTAL = Config.INCREMENTAL_DICT
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little', signed=True)     # Mongo只支持有符号的64位整数
+
+
+class IncrementalIndex:
+    """
+    增量爬取: 启动时从Mongo读取已有单词和页面的hash，运行时只写入新增或内容有变化的单词
+    (1) words: _id -> 文档内容的64位hash，不包括insert_only字段(学习状态)，每个单词约占100字节
+    (2) pages: url -> 页面内容的64位hash，内容没有变化的页面不再解析；开启HTTP_CACHE时未修改的页面返回304，也不需要重新下载
+    (3) 单词和页面的hash都在MongoItemSink确实写入之后(words_written)才记录: 写入失败的单词下次仍会写入，其所在的页面下次仍会解析
+    (4) 结束时把有变化的页面hash批量写回pages_collection
+    """
+
+    logger = Logger(level='warning', name=__name__).logger
+
+    def __init__(self, collec: collection, pages_collec: collection, insert_only: tuple = None):
+        self.collec = collec
+        self.pages_collec = pages_collec
+        self.insert_only = tuple(INCREMENTAL['insert_only'] if insert_only is None else insert_only)
+        self.words = {}
+        self.pages = {}
+        self.pending_pages = {}         # url -> 还没有写入完成的页面hash
+        self.pending_words = {}         # _id -> 已交给item sink、还没有写入的文档hash
+        self.page_words = {}            # url -> 该页面中还没有写入的单词_id
+        self.word_pages = {}            # _id -> 等待该单词写入的页面url
+        self.parsed_pages = set()       # 已解析完、等待单词写入的页面
+        self.changed_pages = {}
+        self.counts = dict.fromkeys(('pages_skipped', 'pages_changed', 'words_new', 'words_changed', 'words_unchanged'), 0)
+
+    def document_digest(self, data: dict) -> int:
+        return _digest('\x1f'.join('%s\x1e%s' % (key, data[key]) for key in sorted(data) if key != '_id' and key not in self.insert_only))
+
+    def _load(self):
+        projection = {key: False for key in self.insert_only}
+        self.words = {one['_id']: self.document_digest(one) for one in self.collec.find({}, projection, batch_size=10000)}
+        self.pages = {one['_id']: one['hash'] for one in self.pages_collec.find({}, batch_size=10000)}
+
+    async def load(self):
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._load)
+        except PyMongoError as e:
+            self.logger.error(f"<IncrementalIndex: load failed, every page will be parsed: {e}>")
+        print('增量模式: 已有单词 %s, 已有页面 %s' % (len(self.words), len(self.pages)))
+
+    def page_changed(self, url: str, html) -> bool:
+        """页面内容与上次相同时返回False；有变化时返回True，处理完成后调用page_done()"""
+        page_hash = _digest(html if isinstance(html, str) else html.decode('latin-1'))
+        if self.pages.get(url) == page_hash:
+            self.counts['pages_skipped'] += 1
+            return False
+        self.pending_pages[url] = page_hash
+        self.page_words.setdefault(url, set())
+        self.counts['pages_changed'] += 1
+        return True
+
+    def page_done(self, url: str):
+        """页面已解析完；其中的单词都写入后才记录hash，解析或写入失败的页面下次仍会处理"""
+        if url not in self.pending_pages:
+            return
+        self.parsed_pages.add(url)
+        if not self.page_words.get(url):
+            self._commit_page(url)
+
+    def _commit_page(self, url: str):
+        self.parsed_pages.discard(url)
+        self.page_words.pop(url, None)
+        page_hash = self.pending_pages.pop(url)
+        self.pages[url] = self.changed_pages[url] = page_hash
+
+    def word_changed(self, data: dict, url: str = None) -> bool:
+        """
+        单词是新增的，或者内容与已有文档不同时返回True，调用者随后把它交给item sink
+        url为单词所在的页面，该页面的hash等到这个单词写入后才记录
+        """
+        _id = data['_id']
+        digest = self.document_digest(data)
+        old = self.words.get(_id)
+        if old == digest:
+            self.counts['words_unchanged'] += 1
+            return False
+        if url in self.page_words:
+            self.page_words[url].add(_id)
+            self.word_pages.setdefault(_id, set()).add(url)
+        if self.pending_words.get(_id) == digest:
+            return False                # 相同的内容已经交给item sink，等待其写入即可
+        self.counts['words_new' if old is None else 'words_changed'] += 1
+        self.pending_words[_id] = digest
+        return True
+
+    def words_written(self, ids: list):
+        """MongoItemSink的on_written: 这些单词已写入数据库"""
+        for _id in ids:
+            digest = self.pending_words.pop(_id, None)
+            if digest is not None:
+                self.words[_id] = digest
+            for url in self.word_pages.pop(_id, ()):
+                words = self.page_words.get(url)
+                if words is None:
+                    continue
+                words.discard(_id)
+                if not words and url in self.parsed_pages:
+                    self._commit_page(url)
+
+    def _save(self):
+        operations = [UpdateOne({'_id': url}, {'$set': {'hash': page_hash}}, upsert=True) for url, page_hash in self.changed_pages.items()]
+        if operations:
+            self.pages_collec.bulk_write(operations, ordered=False)
+        self.changed_pages = {}
+
+    async def close(self):
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._save)
+        except PyMongoError as e:
+            self.logger.error(f"<IncrementalIndex: save page hashes failed: {e}>")
+        print('增量模式: 页面 跳过 %(pages_skipped)s 变化 %(pages_changed)s, 单词 新增 %(words_new)s 修改 %(words_changed)s 未变 %(words_unchanged)s' % self.counts)
+        if self.pending_pages:
+            self.logger.warning(f"<IncrementalIndex: {len(self.pending_pages)} pages not saved, their words were not written; parsed again next time>")
+
+    def __repr__(self):
+        return f"<IncrementalIndex words: {len(self.words)} pages: {len(self.pages)}>"
@@ -1,25 +1,95 @@
+import threading
 from pymongo import MongoClient, collection
+from pymongo.errors import PyMongoError
 from config import Config, singleton
 
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
 
 MONGODB = Config.MONGO_DICT
 
 
 @singleton
 class MongoDatabase:
+    """
+    每个进程只创建一个MongoClient(自带连接池)，第一次调用client()时才创建，之后所有spider共用
+    (1) acquire()/release()记录正在使用的spider数量，最后一个spider release()时关闭连接
+    (2) ping()用于检查连接是否可用
+    (3) async_client()/async_db()返回motor的异步客户端，需要安装motor
+    """
 
-    def client(self):
-        mongo = MongoClient(
+    def __init__(self):
+        self._client = None
+        self._async_client = None
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _client_kwargs() -> dict:
+        return dict(
             host=MONGODB['host'] if MONGODB['host'] else 'localhost',
             port=MONGODB['port'] if MONGODB['port'] else 27017,
             username=MONGODB['username'] if MONGODB['username'] else '',
             password=MONGODB['password'],
+            maxPoolSize=MONGODB.get('max_pool_size', 100),
+            minPoolSize=MONGODB.get('min_pool_size', 0),
+            serverSelectionTimeoutMS=MONGODB.get('server_selection_timeout', 30000),
         )
-        return mongo
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(connect=False, **self._client_kwargs())
+        return self._client
 
     def db(self):
         return self.client()[MONGODB['db']]
 
+    def async_client(self):
+        if AsyncIOMotorClient is None:
+            raise ImportError("motor is required for MongoDatabase.async_client()")
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncIOMotorClient(**self._client_kwargs())
+        return self._async_client
+
+    def async_db(self):
+        return self.async_client()[MONGODB['db']]
+
+    def ping(self) -> bool:
+        try:
+            self.client().admin.command('ping')
+            return True
+        except PyMongoError:
+            return False
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            users = self._users
+        if users <= 0:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+            async_client, self._async_client = self._async_client, None
+            self._users = 0
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            async_client.close()
+
     @staticmethod
     def upsert(collec: collection, condition: dict, data: dict):
         result = collec.find_one(condition)
@@ -42,4 +112,3 @@ class MongoDatabase:
             collec.insert_one(data)
             print('MONGO数据库《%s》中do_insert_one新增: %s' % (collec.name, condition))
             return condition
-
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import time
+from functools import partial
+from pymongo import UpdateOne, collection
+from pymongo.errors import BulkWriteError, PyMongoError
+from config import Config, Logger
+
+
+MONGO_SINK = Config.MONGO_SINK_DICT
+
+
+class MongoItemSink:
+    """
+    缓存待写入的文档，达到batch_size条或距离上次写入超过flush_interval秒时，
+    在线程池中用无序的bulk_write批量upsert，避免每条数据都在event loop线程上同步执行find_one + insert_one
+    mode='insert': 写入语义与MongoDatabase.do_insert_one一致，_id已存在的文档不会被覆盖
+    mode='set': 增量模式，已存在的文档更新为新的内容，insert_only中的字段(例如学习状态)只在新增时写入
+    写入失败的文档不会丢弃: 运行中每隔flush_interval秒重试，close()时再重试retries次，仍然失败的保存到spill_path，下次启动时重新写入
+    on_written(ids)在文档确实写入后调用，例如IncrementalIndex只记录已写入的单词
+    """
+
+    logger = Logger(level='warning', name=__name__).logger
+
+    def __init__(self, collec: collection, batch_size: int = None, flush_interval: float = None, mode: str = 'insert', insert_only: tuple = (),
+                 on_written=None, spill_path: str = None):
+        if mode not in ('insert', 'set'):
+            raise ValueError(f"MongoItemSink mode must be insert or set, not {mode}")
+        self.collec = collec
+        self.mode = mode
+        self.insert_only = tuple(insert_only)
+        self.batch_size = batch_size or MONGO_SINK['batch_size']
+        self.flush_interval = flush_interval or MONGO_SINK['flush_interval']
+        self.on_written = on_written
+        self.spill_path = spill_path or os.path.join(MONGO_SINK['spill_dir'], collec.full_name + '.jsonl')
+        self.buffer = []                # [(_id, update)]
+        self.failures = 0               # 连续写入失败的次数
+        self.last_flush = time.monotonic()
+        self.inserted_counts = 0
+        self.existed_counts = 0
+        self.updated_counts = 0
+        self.failed_counts = 0
+        self.load_spill()
+
+    async def add(self, data: dict):
+        document = {key: value for key, value in data.items() if key != '_id'}
+        if self.mode == 'set':
+            update = {'$set': {key: value for key, value in document.items() if key not in self.insert_only}}
+            insert_only = {key: document[key] for key in self.insert_only if key in document}
+            if insert_only:
+                update['$setOnInsert'] = insert_only
+        else:
+            update = {'$setOnInsert': document}
+        self.buffer.append((data['_id'], update))
+        # 写入失败后只按flush_interval重试，不再每条文档都重试一次
+        if (len(self.buffer) >= self.batch_size and not self.failures) or time.monotonic() - self.last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """返回False表示有文档写入失败，这些文档留在buffer中等待重试"""
+        if not self.buffer:
+            return True
+        entries, self.buffer = self.buffer, []
+        self.last_flush = time.monotonic()
+        operations = [UpdateOne({'_id': _id}, update, upsert=True) for _id, update in entries]
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(None, partial(self.collec.bulk_write, operations, ordered=False))
+        except BulkWriteError as e:
+            # 无序写入时只有writeErrors中的文档失败，其余已写入
+            details = e.details
+            failed = {one['index'] for one in details.get('writeErrors', ())}
+            self.logger.error(f"<MongoItemSink {self.collec.name}: {len(failed)} of {len(entries)} documents failed: {details.get('writeErrors', [])[:1]}>")
+            self._written([one for i, one in enumerate(entries) if i not in failed], details.get('nUpserted', 0), details.get('nMatched', 0), details.get('nModified', 0))
+            self._failed([entries[i] for i in sorted(failed)])
+            return False
+        except PyMongoError as e:
+            self.logger.error(f"<MongoItemSink {self.collec.name}: {len(entries)} documents failed, will retry: {e}>")
+            self._failed(entries)
+            return False
+        self.failures = 0
+        self._written(entries, result.upserted_count, result.matched_count, result.modified_count)
+        return True
+
+    def _written(self, entries: list, upserted: int, matched: int, modified: int):
+        self.inserted_counts += upserted
+        self.existed_counts += matched
+        if self.mode == 'set':
+            self.updated_counts += modified
+            print('MONGO数据库《%s》中bulk_write新增: %s, 已存在: %s, 更新: %s' % (self.collec.name, upserted, matched, modified))
+        else:
+            print('MONGO数据库《%s》中bulk_write新增: %s, 已存在: %s' % (self.collec.name, upserted, matched))
+        if self.on_written is not None and entries:
+            self.on_written([_id for _id, update in entries])
+
+    def _failed(self, entries: list):
+        self.failures += 1
+        self.buffer[:0] = entries       # 放回buffer最前面，下次flush时重试
+
+    def load_spill(self):
+        """读取上次运行时没有写入的文档，放入buffer"""
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, encoding='utf-8') as f:
+            self.buffer.extend((one['_id'], one['update']) for one in map(json.loads, f) if one)
+        os.remove(self.spill_path)
+        print('MONGO数据库《%s》: 重新写入上次失败的文档 %s' % (self.collec.name, len(self.buffer)))
+
+    def spill(self):
+        if not self.buffer:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for _id, update in self.buffer:
+                f.write(json.dumps({'_id': _id, 'update': update}, ensure_ascii=False) + '\n')
+        self.failed_counts += len(self.buffer)
+        self.logger.error(f"<MongoItemSink {self.collec.name}: {len(self.buffer)} documents saved to {self.spill_path}, written at next start>")
+        self.buffer = []
+
+    async def close(self, retries: int = None, retry_delay: float = None):
+        retries = MONGO_SINK['retries'] if retries is None else retries
+        retry_delay = MONGO_SINK['retry_delay'] if retry_delay is None else retry_delay
+        for i in range(retries + 1):
+            if await self.flush():
+                return
+            if i < retries:
+                await asyncio.sleep(retry_delay)
+        self.spill()
@@ -1,7 +1,18 @@
 from .field import BaseField, Bs4TextField, Bs4HtmlField, Bs4AttrField, Bs4AttrTextField, JsonField, TextField, HtmlField, AttrField
 from .spider import Spider
 from .request import Request
+from .scheduler import HostScheduler
+from .cache import HttpCache
+from .dupefilter import RequestDupeFilter
+from .frontier import SqliteFrontier
+from .redis_frontier import RedisFrontier
+from .parse_executor import ExtractionPlan, ParseExecutor
+from .cleaning import VocabularyCleaner
+from .metrics import MetricsRegistry, registry
+from .profiler import StageProfiler, profiler
+from .session import SessionPool, session_pool
+from .encoding import EncodingDetector, encoding_detector
 from .response import Response
 from .maincontent import MainContent
-from .tools import get_random_user_agent
-from .exceptions import IgnoreThisItem, InvalidCallbackResult, InvalidFuncType, InvalidRequestMethod, NothingMatchedError, NotImplementedParseError
+from .tools import get_random_user_agent, user_agent_pool, UserAgentPool
+from .exceptions import IgnoreThisItem, InvalidCallbackResult, InvalidFuncType, InvalidRequestMethod, InvalidResponseBody, NothingMatchedError, NotImplementedParseError
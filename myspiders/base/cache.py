@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Request.fetch使用的磁盘HTTP缓存
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+
+class HttpCache(object):
+    """
+    On-disk HTTP cache for Request.fetch
+    (1) 以 method + url + form_data 作为key，响应内容保存为 <key>.body，状态码、编码、ETag/Last-Modified等保存为 <key>.json
+    (2) 缓存未超过ttl秒时直接使用缓存；超过ttl时带上If-None-Match/If-Modified-Since重新请求，服务器返回304则继续使用缓存
+        ttl为0表示每次都重新验证，可通过Target(cache_ttl=...)按目标单独设置
+    (3) offline为True时完全不访问网络，只使用缓存，没有缓存的请求直接失败
+    """
+
+    KEEP_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+
+    def __init__(self, cache_dir: str, ttl: int = 0, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(method: str, url: str, form_data: dict = None) -> str:
+        key = '%s %s %s' % (method.upper(), url, json.dumps(form_data or {}, sort_keys=True, ensure_ascii=False))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, key)
+
+    def get(self, method: str, url: str, form_data: dict = None) -> Optional[dict]:
+        path = self._path(self.fingerprint(method, url, form_data))
+        try:
+            with open(path + '.json', mode='r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(path + '.body', mode='rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def set(self, method: str, url: str, form_data: dict = None, *, body: bytes, status: int, encoding: str, headers) -> dict:
+        path = self._path(self.fingerprint(method, url, form_data))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'url': url,
+            'status': status,
+            'encoding': encoding,
+            'headers': {name: headers[name] for name in self.KEEP_HEADERS if headers and name in headers},
+            'stored_at': time.time(),
+        }
+        # 先写临时文件再替换，避免中断时留下不完整的缓存
+        with open(path + '.body.tmp', mode='wb') as f:
+            f.write(body)
+        os.replace(path + '.body.tmp', path + '.body')
+        self._write_meta(path, entry)
+        entry['body'] = body
+        return entry
+
+    def touch(self, method: str, url: str, form_data: dict = None, *, entry: dict):
+        """304 Not Modified时刷新缓存时间"""
+        path = self._path(self.fingerprint(method, url, form_data))
+        entry['stored_at'] = time.time()
+        self._write_meta(path, {key: value for key, value in entry.items() if key != 'body'})
+
+    @staticmethod
+    def _write_meta(path: str, meta: dict):
+        with open(path + '.json.tmp', mode='w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def is_fresh(self, entry: dict, ttl: int = None) -> bool:
+        ttl = self.ttl if ttl is None else ttl
+        return ttl > 0 and time.time() - entry['stored_at'] < ttl
+
+    @staticmethod
+    def validators(entry: dict) -> dict:
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    # 读写文件放到线程池中执行，不阻塞event loop
+    async def load(self, method: str, url: str, form_data: dict = None) -> Optional[dict]:
+        return await asyncio.get_event_loop().run_in_executor(None, self.get, method, url, form_data)
+
+    async def store(self, method: str, url: str, form_data: dict = None, **kwargs) -> dict:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self.set(method, url, form_data, **kwargs))
+
+    async def refresh(self, method: str, url: str, form_data: dict = None, *, entry: dict):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, lambda: self.touch(method, url, form_data, entry=entry))
+
+    def __repr__(self):
+        return f"<HttpCache {self.cache_dir} ttl: {self.ttl} offline: {self.offline}>"
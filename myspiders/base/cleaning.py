@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# 按列批量清洗ExtractionPlan提取出的单词，一个页面(或多个页面)的所有行一起处理，直接输出可以写入数据库的文档
+import re
+from functools import partial
+from operator import itemgetter
+
+from pymongo import UpdateOne, collection
+
+from config import Config, Vocabulary
+
+
+VOCABULARY = Config.VOCABULARY_DICT
+
+
+_SEP = '\x00'                       # 拼接一列时的分隔符，值中的\x00会先删除
+# 音标中常见的ASCII替代字符，统一为IPA字符: 重音ˈ、长音ː
+_PHONETIC_REPLACE = (("'", 'ˈ'), (':', 'ː'))
+# 只删除每个音标首尾的[...]或/.../: 在首尾加上分隔符后，只替换紧挨着分隔符的括号，中间的/(例如两种读音 ˈæbsənt/æbˈsent)保留
+_PHONETIC_WRAPPERS = ((_SEP + '[', _SEP), (_SEP + '/', _SEP), (']' + _SEP, _SEP), ('/' + _SEP, _SEP))
+# voice只能包含字母、数字和 _-.
+_INVALID_VOICE = re.compile(r'[^A-Za-z0-9_.\-\x00]')
+_VALID_VOICE = re.compile(r'[A-Za-z0-9_.\-]*')
+
+
+class VocabularyCleaner(object):
+    """
+    Columnar cleaning for extracted vocabulary rows
+    (1) 每个字段用\x00拼接成一个字符串，用str.split/replace等C实现的字符串操作一次处理整列，再拆分回来，不再每个单词调用re.sub
+        name_chinese: 删除所有空白；phonetic: phonetic_format为ipa时删除空白、统一IPA字符、首尾的[]或//统一为[...]，raw时保持不变；
+        voice: 不合法的置为''
+    (2) 按name_english去重，保留第一次出现的行；name_english为空的行丢弃
+    (3) 输出与Vocabulary.do_dump()相同的文档，不再为每个单词创建Vocabulary对象
+    """
+
+    def __init__(self, status: str = 'undo', phonetic_format: str = None):
+        phonetic_format = phonetic_format or VOCABULARY['phonetic_format']
+        if phonetic_format not in ('raw', 'ipa'):
+            raise ValueError(f"VocabularyCleaner phonetic_format must be raw or ipa, not {phonetic_format}")
+        self.status = status
+        self.phonetic_format = phonetic_format
+        self.counts = dict.fromkeys(('rows', 'empty', 'duplicates', 'invalid_voice'), 0)
+
+    @staticmethod
+    def _column(rows: list, name: str) -> list:
+        column = list(map(itemgetter(name), rows))
+        if None in column:
+            column = [one or '' for one in column]
+        return column
+
+    @staticmethod
+    def _join(column: list) -> str:
+        joined = _SEP.join(column)
+        if joined.count(_SEP) != len(column) - 1:
+            joined = _SEP.join(one.replace(_SEP, '') for one in column)
+        return joined
+
+    def clean_chinese(self, column: list) -> list:
+        # str.split()按str.isspace()拆分，与re.sub(r'\s+', '', value)删除的字符相同
+        return ''.join(self._join(column).split()).split(_SEP)
+
+    def clean_phonetic(self, column: list) -> list:
+        if self.phonetic_format == 'raw':
+            return column
+        joined = _SEP + ''.join(self._join(column).split()) + _SEP
+        for old, new in _PHONETIC_WRAPPERS:
+            joined = joined.replace(old, new)
+        joined = joined[1:-1]
+        for old, new in _PHONETIC_REPLACE:
+            joined = joined.replace(old, new)
+        # 每个音标加上[]，空的音标保持为''
+        joined = ('[' + joined.replace(_SEP, ']' + _SEP + '[') + ']').replace('[]', '')
+        return joined.split(_SEP)
+
+    def clean_voice(self, column: list) -> list:
+        if not _INVALID_VOICE.search(self._join(column)):
+            return column
+        cleaned = [one if _VALID_VOICE.fullmatch(one) else '' for one in column]
+        self.counts['invalid_voice'] += sum(1 for old, new in zip(column, cleaned) if old != new)
+        return cleaned
+
+    def clean(self, rows: list) -> list:
+        """rows: [{'name_english', 'name_chinese', 'phonetic', 'voice'}, ...]，返回去重后的文档"""
+        if not rows:
+            return []
+        self.counts['rows'] += len(rows)
+        english = self._column(rows, 'name_english')
+        # 反向生成dict，每个单词对应其第一次出现的位置
+        first = dict(zip(reversed(english), range(len(english) - 1, -1, -1)))
+        empty = english.count('')
+        if empty:
+            first.pop('', None)
+            self.counts['empty'] += empty
+        if len(first) != len(rows):
+            self.counts['duplicates'] += len(rows) - empty - len(first)
+            keep = sorted(first.values())
+            rows = [rows[i] for i in keep]
+            english = [english[i] for i in keep]
+
+        columns = {
+            'name_chinese': self.clean_chinese(self._column(rows, 'name_chinese')),
+            'name_english': english,
+            'phonetic': self.clean_phonetic(self._column(rows, 'phonetic')),
+            'status': [self.status] * len(rows),
+            'voice': self.clean_voice(self._column(rows, 'voice')),
+            '_id': english,
+        }
+        return list(map(dict, map(partial(zip, _DOCUMENT_KEYS), zip(*(columns[key] for key in _DOCUMENT_KEYS)))))
+
+    def __repr__(self):
+        return f"<VocabularyCleaner {self.counts}>"
+
+
+_DOCUMENT_KEYS = Vocabulary._dump_fields + ('_id',)
+
+
+def migrate_phonetic(collec: collection, batch_size: int = 1000) -> int:
+    """
+    把集合中已有单词的音标改为ipa格式，返回修改的单词数；已经是ipa格式的音标不变，可以重复运行
+    IncrementalIndex启动时从集合读取单词的hash，迁移后增量模式不会把所有单词当作有变化
+    """
+    cleaner = VocabularyCleaner(phonetic_format='ipa')
+    modified = 0
+
+    def write(batch):
+        new = cleaner.clean_phonetic([one['phonetic'] for one in batch])
+        operations = [UpdateOne({'_id': one['_id']}, {'$set': {'phonetic': phonetic}}) for one, phonetic in zip(batch, new) if one['phonetic'] != phonetic]
+        if operations:
+            return collec.bulk_write(operations, ordered=False).modified_count
+        return 0
+
+    batch = []
+    for one in collec.find({'phonetic': {'$type': 'string'}}, {'phonetic': True}, batch_size=batch_size):
+        batch.append(one)
+        if len(batch) >= batch_size:
+            modified += write(batch)
+            batch = []
+    if batch:
+        modified += write(batch)
+    return modified
+
+
+def _benchmark_cleaner(total: int = 1000000, page_size: int = 20):
+    """与原来逐个单词 re.sub + Vocabulary(...).do_dump() 比较，按页面(page_size行)批量清洗"""
+    import time
+
+    rows = [{'name_english': 'word%s' % i, 'name_chinese': ' n. 单词 %s ;\n v. 说 ' % i, 'phonetic': "[ 'wɜ:d%s ]" % i, 'voice': 'v%s' % i}
+            for i in range(total)]
+    pages = [rows[i:i + page_size] for i in range(0, total, page_size)]
+
+    begin = time.perf_counter()
+    for page in pages:
+        for one in page:
+            chinese = re.sub(r'\s+', '', one['name_chinese'])
+            Vocabulary(name_english=one['name_english'], name_chinese=chinese, phonetic=one['phonetic'], voice=one['voice']).do_dump()
+    per_word = time.perf_counter() - begin
+
+    cleaner = VocabularyCleaner(phonetic_format='ipa')
+    begin = time.perf_counter()
+    for page in pages:
+        cleaner.clean(page)
+    batch = time.perf_counter() - begin
+    print('逐个单词: %9.0f 行/秒  按列批量: %9.0f 行/秒  (每页%s行)' % (total / per_word, total / batch, page_size))
+
+
+if __name__ == '__main__':
+    # python -m myspiders.base.cleaning migrate   把english_dict中已有单词的音标改为ipa格式
+    import sys
+
+    if sys.argv[1:] == ['migrate']:
+        from database import MongoDatabase
+
+        print('修改音标的单词: %s' % migrate_phonetic(MongoDatabase().db()['english_dict']))
+    else:
+        _benchmark_cleaner()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# Spider._process_async_callback使用的请求去重过滤器
+import hashlib
+import json
+import math
+import os
+from array import array
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url: str) -> str:
+    """
+    去重用的url规范化，保留查询参数(分页等参数不同的url是不同的页面)
+    scheme和host转为小写、去掉默认端口和#fragment、去掉utm_*/spm参数、其余参数排序；不是http(s)的url原样返回
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS:
+        return url
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or port == _DEFAULT_PORTS[scheme] else '%s:%s' % (host, port)
+    if parts.username or parts.password:
+        netloc = '%s@%s' % (parts.netloc.rpartition('@')[0], netloc)
+    queries = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+               if not (key == 'spm' or key.startswith('utm_'))]
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(sorted(queries)), ''))
+
+
+class _BloomBits(object):
+    """
+    固定大小的布隆过滤器，capacity个元素时误判率约为error_rate，内存占用不随元素数量增长
+    2,000,000个url、误判率0.001时约3.6MB
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        # 用两个64位hash组合出k个位置(double hashing)，不需要计算k次hash
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest: bytes) -> bool:
+        """加入digest，返回之前是否已存在"""
+        existed = True
+        for position in self._positions(digest):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                existed = False
+                self.bits[byte] |= bit
+        return existed
+
+
+class RequestDupeFilter(object):
+    """
+    Request fingerprint filter
+    (1) 指纹 = method + canonical_url(url) + form_data 的blake2b摘要，canonical_url会去掉spm/utm_*参数和#fragment，其余参数排序后保留
+    (2) mode='set'：精确去重，每个url保存8字节指纹(array('Q')持久化)；
+        mode='bloom'：布隆过滤器，内存固定，适合上百万url，极少数url会被误判为重复
+    (3) path不为空时，启动时读取上次保存的指纹，close()时写回，实现跨次运行去重
+    (4) Request的metadata中dont_filter为True时不过滤
+    """
+
+    def __init__(self, mode: str = 'set', capacity: int = 2000000, error_rate: float = 0.001, path: str = None):
+        if mode not in ('set', 'bloom'):
+            raise ValueError(f"RequestDupeFilter mode must be 'set' or 'bloom', not {mode!r}")
+        self.mode = mode
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.path = path
+        self.seen_counts = 0
+        self.hit_counts = 0
+        if mode == 'bloom':
+            self.fingerprints = _BloomBits(capacity, error_rate)
+        else:
+            self.fingerprints = set()
+        if path:
+            self.load()
+
+    @staticmethod
+    def fingerprint(method: str, url: str, form_data: dict = None) -> bytes:
+        url = canonical_url(url)
+        key = '%s %s %s' % (method.upper(), url, json.dumps(form_data or {}, sort_keys=True, ensure_ascii=False))
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    def request_seen(self, request) -> bool:
+        """返回True表示该请求之前已经出现过，应当丢弃"""
+        if request.metadata.get('dont_filter'):
+            return False
+        self.seen_counts += 1
+        existed = self.add(request.method, request.url, request.form_data)
+        if existed:
+            self.hit_counts += 1
+        return existed
+
+    def add(self, method: str, url: str, form_data: dict = None) -> bool:
+        """记录一个请求的指纹，不计入统计，返回之前是否已存在"""
+        digest = self.fingerprint(method, url, form_data)
+        if self.mode == 'bloom':
+            existed = self.fingerprints.add(digest)
+        else:
+            key = int.from_bytes(digest[:8], 'little')
+            existed = key in self.fingerprints
+            self.fingerprints.add(key)
+        return existed
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, mode='rb') as f:
+            data = f.read()
+        if self.mode == 'bloom':
+            if len(data) == len(self.fingerprints.bits):
+                self.fingerprints.bits[:] = data
+        else:
+            keys = array('Q')
+            keys.frombytes(data[:len(data) - len(data) % keys.itemsize])
+            self.fingerprints.update(keys)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.mode == 'bloom':
+            data = bytes(self.fingerprints.bits)
+        else:
+            data = array('Q', self.fingerprints).tobytes()
+        with open(self.path + '.tmp', mode='wb') as f:
+            f.write(data)
+        os.replace(self.path + '.tmp', self.path)
+
+    def close(self):
+        self.save()
+        print('去重过滤器(%s): 请求 %s, 重复 %s, 已记录 %s' % (self.mode, self.seen_counts, self.hit_counts, len(self)))
+
+    def __len__(self):
+        if self.mode == 'bloom':
+            return self.seen_counts - self.hit_counts
+        return len(self.fingerprints)
+
+    def __repr__(self):
+        return f"<RequestDupeFilter {self.mode} seen: {self.seen_counts} hits: {self.hit_counts}>"
+
+
+def _benchmark_dupefilter(total: int = 200000):
+    import time
+    import tracemalloc
+
+    class _Request(object):
+        method, form_data, metadata = 'GET', None, {}
+
+        def __init__(self, url):
+            self.url = url
+
+    requests = [_Request('http://www.iciba.com/word?w=word%s&utm_source=a' % (i % (total // 2))) for i in range(total)]
+    for mode in ('set', 'bloom'):
+        start = time.perf_counter()
+        dupefilter = RequestDupeFilter(mode=mode, capacity=total)
+        for one in requests:
+            dupefilter.request_seen(one)
+        elapsed = time.perf_counter() - start
+        # tracemalloc会明显拖慢速度，单独跑一遍统计内存
+        tracemalloc.start()
+        dupefilter = RequestDupeFilter(mode=mode, capacity=total)
+        for one in requests:
+            dupefilter.request_seen(one)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%-6s %s个请求 重复: %s 用时: %.2fs 内存: %.1fMB' % (mode, total, dupefilter.hit_counts, elapsed, memory / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    _benchmark_dupefilter()
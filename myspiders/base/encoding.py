@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Request、HttpCache、MainContent共用的网页解码: 按BOM、响应头、<meta>、同一host上次的编码、cchardet的顺序确定编码
+import codecs
+import re
+
+try:
+    import cchardet
+except ImportError:
+    cchardet = None
+
+from bs4 import UnicodeDammit
+
+from . import metrics
+
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# <meta charset="gbk"> 和 <meta http-equiv="Content-Type" content="text/html; charset=gb2312">
+_META_CHARSET = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([a-zA-Z0-9_:.\-]+)', re.I)
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
+
+# 用兼容范围更大的编码解码: gb2312/gbk声明的页面中经常出现gb18030才有的字符, iso-8859-1声明的页面实际多为cp1252
+# key用codecs.lookup().name，与normalize_encoding()中查找时的名称相同(例如latin-1为iso8859-1)
+_SUPERSETS = {codecs.lookup(old).name: new for old, new in (
+    ('ascii', 'utf-8'),
+    ('gb2312', 'gb18030'),
+    ('gbk', 'gb18030'),
+    ('latin-1', 'cp1252'),
+)}
+
+detections = metrics.registry.counter('spider_encoding_detections_total', 'How the encoding of each page was determined', ('source',))
+
+
+def normalize_encoding(name: str):
+    """返回Python codecs中的编码名称，无法识别时返回None"""
+    if not name:
+        return None
+    try:
+        name = codecs.lookup(name.strip().strip('"\'')).name
+    except LookupError:
+        return None
+    return _SUPERSETS.get(name, name)
+
+
+class EncodingDetector(object):
+    """
+    (1) 依次尝试: 指定的编码 > BOM > 响应头charset > <meta>声明 > 同一host上次成功的编码 > cchardet
+    (2) <meta>只在前meta_size字节中查找；cchardet只检测从第一个非ASCII字节开始的sample_size字节，不再扫描整个网页
+    (3) 每个候选编码严格解码，成功即返回，失败时尝试下一个；全部失败时用第一个候选编码以replace方式解码
+    (4) 成功的编码按host缓存，同一网站没有声明编码的页面不再调用cchardet
+    """
+
+    def __init__(self, meta_size: int = 4096, sample_size: int = 32 * 1024):
+        self.meta_size = meta_size
+        self.sample_size = sample_size
+        self.hosts = {}
+
+    def sniff(self, body: bytes) -> str:
+        for bom, encoding in _BOMS:
+            if body.startswith(bom):
+                return encoding
+        return None
+
+    def meta_charset(self, body: bytes):
+        match = _META_CHARSET.search(body, 0, self.meta_size)
+        return normalize_encoding(match.group(1).decode('ascii', 'ignore')) if match else None
+
+    def chardet(self, body: bytes):
+        match = _NON_ASCII.search(body)
+        if match is None:
+            return 'utf-8'
+        sample = body[match.start():match.start() + self.sample_size]
+        if cchardet is not None:
+            encoding = cchardet.detect(sample)['encoding']
+        else:
+            encoding = UnicodeDammit(sample).original_encoding
+        return normalize_encoding(encoding)
+
+    def candidates(self, body: bytes, encoding: str = None, charset: str = None, host: str = None):
+        """按优先级生成(来源, 编码)，cchardet只在前面的候选编码都无法解码时才执行"""
+        yield 'declared', normalize_encoding(encoding)
+        yield 'bom', self.sniff(body)
+        yield 'header', normalize_encoding(charset)
+        yield 'meta', self.meta_charset(body)
+        yield 'host', self.hosts.get(host)
+        yield 'chardet', self.chardet(body)
+
+    def decode(self, body: bytes, encoding: str = None, charset: str = None, host: str = None):
+        """
+        :param encoding: 强制使用的编码，例如Request(encoding=...)
+        :param charset: 响应头Content-Type中的charset
+        :param host: 用于按host缓存编码
+        :return: (str, 编码)
+        """
+        if not body:
+            return '', normalize_encoding(encoding or charset) or 'utf-8'
+        first, tried = None, set()
+        for source, one in self.candidates(body, encoding=encoding, charset=charset, host=host):
+            if one is None or one in tried:
+                continue
+            tried.add(one)
+            first = first or one
+            try:
+                text = body.decode(one)
+            except (UnicodeDecodeError, LookupError):
+                continue
+            detections.inc(source)
+            if host and source != 'declared':
+                self.hosts[host] = one
+            return text, 'utf-8' if one == 'utf-8-sig' else one
+        first = first or 'utf-8'
+        detections.inc('replace')
+        return body.decode(first, 'replace'), first
+
+    def __repr__(self):
+        return f"<EncodingDetector hosts: {len(self.hosts)}>"
+
+
+encoding_detector = EncodingDetector()
@@ -3,10 +3,13 @@ import re
 import json
 from typing import Union, Pattern
 from lxml import etree
+from cssselect import HTMLTranslator
 from bs4 import BeautifulSoup, UnicodeDammit
 from bs4.element import Tag, NavigableString
 
 from .exceptions import NothingMatchedError
+from .response import Response
+from .tools import remove_whitespace
 
 
 class BaseField(object):
@@ -21,7 +24,79 @@ class BaseField(object):
         raise NotImplementedError("extract is not implemented.")
 
 
+# bs4中按空格拆分为list的多值属性，lxml引擎中保持一致
+CDATA_LIST_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'},
+    'link': {'rel', 'rev'},
+    'td': {'headers'},
+    'th': {'headers'},
+    'form': {'accept-charset'},
+    'object': {'archive'},
+    'area': {'rel'},
+    'icon': {'sizes'},
+    'iframe': {'sandbox'},
+    'output': {'for'},
+}
+
+
+# 与bs4的get_text()一致：不包括注释，以及<script>、<style>、<template>中的文字
+_LXML_TEXT_XPATH = etree.XPath('descendant::text()[not(parent::script or parent::style or ancestor::template)]')
+
+
+def _lxml_attr(element: etree._Element, attr: str, default=None):
+    value = element.get(attr)
+    if value is None:
+        return default
+    if attr in CDATA_LIST_ATTRIBUTES['*'] or attr in CDATA_LIST_ATTRIBUTES.get(element.tag, ()):
+        return value.split()
+    return value
+
+
+def _lxml_string(element: etree._Element):
+    """与bs4的Tag.string一致：只有唯一一个子节点时才返回字符串，否则返回None"""
+    while True:
+        if len(element) == 0:
+            return element.text
+        if element.text or len(element) > 1 or element[0].tail:
+            return None
+        element = element[0]
+        if not isinstance(element.tag, str):          # 注释节点
+            return element.text
+
+
+def _bs4_matches(value, match_against) -> bool:
+    """与bs4 SoupStrainer._matches()一致的匹配规则，value为标签名、属性值(多值属性为list)或字符串"""
+    if isinstance(value, list):
+        for one in value:
+            if _bs4_matches(one, match_against):
+                return True
+        return _bs4_matches(' '.join(value), match_against)
+    if match_against is True:
+        return value is not None
+    if callable(match_against):
+        return match_against(value)
+    if value is None:
+        return not match_against
+    if isinstance(match_against, str):
+        return value == match_against
+    if hasattr(match_against, 'search'):
+        return match_against.search(value) is not None
+    if hasattr(match_against, '__iter__'):
+        return any(_bs4_matches(value, one) for one in match_against)
+    return False
+
+
 class _Bs4Field(BaseField):
+    """
+    extract()支持两种引擎，结果相同：
+    (1) bs4:  BeautifulSoup的find_all()/select()
+    (2) lxml: 构造时将name/attrs/css_select一次性编译为etree.XPath，在lxml的etree上执行，速度快很多
+    传入etree._Element时使用lxml引擎，传入BeautifulSoup/Tag时使用bs4引擎，
+    传入str或Response时按self.engine选择，可通过Target(engine='lxml')统一设置
+    """
+
+    engine = 'bs4'
 
     def __init__(
             self,
@@ -42,25 +117,73 @@ class _Bs4Field(BaseField):
         self.string = string
         self.css_select = css_select
         self.limit = 1 if many is False else None
+        # 规则加载时即编译好XPath，分别用于普通节点和文档根节点(bs4在整个文档中查找时包括<html>本身)
+        self._xpath, self._root_xpath = self._compile_xpath()
+
+    # etree.XPath不能pickle，传给ParseExecutor的子进程时去掉，反序列化后重新编译
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_xpath', None)
+        state.pop('_root_xpath', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._xpath, self._root_xpath = self._compile_xpath()
+
+    def _compile_xpath(self):
+        if self.css_select:
+            translator = HTMLTranslator()
+            return (
+                etree.XPath(translator.css_to_xpath(self.css_select, prefix='descendant::')),
+                etree.XPath(translator.css_to_xpath(self.css_select, prefix='descendant-or-self::')),
+            )
 
-    def extract(self, soup: Union[str, BeautifulSoup, Tag], is_source: bool = False):
-        if isinstance(soup, str):
-            soup = BeautifulSoup(soup, 'lxml')
-
-        elements = self._get_elements(soup=soup)
+        axis, root_axis = ('descendant::', 'descendant-or-self::') if self.recursive else ('child::', 'self::')
+        if isinstance(self.name, str):
+            node_test = self.name
+        elif isinstance(self.name, (list, tuple)) and self.name and all(isinstance(one, str) for one in self.name):
+            node_test = '*[%s]' % ' or '.join('self::%s' % one for one in self.name)
+        else:
+            node_test = '*'
+        # XPath只按属性是否存在预先筛选，属性值的匹配在_lxml_match()中按bs4的规则进行
+        predicates = ''
+        for attr, value in self.attrs.items():
+            if value is None or value is False:
+                predicates += '[not(@%s)]' % attr
+            else:
+                predicates += '[@%s]' % attr
+        return etree.XPath(axis + node_test + predicates), etree.XPath(root_axis + node_test + predicates)
+
+    def extract(self, soup: Union[str, BeautifulSoup, Tag, etree._Element, Response], is_source: bool = False):
+        if isinstance(soup, Response):                      # 使用Response缓存的soup或html_etree，同一个页面只解析一次
+            soup = soup.html_etree if self.engine == 'lxml' else soup.soup
+        elif isinstance(soup, str):
+            soup = etree.HTML(soup) if self.engine == 'lxml' else BeautifulSoup(soup, 'lxml')
+
+        is_lxml = isinstance(soup, etree._Element)
+        if is_lxml:
+            elements = self._get_lxml_elements(soup)
+            is_tag = isinstance(elements[0], etree._Element) if elements else False
+        else:
+            elements = self._get_elements(soup=soup)
+            is_tag = type(elements[0]) == Tag if elements else False
         # 如果是target_item，则表明是一个预先提取的部分，为source, 供后续使用soup继续提取
         # 此处需要判断elements集合中的成员，是Tag类型还是NavigableString类型，因为只有Tag类型，才支持soup继续查找；
         # NavigableString 对象支持 遍历文档树 和 搜索文档树 中定义的大部分属性, 但并非全部。
         # 尤其是,一个字符串不能包含其它内容(tag能够包含字符串或是其它tag), 字符串不支持.contents 或 .string 属性或 find() 方法。
         if is_source:
-            if elements and type(elements[0]) == Tag:
+            if is_tag:
                 return elements
             else:
                 raise NothingMatchedError(f"BeautifulSoup is_source but No Tag found")
 
         if elements:
-            if type(elements[0]) == Tag:
-                results = [self._parse_element(one) for one in elements]
+            if is_tag:
+                parse_element = self._parse_lxml_element if is_lxml else self._parse_element
+                results = [parse_element(one) for one in elements]
+            elif is_lxml:
+                results = [str(one) for one in elements]
             elif type(elements[0]) == NavigableString:
                 results = [self._unicode_value(one) for one in elements]
             else:
@@ -82,9 +205,38 @@ class _Bs4Field(BaseField):
             elements = soup.select(selector=self.css_select, limit=self.limit)
         return elements
 
+    def _get_lxml_elements(self, html_etree: etree._Element):
+        xpath = self._root_xpath if html_etree.getparent() is None else self._xpath
+        if self.css_select:
+            elements = xpath(html_etree)
+        elif self.name is None and not self.attrs and self.string is not None:
+            # 与bs4一致：只指定string时，返回匹配的字符串
+            elements = [one for one in html_etree.xpath('descendant::text()') if _bs4_matches(str(one), self.string)]
+        else:
+            elements = [one for one in xpath(html_etree) if self._lxml_match(one)]
+        return elements[:self.limit] if self.limit else elements
+
+    def _lxml_match(self, element: etree._Element) -> bool:
+        if self.name is not None and not isinstance(self.name, str) and not _bs4_matches(element.tag, self.name):
+            return False
+        for attr, value in self.attrs.items():
+            if not _bs4_matches(_lxml_attr(element, attr), value):
+                return False
+        if self.string is not None and not _bs4_matches(_lxml_string(element), self.string):
+            return False
+        return True
+
     def _parse_element(self, element):
         raise NotImplementedError
 
+    def _parse_lxml_element(self, element):
+        raise NotImplementedError
+
+    def _get_lxml_text(self, element: etree._Element) -> str:
+        """与bs4的get_text(separator, strip=True)一致"""
+        strings = [one.strip() for one in _LXML_TEXT_XPATH(element)]
+        return (self.separator or '').join([one for one in strings if one])
+
 
 class Bs4HtmlField(_Bs4Field):
     def _parse_element(self, element):
@@ -93,6 +245,9 @@ class Bs4HtmlField(_Bs4Field):
         else:
             return BeautifulSoup(element, 'lxml')
 
+    def _parse_lxml_element(self, element):
+        return element
+
 
 class Bs4AttrField(_Bs4Field):
 
@@ -125,6 +280,9 @@ class Bs4AttrField(_Bs4Field):
     def _parse_element(self, element):
         return element.get(self.target, self.default)
 
+    def _parse_lxml_element(self, element):
+        return _lxml_attr(element, self.target, self.default)
+
 
 class Bs4TextField(_Bs4Field):
 
@@ -162,7 +320,15 @@ class Bs4TextField(_Bs4Field):
         if not string:
             return self.default
         else:
-            string = re.sub(r'\s+', '', string)
+            string = remove_whitespace(string)
+            return string
+
+    def _parse_lxml_element(self, element):
+        string = self._get_lxml_text(element)
+        if not string:
+            return self.default
+        else:
+            string = remove_whitespace(string)
             return string
 
 
@@ -205,7 +371,18 @@ class Bs4AttrTextField(_Bs4Field):
         if not string:
             text = self.default
         else:
-            text = re.sub(r'\s+', '', string)
+            text = remove_whitespace(string)
+
+        data = {'text': text, 'attr': attr}
+        return data
+
+    def _parse_lxml_element(self, element):
+        attr = _lxml_attr(element, self.target, self.default)
+        string = self._get_lxml_text(element)
+        if not string:
+            text = self.default
+        else:
+            text = remove_whitespace(string)
 
         data = {'text': text, 'attr': attr}
         return data
@@ -218,7 +395,9 @@ class _LxmlElementField(BaseField):
         self.css_select = css_select
         self.xpath_select = xpath_select
 
-    def extract(self, html_etree: etree._Element, is_source: bool = False):
+    def extract(self, html_etree: Union[etree._Element, Response], is_source: bool = False):
+        if isinstance(html_etree, Response):                # 使用Response缓存的html_etree，同一个页面只解析一次
+            html_etree = html_etree.html_etree
         elements = self._get_elements(html_etree=html_etree)
         # 如果是target_item，则表明是一个预先提取的部分，为source
         if is_source:
@@ -305,7 +484,9 @@ class RegexField(BaseField):
                 return groups[0] if len(groups) == 1 else groups
             return string
 
-    def extract(self, html: Union[str, etree._Element, BeautifulSoup, Tag]):
+    def extract(self, html: Union[str, etree._Element, BeautifulSoup, Tag, Response]):
+        if isinstance(html, Response):
+            html = html.html
         if isinstance(html, etree._Element):                                # 如果html是etree._Element实例，则将其转为string格式
             html = etree.tostring(html).decode(encoding="utf-8")
         elif isinstance(html, BeautifulSoup) or isinstance(html, Tag):
@@ -337,3 +518,61 @@ class JsonField(BaseField):
     # 根据json_select，从json数据中，提取出值，例如title = JsonField(json_select="e")
     def extract(self, jsondata: json):
         return self._get_elements(jsondata=jsondata)
+
+
+def _normalize_result(value):
+    """把两种引擎的结果转换为可比较的形式，Tag与etree._Element按标签名和去掉空白的文字比较"""
+    if isinstance(value, Tag):
+        return value.name, re.sub(r'\s+', '', value.get_text())
+    if isinstance(value, etree._Element):
+        return value.tag, re.sub(r'\s+', '', ''.join(_LXML_TEXT_XPATH(value)))
+    if isinstance(value, list):
+        return [_normalize_result(one) for one in value]
+    if isinstance(value, dict):
+        return {key: _normalize_result(one) for key, one in value.items()}
+    return value
+
+
+def compare_engines(html: str, fields: list) -> list:
+    """对同一个页面分别用bs4和lxml引擎执行fields，返回结果不一致的field"""
+    soup, html_etree = BeautifulSoup(html, 'lxml'), etree.HTML(html)
+    mismatches = []
+    for field in fields:
+        results = []
+        for document in (soup, html_etree):
+            try:
+                results.append(_normalize_result(field.extract(document)))
+            except NothingMatchedError:
+                results.append(None)
+        if results[0] != results[1]:
+            mismatches.append((field, results[0], results[1]))
+    return mismatches
+
+
+if __name__ == '__main__':
+    # 用保存的页面对比bs4与lxml两种引擎的结果和速度: python -m myspiders.base.field page1.html page2.html ...
+    import sys
+    import time
+    from config import Rules
+
+    all_fields = [field for rules in (Rules.RULES_DICT, Rules.RULES_NEWS, Rules.RULES) for target in rules for field in target.selectors or [] if hasattr(field, '_get_lxml_elements')]
+    pages = [open(one, encoding='utf-8', errors='ignore').read() for one in sys.argv[1:]]
+
+    mismatch_counts = 0
+    for path, page in zip(sys.argv[1:], pages):
+        for field, bs4_result, lxml_result in compare_engines(page, all_fields):
+            mismatch_counts += 1
+            print('mismatch:', path, field.name, field.attrs, field.css_select, bs4_result, lxml_result)
+    print('fields: %s, pages: %s, mismatches: %s' % (len(all_fields), len(pages), mismatch_counts))
+
+    for engine, parse in (('bs4', lambda one: BeautifulSoup(one, 'lxml')), ('lxml', etree.HTML)):
+        begin = time.perf_counter()
+        for page in pages:
+            document = parse(page)
+            for field in all_fields:
+                try:
+                    field.extract(document)
+                except NothingMatchedError:
+                    pass
+        elapsed = time.perf_counter() - begin
+        print('%-5s %8.1f pages/second' % (engine, len(pages) / elapsed if elapsed else 0))
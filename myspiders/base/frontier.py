@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# 持久化的待爬取请求队列，spider中断后可以从上次的位置继续
+import json
+import os
+import sqlite3
+import time
+from typing import Iterator
+
+
+class SqliteFrontier(object):
+    """
+    Resumable crawl frontier backed by SQLite
+    (1) 每个进入request_queue的Request保存为一行描述：url, method, form_data, headers, encoding, callback名称, metadata
+        metadata中的Target按(bank_name, type_next, url)保存，恢复时从spider.targets中找回
+    (2) push()/done()先放在内存中，满batch_size条或超过flush_interval秒时在一个事务中批量写入
+    (3) spider被中断(SIGINT/SIGTERM)时flush()，下次启动发现还有未完成的请求，就从这些请求继续，而不是从start_urls重新开始
+    (4) spider正常结束时clear()，下次重新开始
+    """
+
+    STATE_PENDING = 0
+    STATE_DONE = 1
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS requests ('
+            'id INTEGER PRIMARY KEY, url TEXT, method TEXT, form_data TEXT, headers TEXT, '
+            'encoding TEXT, callback TEXT, metadata TEXT, state INTEGER DEFAULT 0)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS requests_state ON requests (state)')
+        self.conn.commit()
+        self.next_id = (self.conn.execute('SELECT MAX(id) FROM requests').fetchone()[0] or 0) + 1
+        self.inserts = []
+        self.dones = []
+        self.last_flush = time.monotonic()
+        self.closed = False
+
+    def push(self, descriptor: dict) -> int:
+        """保存一个请求描述，返回其id，请求处理完后用该id调用done()"""
+        request_id = self.next_id
+        self.next_id += 1
+        self.inserts.append((
+            request_id,
+            descriptor['url'],
+            descriptor['method'],
+            json.dumps(descriptor.get('form_data'), ensure_ascii=False),
+            json.dumps(descriptor.get('headers') or {}, ensure_ascii=False),
+            descriptor.get('encoding'),
+            descriptor.get('callback'),
+            json.dumps(descriptor.get('metadata') or {}, ensure_ascii=False),
+        ))
+        self._maybe_flush()
+        return request_id
+
+    def done(self, request_id: int):
+        if request_id is None:
+            return
+        self.dones.append((self.STATE_DONE, request_id))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.inserts) + len(self.dones) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not (self.inserts or self.dones):
+            return
+        inserts, self.inserts = self.inserts, []
+        dones, self.dones = self.dones, []
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO requests (id, url, method, form_data, headers, encoding, callback, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                inserts,
+            )
+            self.conn.executemany('UPDATE requests SET state = ? WHERE id = ?', dones)
+
+    def pending_counts(self) -> int:
+        self.flush()
+        return self.conn.execute('SELECT COUNT(*) FROM requests WHERE state = ?', (self.STATE_PENDING,)).fetchone()[0]
+
+    def iter_pending(self) -> Iterator[dict]:
+        self.flush()
+        rows = self.conn.execute(
+            'SELECT id, url, method, form_data, headers, encoding, callback, metadata FROM requests WHERE state = ? ORDER BY id',
+            (self.STATE_PENDING,),
+        ).fetchall()
+        for request_id, url, method, form_data, headers, encoding, callback, metadata in rows:
+            yield {
+                'id': request_id,
+                'url': url,
+                'method': method,
+                'form_data': json.loads(form_data),
+                'headers': json.loads(headers),
+                'encoding': encoding,
+                'callback': callback,
+                'metadata': json.loads(metadata),
+            }
+
+    def iter_seen(self) -> Iterator[tuple]:
+        """所有已保存的请求(method, url, form_data)，恢复时用来填充去重过滤器"""
+        self.flush()
+        for method, url, form_data in self.conn.execute('SELECT method, url, form_data FROM requests'):
+            yield method, url, json.loads(form_data)
+
+    def clear(self):
+        self.inserts, self.dones = [], []
+        with self.conn:
+            self.conn.execute('DELETE FROM requests')
+
+    def close(self, clear: bool = False):
+        if self.closed:
+            return
+        if clear:
+            self.clear()
+        else:
+            self.flush()
+        self.conn.close()
+        self.closed = True
+
+    def __repr__(self):
+        return f"<SqliteFrontier {self.path}>"
+
+
+def dump_metadata(metadata: dict) -> dict:
+    """Target不能直接保存为json，改为保存能在spider.targets中找回它的key"""
+    data = {}
+    for key, value in (metadata or {}).items():
+        if hasattr(value, 'selectors') and hasattr(value, 'type_next'):
+            value = {'__target__': [value.bank_name, value.type_next, value.url]}
+        data[key] = value
+    return data
+
+
+def load_metadata(data: dict, targets: list) -> dict:
+    targets_map = {(one.bank_name, one.type_next, one.url): one for one in targets or []}
+    metadata = {}
+    for key, value in (data or {}).items():
+        if isinstance(value, dict) and '__target__' in value:
+            value = targets_map.get(tuple(value['__target__']))
+        metadata[key] = value
+    return metadata
@@ -5,6 +5,7 @@ import json
 from .exceptions import IgnoreThisItem, InvalidFuncType
 from .field import BaseField
 from .request import Request
+from .response import Response
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 
@@ -42,6 +43,7 @@ class Item(metaclass=ItemMeta):
      (1) html：网页源码
      (2) url：网页链接
      (3) html_etree：etree._Element对象
+     (4) response：Response对象，直接复用其缓存的html_etree或soup，不再重复解析
     """
 
     def __init__(self):
@@ -144,13 +146,15 @@ class Item(metaclass=ItemMeta):
                     _, response = await request.fetch_callback(sem=sem)
                 else:
                     response = await request.fetch()
-                html = response.html
+                return response.html_etree
             return etree.HTML(html)
         else:
             ValueError("_get_html(url or html_etree) is expected")
 
     @classmethod
-    async def get_item(cls, *, html: str = "", url: str = "", html_etree: etree._Element = None, **kwargs) -> Any:
+    async def get_item(cls, *, html: str = "", url: str = "", html_etree: etree._Element = None, response: Response = None, **kwargs) -> Any:
+        if html_etree is None and response is not None:
+            html_etree = response.html_etree
         if html_etree is None:
             html_etree = await cls._get_html(html, url, **kwargs)
 
@@ -158,7 +162,9 @@ class Item(metaclass=ItemMeta):
 
     # 1、从spider子类实例中执行DoubanItem.get_items(html=response.html)，来到Item类中
     @classmethod
-    async def get_items(cls, *, html: str = "", url: str = "", html_etree: etree._Element = None, **kwargs):
+    async def get_items(cls, *, html: str = "", url: str = "", html_etree: etree._Element = None, response: Response = None, **kwargs):
+        if html_etree is None and response is not None:
+            html_etree = response.html_etree
         if html_etree is None:
             html_etree = await cls._get_html(html, url, **kwargs)
 
@@ -195,21 +201,24 @@ class Item(metaclass=ItemMeta):
                     _, response = await request.fetch_callback(sem=sem)
                 else:
                     response = await request.fetch()
-
-                html = response.html
+                return response.soup
             return BeautifulSoup(html, 'lxml')
         else:
             ValueError("_get_soup(url or html text) is expected")
 
     @classmethod
-    async def get_bs4_item(cls, *, html: str = "", url: str = "", soup: BeautifulSoup = None, **kwargs) -> Any:
+    async def get_bs4_item(cls, *, html: str = "", url: str = "", soup: BeautifulSoup = None, response: Response = None, **kwargs) -> Any:
+        if soup is None and response is not None:
+            soup = response.soup
         if soup is None:
             soup = await cls._get_soup(html, url, **kwargs)
         return await cls._parse_soup(tag=soup)
 
 
     @classmethod
-    async def get_bs4_items(cls, *, html: str = "", url: str = "", soup: BeautifulSoup = None, **kwargs):
+    async def get_bs4_items(cls, *, html: str = "", url: str = "", soup: BeautifulSoup = None, response: Response = None, **kwargs):
+        if soup is None and response is not None:
+            soup = response.soup
         if soup is None:
             soup = await cls._get_soup(html, url, **kwargs)
 
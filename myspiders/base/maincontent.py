@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
+import os
 import re
 import time
 import traceback
+from collections import deque
 
-import cchardet
 import lxml
 import lxml.html
 from lxml.html import HtmlComment
+from urllib.parse import urlparse
+
+from .encoding import encoding_detector
 
 
 # REGEXES收集了一些经常出现在标签的class和id中的关键词，这些词标识着该标签可能是正文或者不是。
@@ -108,10 +112,8 @@ class MainContent:
     def get_main_block(self, url, html, clean_title=True):
         ''' return (title, etree_of_main_content_block)'''
         if isinstance(html, bytes):
-            encoding = cchardet.detect(html)['encoding']
-            if encoding is None:
-                return None, None
-            html = html.decode(encoding, 'ignore')
+            # 与Request相同的解码顺序: BOM > <meta>声明 > 同一host上次的编码 > cchardet(只检测一部分内容)
+            html, encoding = encoding_detector.decode(html, host=urlparse(url).netloc)
         try:
             doc = lxml.html.fromstring(html)
             doc.make_links_absolute(base_url=url)
@@ -128,25 +130,19 @@ class MainContent:
             return self.title, None
 
         candidates = []
-        nodes = body[0].getchildren()
+        # 广度优先遍历，deque.popleft()代替list.pop(0)，大页面不再是O(n²)
+        nodes = deque(body[0])
+        skip_tags = self.non_content_tag | {'a', 'textarea'}          # FIXME: textarea is only part of content?
         while nodes:
             # 一个接着一个取出node
-            node = nodes.pop(0)
-            children = node.getchildren()
+            node = nodes.popleft()
             tlen = 0
-            for child in children:
+            for child in node:
                 if isinstance(child, HtmlComment):
                     continue
-                if child.tag in self.non_content_tag:
-                    continue
-                if child.tag == 'a':
-                    continue
-                if child.tag == 'textarea':
-                    # FIXME: this tag is only part of content?
+                if child.tag in skip_tags:
                     continue
-                attr = '%s%s%s' % (child.get('class', ''),
-                                   child.get('id', ''),
-                                   child.get('style'))
+                attr = child.get('class', '') + child.get('id', '') + str(child.get('style'))
                 if 'display' in attr and 'none' in attr:
                     continue
 
@@ -183,11 +179,42 @@ class MainContent:
         good = self.clean_node(good, url)
         return self.title, good
 
+    def text_stats(self, tree) -> dict:
+        """
+        自底向上遍历一次，计算每个元素 text_content() 去掉空白后的长度，以及其中 <a> 的文本长度(只统计超过5个字符的链接)
+        返回 {element: (文本长度, 链接文本长度, 是否包含<a>)}，clean_node() 不再对每个节点重复 xpath('.//a') 和 text_content()
+        """
+        p_space = self.p_space
+        stats = {}
+        for _, node in lxml.etree.iterwalk(tree, events=('end',)):
+            if not isinstance(node.tag, str):
+                continue
+            text_len = len(p_space.sub('', node.text)) if node.text else 0
+            link_len = 0
+            has_a = False
+            for child in node:
+                child_stats = stats.get(child)
+                if child_stats is not None:
+                    child_text, child_link, child_has_a = child_stats
+                    text_len += child_text
+                    link_len += child_link
+                    if child.tag == 'a':
+                        has_a = True
+                        if child_text > 5:
+                            link_len += child_text
+                    elif child_has_a:
+                        has_a = True
+                if child.tail:
+                    text_len += len(p_space.sub('', child.tail))
+            stats[node] = (text_len, link_len, has_a)
+        return stats
+
     # clean_node()这个函数。通过get_main_block()得到的节点，
     # 有可能包含相关新闻的链接，这些链接包含大量新闻标题，如果不去除，就会给新闻内容带来杂质（相关新闻的标题、概述等）。
     def clean_node(self, tree, url=''):
         to_drop = []
         drop_left = False
+        stats = self.text_stats(tree)
         for node in tree.iterdescendants():
             if drop_left:
                 to_drop.append(node)
@@ -207,16 +234,9 @@ class MainContent:
             if self.p_clean_tree.search(attr):
                 to_drop.append(node)
                 continue
-            aa = node.xpath('.//a')
-            if aa:
-                text_node = len(self.p_space.sub('', node.text_content()))
-                text_aa = 0
-                for a in aa:
-                    alen = len(self.p_space.sub('', a.text_content()))
-                    if alen > 5:
-                        text_aa += alen
-                if text_aa > text_node * 0.4:
-                    to_drop.append(node)
+            text_node, text_aa, has_a = stats.get(node, (0, 0, False))
+            if has_a and text_aa > text_node * 0.4:
+                to_drop.append(node)
         for node in to_drop:
             try:
                 node.drop_tree()
@@ -265,14 +285,43 @@ class MainContent:
         return title, content
 
 
+def _benchmark_maincontent(corpus_dir: str, rounds: int = 3):
+    """对目录中保存的新闻网页(*.html, *.htm)计算每秒处理的页面数和峰值内存"""
+    import tracemalloc
+
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                pages.append((name, f.read()))
+    if not pages:
+        print('no *.html in', corpus_dir)
+        return
+    mc = MainContent()
+    begin = time.perf_counter()
+    for i in range(rounds):
+        for name, html in pages:
+            mc.extract('', html)
+    elapsed = time.perf_counter() - begin
+
+    tracemalloc.start()
+    for name, html in pages:
+        mc.extract('', html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('页面: %s, 平均大小: %.1fKB, 速度: %.1f页/秒, 峰值内存: %.1fMB' % (
+        len(pages), sum(len(html) for name, html in pages) / len(pages) / 1024, len(pages) * rounds / elapsed, peak / 1024 / 1024))
+
+
 if __name__ == '__main__':
     from sys import argv
     f = argv[1]
+    if os.path.isdir(f):            # python -m myspiders.base.maincontent <保存的网页目录>
+        _benchmark_maincontent(f)
+        raise SystemExit
     html = open(f, 'rb').read()
-    encoding = cchardet.detect(html)
+    html, encoding = encoding_detector.decode(html)
     print('encoding:', encoding)
-    encoding = encoding['encoding']
-    html = html.decode(encoding, 'ignore')
     mc = MainContent()
     b = time.time()
     t, c = mc.extract('', html)
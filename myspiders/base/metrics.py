@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# 爬取过程的统计指标，可以通过本地HTTP接口(Prometheus文本格式)查看，也会定时输出一行汇总
+import bisect
+import time
+from collections import defaultdict
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _label_text(self, values: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labels, values)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        # Prometheus文本格式中label的值需要转义 \ " 和换行
+        return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')) for key, value in pairs)
+
+    def render(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super(Counter, self).__init__(name, documentation, labels)
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] += amount
+
+    def set(self, value: float, *labels):
+        """由collector直接设置累计值，例如MongoItemSink中已有的计数"""
+        self.values[labels] = value
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> list:
+        return ['%s%s %s' % (self.name, self._label_text(key), value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] -= amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = None):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = {}
+        self.sums = defaultdict(float)
+
+    def observe(self, value: float, *labels):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def count(self, *labels) -> int:
+        return sum(self.counts.get(labels, ()))
+
+    def sum(self, *labels) -> float:
+        return self.sums.get(labels, 0.0)
+
+    def mean(self) -> float:
+        """所有label合计的平均值"""
+        count = sum(sum(one) for one in self.counts.values())
+        return sum(self.sums.values()) / count if count else 0.0
+
+    def render(self) -> list:
+        lines = []
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, one in zip(self.buckets + ('+Inf',), counts):
+                cumulative += one
+                lines.append('%s_bucket%s %s' % (self.name, self._label_text(key, {'le': bound}), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, self._label_text(key), self.sums[key]))
+            lines.append('%s_count%s %s' % (self.name, self._label_text(key), cumulative))
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    (1) counter()/gauge()/histogram()注册指标，同名指标只创建一次
+    (2) add_collector()注册在输出前调用的函数，用于采样队列长度等当前值
+    (3) render()输出Prometheus文本格式
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _get(self, metric_class, name: str, documentation: str, labels: tuple = (), **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(name, documentation, labels, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = None) -> Histogram:
+        return self._get(Histogram, name, documentation, labels, buckets=buckets)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def collect(self):
+        for collector in list(self.collectors):
+            collector()
+
+    def render(self) -> str:
+        self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+request_latency = registry.histogram('spider_request_latency_seconds', 'HTTP request latency by host', ('host',))
+response_bytes = registry.counter('spider_response_bytes_total', 'Bytes downloaded by host', ('host',))
+retries = registry.counter('spider_retries_total', 'Request retries by reason', ('reason',))
+responses = registry.counter('spider_responses_total', 'Finished requests by spider and result', ('spider', 'result'))
+in_flight = registry.gauge('spider_in_flight_requests', 'Requests being fetched', ('spider',))
+queue_depth = registry.gauge('spider_queue_depth', 'Items waiting in request_queue', ('spider',))
+callback_seconds = registry.histogram('spider_callback_seconds', 'Time spent inside spider callbacks', ('callback',))
+items_written = registry.counter('spider_items_written_total', 'Documents written by the item sink', ('spider',))
+
+
+class _MetricsServer(object):
+    """同一进程只启动一个HTTP接口，多个spider共用，最后一个spider结束时关闭"""
+
+    def __init__(self):
+        self.runner = None
+        self.users = 0
+
+    async def start(self, port: int, host: str = '127.0.0.1'):
+        self.users += 1
+        if self.runner is not None or web is None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        self.users -= 1
+        if self.users <= 0 and self.runner is not None:
+            runner, self.runner = self.runner, None
+            await runner.cleanup()
+
+    @staticmethod
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+metrics_server = _MetricsServer()
+
+
+class RateMeter(object):
+    """计算两次调用之间的平均速率，用于定时输出的 条/秒"""
+
+    def __init__(self):
+        self.last_value = 0
+        self.last_time = time.monotonic()
+
+    def rate(self, value: float) -> float:
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        speed = (value - self.last_value) / elapsed if elapsed > 0 else 0.0
+        self.last_value, self.last_time = value, now
+        return speed
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# 在进程池中解析网页，避免占用CPU的解析阻塞event loop中的网络请求
+import asyncio
+import itertools
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union
+
+from lxml import etree
+from bs4 import BeautifulSoup
+
+from .field import BaseField
+from .response import Response
+
+
+_plan_keys = itertools.count(1)
+
+
+class ExtractionPlan(object):
+    """
+    可以pickle的提取规则，由Target.selectors中的field组成
+    (1) rows为None时：对整个页面执行fields，返回 {name: 结果}
+    (2) rows不为None时：先用rows找出每一行，再对每一行执行fields，返回 [{name: 结果}, ...]
+    fields的结果必须是str/list等可以pickle的值，Bs4HtmlField这类返回节点的field只能作为rows
+    (3) cleaners: {name: func}，提取后对该字段的值调用func，func必须是模块级函数(子进程中按名称导入)
+    通常由Target(plans={...}).plan(name)编译得到，每个Target的每个plan只创建一次
+    """
+
+    def __init__(self, fields: dict, rows: BaseField = None, engine: str = None, cleaners: dict = None):
+        self.fields = fields
+        self.rows = rows
+        self.engine = engine or getattr(rows, 'engine', None) or 'lxml'
+        self.cleaners = cleaners or {}
+        self.key = next(_plan_keys)             # 子进程按key缓存反序列化后的plan
+
+    def parse(self, html: Union[str, bytes, Response]):
+        """Response使用其缓存的html_etree/soup，同一个页面只解析一次"""
+        if isinstance(html, Response):
+            return html.html_etree if self.engine == 'lxml' else html.soup
+        if isinstance(html, (str, bytes)):
+            return etree.HTML(html) if self.engine == 'lxml' else BeautifulSoup(html, 'lxml')
+        return html
+
+    def _extract_row(self, row) -> dict:
+        data = {name: field.extract(row) for name, field in self.fields.items()}
+        for name, cleaner in self.cleaners.items():
+            data[name] = cleaner(data[name])
+        return data
+
+    def execute(self, html: Union[str, bytes, Response]):
+        document = self.parse(html)
+        if self.rows is None:
+            return self._extract_row(document)
+        rows = self.rows.extract(document)
+        if not isinstance(rows, list):
+            rows = [rows]
+        return [self._extract_row(row) for row in rows]
+
+    def __repr__(self):
+        return f"<ExtractionPlan rows: {self.rows is not None} fields: {list(self.fields)}>"
+
+
+# 子进程中已经反序列化过的plan，同一个plan只反序列化(编译XPath)一次
+_WORKER_PLANS = {}
+
+
+def _execute_plan(key: int, plan_bytes: bytes, html: Union[str, bytes]):
+    plan = _WORKER_PLANS.get(key)
+    if plan is None:
+        plan = _WORKER_PLANS[key] = pickle.loads(plan_bytes)
+    return plan.execute(html)
+
+
+class ParseExecutor(object):
+    """
+    Opt-in process pool for HTML extraction
+    (1) await extract(plan, html)：在子进程中执行ExtractionPlan，event loop在解析期间继续处理网络请求
+    (2) await run(func, *args)：在子进程中执行任意可以pickle的函数，例如MainContent().extract
+    (3) workers为0时不使用进程池，直接在当前线程中执行，与原来的行为一致
+    进程池在第一次使用时才创建
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self.pool = None
+        self.plans = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def _plan_bytes(self, plan: ExtractionPlan) -> bytes:
+        # 每个plan只pickle一次
+        plan_bytes = self.plans.get(plan.key)
+        if plan_bytes is None:
+            plan_bytes = self.plans[plan.key] = pickle.dumps(plan)
+        return plan_bytes
+
+    async def extract(self, plan: ExtractionPlan, html: Union[str, bytes, Response]):
+        if not self.workers:
+            return plan.execute(html)
+        if isinstance(html, Response):
+            html = html.html                    # 子进程中重新解析，只传递str
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._get_pool(), _execute_plan, plan.key, self._plan_bytes(plan), html)
+
+    async def run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(self._get_pool(), func, *args)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def __repr__(self):
+        return f"<ParseExecutor workers: {self.workers}>"
+
+
+async def _benchmark_parse_executor(plan: ExtractionPlan, pages: list, workers: int, rounds: int):
+    import time
+    executor = ParseExecutor(workers=workers)
+    await executor.extract(plan, pages[0])          # 先启动进程池
+    begin = time.perf_counter()
+    tasks = [executor.extract(plan, page) for _ in range(rounds) for page in pages]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - begin
+    executor.close()
+    return len(tasks) / elapsed
+
+
+if __name__ == '__main__':
+    # 用保存的单词页面比较不同进程数的解析速度: python -m myspiders.base.parse_executor page1.html page2.html ...
+    import sys
+    from config import Rules
+
+    word_plan = list(Rules.RULES_DICT)[0].plan('words')
+    saved_pages = [open(one, encoding='utf-8', errors='ignore').read() for one in sys.argv[1:]]
+    for count in (0, 1, 2, 4, 8):
+        speed = asyncio.run(_benchmark_parse_executor(word_plan, saved_pages, count, rounds=max(1, 400 // max(1, len(saved_pages)))))
+        print('workers: %s  %8.1f pages/second' % (count or 'inline', speed))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# 按阶段统计spider各部分的用时，用于找出耗时最多的回调和selector
+import contextvars
+import cProfile
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+from .field import BaseField
+
+
+# 当前task所在的阶段路径，例如 ('handle_request', 'callback:DictSpider.parse_final', 'extract:Bs4TextField(...)')
+_stage_path = contextvars.ContextVar('stage_path', default=())
+
+
+def _all_subclasses(cls):
+    for one in cls.__subclasses__():
+        yield one
+        yield from _all_subclasses(one)
+
+
+def field_label(field: BaseField) -> str:
+    """用于区分同一个类的不同selector，例如 Bs4AttrField(div.word_main_list_w span@title)"""
+    selector = getattr(field, 'css_select', None) or getattr(field, 'xpath_select', None) or getattr(field, 're_select', None) or getattr(field, 'json_select', None)
+    if selector is None:
+        selector = getattr(field, 'name', None)
+        attrs = getattr(field, 'attrs', None)
+        if attrs:
+            selector = '%s%s' % (selector, sorted(attrs))
+    target = getattr(field, 'target', None) or getattr(field, 'attr', None)
+    return '%s(%s%s)' % (type(field).__name__, selector, '@%s' % target if target else '')
+
+
+class StageProfiler(object):
+    """
+    Lightweight per-stage timers for Spider
+    (1) start()时才替换handle_request、各Field.extract、item sink的方法，关闭时完全没有额外开销
+    (2) 阶段可以嵌套，按task记录路径，结束时输出每个阶段的总用时/自身用时/次数，以及flamegraph.pl可用的folded格式
+    (3) 可选同时用cProfile或pyinstrument记录整个运行过程
+    用时为实际经过的时间，包括阶段内await网络或数据库的时间
+    """
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: [0, 0.0])          # path -> [次数, 总用时]
+        self.users = 0
+        self.patched = []
+        self.tool = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.users > 0
+
+    @contextmanager
+    def stage(self, name: str):
+        path = _stage_path.get() + (name,)
+        token = _stage_path.set(path)
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            stat = self.stats[path]
+            stat[0] += 1
+            stat[1] += time.perf_counter() - begin
+            _stage_path.reset(token)
+
+    def wrap(self, func, name: str):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+        return wrapper
+
+    async def iter_async(self, async_gen, name: str):
+        """统计异步生成器(spider回调)每一步的用时，不包括处理yield结果的时间"""
+        while True:
+            with self.stage(name):
+                try:
+                    result = await async_gen.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield result
+
+    def _patch_fields(self):
+        profiler = self
+
+        for cls in [BaseField] + list(_all_subclasses(BaseField)):
+            original = cls.__dict__.get('extract')
+            if original is None:
+                continue
+
+            def make(original):
+                @wraps(original)
+                def extract(field, *args, **kwargs):
+                    with profiler.stage('extract:' + field_label(field)):
+                        return original(field, *args, **kwargs)
+                return extract
+
+            setattr(cls, 'extract', make(original))
+            self.patched.append((cls, 'extract', original))
+
+    def patch_instance(self, obj, method_name: str, name: str):
+        """替换实例的方法，例如spider.handle_request、spider.item_sink.add"""
+        setattr(obj, method_name, self.wrap(getattr(obj, method_name), name))
+
+    def start(self, tool: str = None):
+        self.users += 1
+        if self.users > 1:
+            return
+        self.stats.clear()
+        self._patch_fields()
+        if tool == 'cprofile':
+            self.tool = cProfile.Profile()
+            self.tool.enable()
+        elif tool == 'pyinstrument' and PyinstrumentProfiler is not None:
+            self.tool = PyinstrumentProfiler(async_mode='disabled')
+            self.tool.start()
+
+    def stop(self, dump_dir: str = None, top: int = 30):
+        self.users -= 1
+        if self.users > 0:
+            return
+        for cls, method_name, original in reversed(self.patched):
+            setattr(cls, method_name, original)
+        self.patched = []
+        tool, self.tool = self.tool, None
+        if tool is not None:
+            if isinstance(tool, cProfile.Profile):
+                tool.disable()
+            else:
+                tool.stop()
+        # 没有指定dump_dir时只输出report，不保存文件
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+            if isinstance(tool, cProfile.Profile):
+                tool.dump_stats(os.path.join(dump_dir, 'spider.prof'))
+            elif tool is not None:
+                with open(os.path.join(dump_dir, 'spider_pyinstrument.html'), mode='w', encoding='utf-8') as f:
+                    f.write(tool.output_html())
+            with open(os.path.join(dump_dir, 'spider_stages.folded'), mode='w', encoding='utf-8') as f:
+                f.write(self.folded())
+        print(self.report(top=top))
+
+    def _self_times(self) -> dict:
+        self_times = {path: stat[1] for path, stat in self.stats.items()}
+        for path, stat in self.stats.items():
+            if len(path) > 1 and path[:-1] in self_times:
+                self_times[path[:-1]] -= stat[1]
+        return self_times
+
+    def folded(self) -> str:
+        """flamegraph.pl格式：阶段路径用;连接，数值为自身用时(微秒)"""
+        lines = []
+        for path, self_time in sorted(self._self_times().items()):
+            lines.append('%s %d' % (';'.join(path), max(0, self_time) * 1000000))
+        return '\n'.join(lines) + '\n'
+
+    def report(self, top: int = 30) -> str:
+        """按阶段嵌套关系输出，同一层按总用时从大到小排列"""
+        self_times = self._self_times()
+        children = defaultdict(list)
+        for path in self.stats:
+            children[path[:-1]].append(path)
+        lines = ['【=======================================阶段用时=========================================】',
+                 '%10s %10s %8s  %s' % ('总用时(s)', '自身(s)', '次数', '阶段')]
+
+        def walk(parent):
+            for path in sorted(children.get(parent, []), key=lambda one: -self.stats[one][1]):
+                if len(lines) - 2 >= top:
+                    return
+                count, total = self.stats[path]
+                lines.append('%10.3f %10.3f %8d  %s%s' % (total, self_times[path], count, '  ' * (len(path) - 1), path[-1]))
+                walk(path)
+
+        walk(())
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f"<StageProfiler stages: {len(self.stats)} enabled: {self.enabled}>"
+
+
+profiler = StageProfiler()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# 分布式模式的待爬取队列: 多个进程/主机共用Redis中的请求队列和去重集合，领取(lease)的请求处理完后确认(ack)，节点退出时由其他节点重新领取
+import json
+from typing import Iterable, List, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+from . import metrics
+from .dupefilter import RequestDupeFilter
+
+
+distributed_requests = metrics.registry.counter(
+    'spider_distributed_requests_total', 'Requests pushed, leased and acknowledged through the shared frontier', ('event',))
+
+# KEYS: seen, ids, requests, queue  ARGV: 指纹(''表示不去重), 请求描述
+_PUSH_SCRIPT = """
+if ARGV[1] ~= '' and redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return false
+end
+local id = redis.call('INCR', KEYS[2])
+redis.call('HSET', KEYS[3], id, ARGV[2])
+redis.call('ZADD', KEYS[4], 0, id)
+return id
+"""
+
+# KEYS: queue, requests  ARGV: lease秒数, 数量
+# score为0的是新请求，0 < score <= now的是租约已过期的请求；领取时score改为新的到期时间
+_LEASE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]))
+local result = {}
+for i = 1, #ids, 2 do
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ids[i])
+    result[#result + 1] = ids[i]
+    result[#result + 1] = redis.call('HGET', KEYS[2], ids[i]) or ''
+    result[#result + 1] = ids[i + 1]
+end
+return result
+"""
+
+# KEYS: queue  ARGV: lease秒数, id...   只续期还在队列中的请求(XX)
+_RENEW_SCRIPT = """
+local now = redis.call('TIME')
+local deadline = tonumber(now[1]) + tonumber(now[2]) / 1000000 + tonumber(ARGV[1])
+local renewed = 0
+for i = 2, #ARGV do
+    renewed = renewed + redis.call('ZADD', KEYS[1], 'XX', 'CH', deadline, ARGV[i])
+end
+return renewed
+"""
+
+# KEYS: queue, seen, ids, requests  队列为空(所有节点的请求都已确认)时才删除
+_CLEAR_SCRIPT = """
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+return 1
+"""
+
+
+class RedisFrontier(object):
+    """
+    Shared crawl frontier for several spider processes/hosts, backed by a Redis protocol compatible store
+    (1) <key>:queue  ZSET  请求id -> 0(等待领取) 或 租约到期时间；请求确认前一直留在这里，队列为空表示所有节点都已完成
+        <key>:requests HASH 请求id -> 请求描述(json，与SqliteFrontier相同)
+        <key>:seen   SET   请求指纹，所有节点共用的去重集合
+        <key>:ids    请求id计数器
+    (2) push/lease/renew都是Lua脚本，在Redis中原子执行；到期时间使用Redis服务器的TIME，不受各主机时钟误差影响
+    (3) 节点领取请求后定期renew()续期，处理完(子请求都已push)后ack()；节点退出后租约过期，请求由其他节点重新领取
+    """
+
+    def __init__(self, url: str = None, key: str = 'spider', lease_seconds: float = 60, client=None):
+        if client is None:
+            if aioredis is None:
+                raise ImportError('distributed mode requires redis: pip install redis')
+            client = aioredis.from_url(url)
+        self.url = url
+        self.client = client
+        self.key = key
+        self.lease_seconds = lease_seconds
+        self.keys = {name: f"{key}:{name}" for name in ('queue', 'requests', 'seen', 'ids')}
+        self._push = client.register_script(_PUSH_SCRIPT)
+        self._lease = client.register_script(_LEASE_SCRIPT)
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._clear = client.register_script(_CLEAR_SCRIPT)
+        self.counts = dict.fromkeys(('pushed', 'duplicates', 'leased', 'requeued', 'acked'), 0)
+
+    def _count(self, event: str, amount: int = 1):
+        self.counts[event] += amount
+        distributed_requests.inc(event, amount=amount)
+
+    async def push(self, descriptor: dict, fingerprint: bytes = None):
+        """保存一个请求描述，返回其id；指纹已在共用的去重集合中时返回None"""
+        request_id = await self._push(
+            keys=[self.keys['seen'], self.keys['ids'], self.keys['requests'], self.keys['queue']],
+            args=[fingerprint or b'', json.dumps(descriptor, ensure_ascii=False)],
+        )
+        if request_id is None:
+            self._count('duplicates')
+            return None
+        self._count('pushed')
+        return int(request_id)
+
+    async def push_request(self, descriptor: dict, dont_filter: bool = False):
+        fingerprint = None if dont_filter else RequestDupeFilter.fingerprint(descriptor['method'], descriptor['url'], descriptor.get('form_data'))
+        return await self.push(descriptor, fingerprint)
+
+    async def lease(self, count: int) -> List[Tuple[int, dict]]:
+        """领取最多count个请求，返回[(id, 请求描述)]；请求描述为None时表示该请求已不存在，直接ack()"""
+        if count <= 0:
+            return []
+        result = await self._lease(keys=[self.keys['queue'], self.keys['requests']], args=[self.lease_seconds, count])
+        leased = []
+        for i in range(0, len(result), 3):
+            request_id, descriptor, score = result[i:i + 3]
+            if float(score) > 0:
+                self._count('requeued')         # 其他节点领取后没有确认，租约已过期
+            leased.append((int(request_id), json.loads(descriptor) if descriptor else None))
+        self._count('leased', len(leased))
+        return leased
+
+    async def renew(self, request_ids: Iterable[int]) -> int:
+        """延长本节点仍在处理的请求的租约"""
+        request_ids = list(request_ids)
+        if not request_ids:
+            return 0
+        return await self._renew(keys=[self.keys['queue']], args=[self.lease_seconds] + request_ids)
+
+    async def ack(self, request_id: int):
+        if request_id is None:
+            return
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.keys['queue'], request_id)
+            pipe.hdel(self.keys['requests'], request_id)
+            await pipe.execute()
+        self._count('acked')
+
+    async def pending_counts(self) -> int:
+        """所有节点还没有确认的请求数，包括等待领取的和已被领取的"""
+        return await self.client.zcard(self.keys['queue'])
+
+    async def clear(self) -> bool:
+        """所有请求都已确认时删除去重集合等，下次重新开始；还有其他节点的请求时返回False"""
+        return bool(await self._clear(keys=[self.keys['queue'], self.keys['seen'], self.keys['ids'], self.keys['requests']]))
+
+    async def close(self, clear: bool = False):
+        if clear:
+            await self.clear()
+        print('分布式模式: 新请求 %(pushed)s 重复 %(duplicates)s 领取 %(leased)s 过期重新领取 %(requeued)s 确认 %(acked)s' % self.counts)
+        await (self.client.aclose() if hasattr(self.client, 'aclose') else self.client.close())     # redis-py 5.0.1起为aclose()
+
+    def __repr__(self):
+        return f"<RedisFrontier {self.key} lease: {self.lease_seconds}s>"
+
+
+async def _demo_frontier(total: int = 20000, nodes: int = 4, batch: int = 50):
+    """
+    用fakeredis模拟多个节点: 其中一个节点领取一批请求后退出(不确认)，租约过期后由其他节点重新领取
+    python -m myspiders.base.redis_frontier [redis://...]  不指定url时使用fakeredis
+    """
+    import asyncio
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        make_client = lambda: aioredis.from_url(sys.argv[1])
+    else:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        make_client = lambda: fakeredis.FakeAsyncRedis(server=server)
+
+    seed = RedisFrontier(key='demo', client=make_client())
+    await seed.client.delete(*seed.keys.values())
+    begin = time.perf_counter()
+    for i in range(total):
+        await seed.push_request({'url': 'http://example.com/%s' % (i % (total // 2)), 'method': 'GET', 'callback': 'parse'})
+    push_elapsed = time.perf_counter() - begin
+
+    crashed = RedisFrontier(key='demo', lease_seconds=1, client=make_client())
+    lost = await crashed.lease(batch)          # 领取后不确认，模拟节点退出
+    done = {}
+
+    async def node(name: int):
+        frontier = RedisFrontier(key='demo', lease_seconds=1, client=make_client())
+        done[name] = 0
+        while True:
+            leased = await frontier.lease(batch)
+            if not leased:
+                if not await frontier.pending_counts():
+                    break
+                await asyncio.sleep(0.2)
+                continue
+            for request_id, descriptor in leased:
+                await frontier.ack(request_id)
+                done[name] += 1
+        await frontier.close()
+
+    begin = time.perf_counter()
+    await asyncio.gather(*[node(i) for i in range(nodes)])
+    elapsed = time.perf_counter() - begin
+    print('push: %.0f 个/秒 (%s个，去重后%s个)  %s个节点领取+确认: %.0f 个/秒  每个节点: %s  退出节点未确认的%s个已重新领取' % (
+        total / push_elapsed, total, seed.counts['pushed'], nodes, sum(done.values()) / elapsed, done, len(lost)))
+    await crashed.close()
+    await seed.close(clear=True)
+
+
+if __name__ == '__main__':
+    import asyncio
+    asyncio.run(_demo_frontier())
@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 # Request类中，通过构造方法实例化后，添加了form_data的实例属性, 用来实现Spider的POST请求
 import asyncio
+import time
 import weakref
 import aiohttp
 import async_timeout
 from inspect import iscoroutinefunction
 from types import AsyncGeneratorType
 from typing import Coroutine, Optional, Tuple
+from urllib.parse import urlparse
 from asyncio.locks import Semaphore
+from lxml import etree
 
 try:
     import uvloop
@@ -15,10 +18,16 @@ try:
 except ImportError:
     pass
 
-from .exceptions import InvalidRequestMethod
+from .exceptions import InvalidRequestMethod, InvalidResponseBody
 from .response import Response
+from .scheduler import HostScheduler
+from .cache import HttpCache
+from .encoding import encoding_detector, normalize_encoding
+from . import metrics
+from .profiler import profiler
 from config import Logger
-from .tools import get_random_user_agent
+from .session import make_connector, session_pool
+from .tools import user_agent_pool, is_binary_url, is_binary_content_type
 
 
 class Request(object):
@@ -31,6 +40,12 @@ class Request(object):
     """
 
     name = "Request"
+    # 每个请求都会创建一个Request, 用__slots__代替__dict__; logger为类属性, 不再每个实例添加一次handler
+    __slots__ = (
+        'url', 'method', 'callback', 'encoding', 'headers', 'metadata', 'request_config', 'request_session', 'form_data',
+        'ssl', 'aiohttp_kwargs', 'scheduler', 'cache_entry', 'cache_loaded', 'frontier_id', 'retry_times', 'close_request_session', '__weakref__',
+    )
+    logger = Logger(level='warning', name=__name__).logger
 
     # Default config
     REQUEST_CONFIG = {
@@ -40,6 +55,11 @@ class Request(object):
         "TIMEOUT": 10,
         "RETRY_FUNC": Coroutine,
         "VALID": Coroutine,
+        "CACHE": None,              # HttpCache实例, 为None时不使用缓存
+        "CACHE_TTL": None,          # 覆盖HttpCache.ttl, 由Target(cache_ttl=...)设置
+        "STREAM": False,            # 分块读取响应，跳过二进制内容，超过MAX_BODY_SIZE时放弃
+        "MAX_BODY_SIZE": 10 * 1024 * 1024,
+        "CHUNK_SIZE": 64 * 1024,
     }
 
     METHOD = ["GET", "POST"]
@@ -84,52 +104,91 @@ class Request(object):
             self.REQUEST_CONFIG if request_config is None else request_config
         )
         self.request_session = request_session
+        self.close_request_session = False
         # 自己增加的属性，用于传递POST请求的form_data参数
         self.form_data = form_data
 
         self.ssl = aiohttp_kwargs.pop("ssl", False)
         self.aiohttp_kwargs = aiohttp_kwargs
 
-        self.close_request_session = False
-        self.logger = Logger(level='warning').logger
+        self.scheduler = None
+        self.cache_entry = None
+        self.cache_loaded = False
+        self.frontier_id = None         # SqliteFrontier/RedisFrontier中的id
         self.retry_times = self.request_config.get("RETRIES", 3)
 
     @property
     def current_request_session(self):
+        # 没有传入session时: spider运行中(session_pool有使用者)使用当前event loop共用的session；
+        # 单独使用Request/Item.get_item(url=...)时没有谁负责关闭共用的session，与以前一样单独创建，fetch()结束时关闭
         if self.request_session is None:
-            self.request_session = aiohttp.ClientSession()
-            self.close_request_session = True
+            if session_pool.in_use():
+                self.request_session = session_pool.get()
+            else:
+                self.request_session = aiohttp.ClientSession(connector=make_connector())
+                self.close_request_session = True
         return self.request_session
 
     async def fetch(self, delay=True) -> Response:
         """Fetch all the information by using aiohttp"""
+        cache: HttpCache = self.request_config.get("CACHE")
+        response = await self.fetch_cache()
+        if response is not None:
+            return response
+        if self.cache_entry is not None:
+            self.headers.update(cache.validators(self.cache_entry))
+
+        stream = self.request_config.get("STREAM", False)
+        if stream and is_binary_url(self.url):
+            self.logger.warning(f"<Skip binary url: {self.url}>")
+            return self._failed_response()
+
         if delay and self.request_config.get("DELAY", 0) > 0:
             await asyncio.sleep(self.request_config["DELAY"])
 
         timeout = self.request_config.get("TIMEOUT", 10)
+        start_time = time.monotonic()
+        resp = None
         try:
             async with async_timeout.timeout(timeout):
                 # 用于真正发起request请求
                 resp = await self._make_request()
-            try:
-                resp_data = await resp.text(encoding=self.encoding)
-            except UnicodeDecodeError:
-                resp_data = await resp.read()
+            latency = time.monotonic() - start_time
+            if self.scheduler is not None:
+                self.scheduler.feedback(self.url, status=resp.status, latency=latency)
+            host = urlparse(self.url).netloc
+            metrics.request_latency.observe(latency, host)
+            if stream:
+                body, html_etree, parser_encoding = await self._read_stream(resp)
+            else:
+                body, html_etree, parser_encoding = await resp.read(), None, None
+            metrics.response_bytes.inc(host, amount=len(body))
+            # 编码优先级: Request的encoding > BOM > 响应头charset > <meta>声明 > 同一host上次的编码 > cchardet
+            # 回调中response.html总是str，原始内容可以通过await response.read()取得
+            resp_data, encoding = encoding_detector.decode(body, encoding=self.encoding, charset=resp.charset, host=host)
 
             response = Response(
                 url=self.url,
                 method=self.method,
-                encoding=resp.get_encoding(),
+                encoding=encoding,
                 html=resp_data,
                 metadata=self.metadata,
                 cookies=resp.cookies,
                 headers=resp.headers,
                 history=resp.history,
                 status=resp.status,
-                aws_json=resp.json,
-                aws_text=resp.text,
-                aws_read=resp.read,
+                body=body,
             )
+            # 边下载边解析时用的是响应头的charset；最终编码不同(BOM、<meta>、host缓存)时该etree是乱码，由lxml重新解析response.html
+            if html_etree is not None and parser_encoding == encoding:
+                response.html_etree = html_etree
+            if cache is not None:
+                if resp.status == 304 and self.cache_entry is not None:
+                    # 服务器确认内容没有变化，继续使用缓存
+                    await cache.refresh(self.method, self.url, self.form_data, entry=self.cache_entry)
+                    return self._cache_response(self.cache_entry)
+                if response.ok:
+                    self.cache_entry = await cache.store(self.method, self.url, self.form_data, body=body, status=resp.status, encoding=encoding, headers=resp.headers)
             # Retry middleware
             aws_valid_response = self.request_config.get("VALID")
             if aws_valid_response and iscoroutinefunction(aws_valid_response):
@@ -137,30 +196,136 @@ class Request(object):
             if response.ok:
                 return response
             else:
-                return await self._retry(error_msg=f"Request url failed with status {response.status}!")
+                return await self._retry(error_msg=f"Request url failed with status {response.status}!", reason=f"status_{response.status}")
+        except InvalidResponseBody as e:
+            # 二进制或过大的内容，重试也没有意义
+            self.logger.warning(f"<Skip response: {self.url} {e}>")
+            resp.close()
+            return self._failed_response(status=resp.status)
         except asyncio.TimeoutError:
-            return await self._retry(error_msg="timeout")
+            if self.scheduler is not None:
+                self.scheduler.feedback(self.url, status=None, latency=time.monotonic() - start_time)
+            return await self._retry(error_msg="timeout", reason="timeout")
         except Exception as e:
-            return await self._retry(error_msg=e)
+            if self.scheduler is not None and resp is None:
+                self.scheduler.feedback(self.url, status=None, latency=time.monotonic() - start_time)
+            return await self._retry(error_msg=e, reason=type(e).__name__)
         finally:
             await self._close_request()
 
-    async def fetch_callback(self, sem: Semaphore) -> Tuple[AsyncGeneratorType, Response]:
+    async def _read_stream(self, resp) -> Tuple[bytes, Optional[etree._Element], Optional[str]]:
+        """
+        分块读取响应内容，超过MAX_BODY_SIZE或者是二进制内容时抛出InvalidResponseBody
+        响应头中有charset的html页面，边下载边用lxml解析，下载完成时html_etree也已经生成
+        返回(body, html_etree, 解析html_etree时使用的编码)
+        """
+        max_size = self.request_config.get("MAX_BODY_SIZE", self.REQUEST_CONFIG["MAX_BODY_SIZE"])
+        chunk_size = self.request_config.get("CHUNK_SIZE", self.REQUEST_CONFIG["CHUNK_SIZE"])
+        if is_binary_content_type(resp.content_type):
+            raise InvalidResponseBody(f"binary content type {resp.content_type}")
+        if max_size and resp.content_length and resp.content_length > max_size:
+            raise InvalidResponseBody(f"content length {resp.content_length} > {max_size}")
+
+        # 与EncodingDetector使用相同的编码名称(gbk -> gb18030等)，fetch()据此判断html_etree是否可以直接使用
+        charset = normalize_encoding(self.encoding or resp.charset)
+        parser = None
+        if charset and 'html' in resp.content_type:
+            try:
+                parser = etree.HTMLParser(encoding=charset)
+            except LookupError:
+                parser = None
+        chunks, size = [], 0
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise InvalidResponseBody(f"body size > {max_size}")
+            chunks.append(chunk)
+            if parser is not None:
+                try:
+                    parser.feed(chunk)
+                except etree.LxmlError:
+                    parser = None       # libxml2不支持该编码等，由Response重新解析
+
+        html_etree = None
+        if parser is not None and size:
+            try:
+                html_etree = parser.close()
+            except etree.LxmlError:
+                html_etree = None
+        return b''.join(chunks), html_etree, charset
+
+    def _failed_response(self, status: int = -1) -> Response:
+        response = Response(url=self.url, method=self.method, metadata=self.metadata, cookies={}, history=(), headers=None, status=status)
+        response.ok = False
+        return response
+
+    async def fetch_cache(self) -> Optional[Response]:
+        """
+        命中未过期的缓存，或者处于离线模式时，不访问网络直接返回Response；否则返回None
+        """
+        cache: HttpCache = self.request_config.get("CACHE")
+        if cache is None:
+            return None
+        if not self.cache_loaded:
+            self.cache_entry = await cache.load(self.method, self.url, self.form_data)
+            self.cache_loaded = True
+        if self.cache_entry is not None:
+            if cache.offline or cache.is_fresh(self.cache_entry, self.request_config.get("CACHE_TTL")):
+                return self._cache_response(self.cache_entry)
+        elif cache.offline:
+            self.logger.error(f"<Offline cache miss: {self.url}>")
+            return Response(url=self.url, method=self.method, metadata=self.metadata, cookies={}, history=(), headers=None)
+        return None
+
+    def _cache_response(self, entry: dict) -> Response:
+        html, encoding = encoding_detector.decode(entry['body'], encoding=self.encoding, charset=entry['encoding'], host=urlparse(self.url).netloc)
+        return Response(
+            url=self.url,
+            method=self.method,
+            encoding=encoding,
+            html=html,
+            body=entry['body'],
+            metadata=self.metadata,
+            cookies={},
+            headers=entry['headers'],
+            history=(),
+            status=entry['status'],
+        )
+
+    async def fetch_callback(self, sem: Semaphore = None, scheduler: HostScheduler = None) -> Tuple[AsyncGeneratorType, Response]:
         """
         Request the target url and then call the callback function
         :param sem: Semaphore
+        :param scheduler: HostScheduler, 按host控制并发和速率, 传入时优先于sem
         :return: Tuple[AsyncGeneratorType, Response]
         """
         try:
-            async with sem:
-                response = await self.fetch()
+            response = await self.fetch_cache()                 # 命中缓存时不占用并发名额
+            if response is None:
+                if scheduler is not None:
+                    self.scheduler = scheduler
+                    async with scheduler.slot(self.url):
+                        response = await self.fetch()
+                elif sem is not None:
+                    async with sem:
+                        response = await self.fetch()
+                else:
+                    response = await self.fetch()
         except Exception as e:
             response = None
             self.logger.error(f"<Error: {self.url} {e}>")
 
         if self.callback is not None:
             if iscoroutinefunction(self.callback):
-                callback_result = await self.callback(response)
+                # 异步生成器回调的用时在Spider._process_async_callback中统计，这里只统计普通协程回调
+                callback_name = self.callback.__qualname__
+                begin = time.perf_counter()
+                if profiler.enabled:
+                    with profiler.stage('callback:' + callback_name):
+                        callback_result = await self.callback(response)
+                else:
+                    callback_result = await self.callback(response)
+                metrics.callback_seconds.observe(time.perf_counter() - begin, callback_name)
             else:
                 callback_result = self.callback(response)
         else:
@@ -170,13 +335,15 @@ class Request(object):
 
     async def _close_request(self):
         if self.close_request_session:
-            await self.request_session.close()
+            self.close_request_session = False
+            session, self.request_session = self.request_session, None
+            await session.close()
 
     # ！！用于真正的发起request请求
     async def _make_request(self):
         """Make a request by using aiohttp"""
         self.logger.info(f"<{self.method}: {self.url}>")
-        user_agent = await get_random_user_agent()
+        user_agent = user_agent_pool.choice(host=urlparse(self.url).netloc)
         self.headers.update({'User-Agent': user_agent})
         if self.method == "GET":
             request_func = self.current_request_session.get(self.url, headers=self.headers, ssl=self.ssl, **self.aiohttp_kwargs)
@@ -185,12 +352,15 @@ class Request(object):
         resp = await request_func
         return resp
 
-    async def _retry(self, error_msg):
+    async def _retry(self, error_msg, reason: str = "error"):
         """Manage request"""
         if self.retry_times > 0:
+            metrics.retries.inc(reason)
             # Sleep to give server a chance to process/cache prior request
             if self.request_config.get("RETRY_DELAY", 0) > 0:
                 await asyncio.sleep(self.request_config["RETRY_DELAY"])
+            if self.scheduler is not None:
+                await self.scheduler.wait(self.url)
 
             retry_times = self.request_config.get("RETRIES", 3) - self.retry_times + 1
             self.logger.error(f"<Retry url: {self.url}>, Retry times: {retry_times}, Retry message: {error_msg}>")
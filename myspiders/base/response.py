@@ -2,6 +2,7 @@ import json
 from typing import Any, Callable, Optional
 from http.cookies import SimpleCookie
 from lxml import etree
+from bs4 import BeautifulSoup
 
 DEFAULT_JSON_DECODER = json.loads
 JSONDecoder = Callable[[str], Any]
@@ -12,6 +13,11 @@ class Response(object):
     Return a friendly response
     """
 
+    __slots__ = (
+        '_callback_result', '_encoding', '_url', '_method', '_metadata', '_html', '_index', '_cookies', '_history', '_headers',
+        '_status', '_ok', '_soup', '_html_etree', '_body', '_aws_json', '_aws_read', '_aws_text', '__weakref__',
+    )
+
     def __init__(
         self,
         url: str,
@@ -24,6 +30,7 @@ class Response(object):
         history,
         headers,
         status: int = -1,
+        body: bytes = None,
         aws_json: Callable = None,
         aws_read: Callable = None,
         aws_text: Callable = None,
@@ -41,6 +48,12 @@ class Response(object):
         self._status = status
         self._ok = self._status == 0 or 200 <= self._status <= 299
 
+        # 解析后的文档缓存，同一个页面只解析一次，供各个Field和Item重复使用
+        self._soup = None
+        self._html_etree = None
+        # 解码前的原始内容，html为解码后的str
+        self._body = body
+
         self._aws_json = aws_json
         self._aws_read = aws_read
         self._aws_text = aws_text
@@ -89,6 +102,12 @@ class Response(object):
     def html(self):
         return self._html
 
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = self._html if isinstance(self._html, bytes) else self._html.encode(self._encoding or 'utf-8')
+        return self._body
+
     @property
     def cookies(self) -> dict:
         if isinstance(self._cookies, SimpleCookie):
@@ -113,21 +132,39 @@ class Response(object):
 
     @property
     def html_etree(self):
-        html_etree = None
-        if self.html:
-            html_etree = etree.HTML(self.html)
-        return html_etree
+        if self._html_etree is None and self.html:
+            self._html_etree = etree.HTML(self.html)
+        return self._html_etree
+
+    @html_etree.setter
+    def html_etree(self, value):
+        # STREAM模式下边下载边解析得到的etree
+        self._html_etree = value
+
+    @property
+    def soup(self):
+        if self._soup is None and self.html:
+            self._soup = BeautifulSoup(self.html, 'lxml')
+        return self._soup
 
     async def json(self, *, encoding: str = None, loads: JSONDecoder = DEFAULT_JSON_DECODER, content_type: Optional[str] = "application/json",) -> Any:
         """Read and decodes JSON response."""
+        if self._aws_json is None:                  # 来自缓存的Response没有aiohttp的响应对象
+            return loads(await self.text(encoding=encoding))
         return await self._aws_json(encoding=encoding, loads=loads, content_type=content_type)
 
     async def read(self) -> bytes:
         """Read response payload."""
+        if self._aws_read is None:
+            return self.body
         return await self._aws_read()
 
     async def text(self, *, encoding: Optional[str] = None, errors: str = "strict") -> str:
         """Read response payload and decode."""
+        if self._aws_text is None:
+            if isinstance(self._html, bytes) or (encoding and encoding != self._encoding and self._body is not None):
+                return self.body.decode(encoding or self._encoding or 'utf-8', errors)
+            return self._html
         return await self._aws_text(encoding=encoding, errors=errors)
 
     def __repr__(self):
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# 按host(netloc)分别控制并发和请求速率，替代Spider中全局的asyncio.Semaphore
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+
+class _HostState(object):
+    """
+    单个host的调度状态
+    sem: 该host的并发上限
+    tokens: 令牌桶中剩余的令牌数，按rate匀速补充，最多burst个
+    delay: 自适应的额外间隔，遇到429/5xx或响应变慢时增加，正常响应时逐步回落
+    """
+
+    def __init__(self, per_host: int, rate: float, burst: int):
+        self.sem = asyncio.Semaphore(per_host)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.delay = 0.0
+        self.latency = None             # 响应时间的指数移动平均
+        self.baseline = None            # 该host最快时的响应时间，作为判断变慢的基准
+        self.lock = asyncio.Lock()
+
+
+class HostScheduler(object):
+    """
+    Host-aware scheduler for Request.fetch_callback
+    (1) 全局并发上限 concurrency，与原来的Spider.sem一致
+    (2) 每个host的并发上限 PER_HOST
+    (3) 每个host的令牌桶限速 RATE(每秒请求数) / BURST(允许的突发请求数)，RATE为0时不限速
+    (4) 遇到429/5xx、超时，或响应时间超过基准的LATENCY_FACTOR倍时，加大该host的请求间隔
+        基准低于LATENCY_FLOOR时按LATENCY_FLOOR计算，避免个别极快的响应把基准压得过低
+    """
+
+    # Default config
+    SCHEDULER_CONFIG = {
+        "PER_HOST": 3,
+        "RATE": 10.0,
+        "BURST": 10,
+        "MIN_DELAY": 0.5,
+        "MAX_DELAY": 30,
+        "BACKOFF": 2.0,
+        "RECOVER": 0.8,
+        "LATENCY_FACTOR": 3.0,
+        "LATENCY_FLOOR": 0.1,
+    }
+
+    def __init__(self, concurrency: int = 3, scheduler_config: dict = None):
+        self.config = dict(self.SCHEDULER_CONFIG)
+        self.config.update(scheduler_config or {})
+        self.sem = asyncio.Semaphore(concurrency)
+        self.hosts = {}
+
+    def _get_host(self, url: str) -> _HostState:
+        host = urlparse(url).netloc
+        state = self.hosts.get(host)
+        if state is None:
+            state = _HostState(per_host=self.config["PER_HOST"], rate=self.config["RATE"], burst=self.config["BURST"])
+            self.hosts[host] = state
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        先占用host的并发名额并等待令牌，再占用全局名额；
+        这样慢host排队时不会占住全局名额，其他host的请求不受影响
+        """
+        state = self._get_host(url)
+        async with state.sem:
+            await self.wait(url)
+            async with self.sem:
+                yield state
+
+    async def wait(self, url: str):
+        """按令牌桶和自适应间隔等待，重试之前也会调用"""
+        state = self._get_host(url)
+        async with state.lock:
+            if state.delay > 0:
+                await asyncio.sleep(state.delay)
+            if state.rate <= 0:
+                return
+            while True:
+                now = time.monotonic()
+                state.tokens = min(state.burst, state.tokens + (now - state.updated) * state.rate)
+                state.updated = now
+                if state.tokens >= 1:
+                    state.tokens -= 1
+                    return
+                await asyncio.sleep((1 - state.tokens) / state.rate)
+
+    def feedback(self, url: str, status: int = None, latency: float = None):
+        """
+        每次请求结束后回报结果，status为None表示超时或连接错误
+        """
+        state = self._get_host(url)
+        slow_down = status is None or status == 429 or status >= 500
+
+        if latency is not None:
+            state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+            if state.baseline is None or latency < state.baseline:
+                state.baseline = latency
+            if state.latency > max(state.baseline, self.config["LATENCY_FLOOR"]) * self.config["LATENCY_FACTOR"]:
+                slow_down = True
+
+        if slow_down:
+            state.delay = min(self.config["MAX_DELAY"], max(self.config["MIN_DELAY"], state.delay * self.config["BACKOFF"]))
+        elif state.delay > 0:
+            state.delay *= self.config["RECOVER"]
+            if state.delay < self.config["MIN_DELAY"]:
+                state.delay = 0.0
+
+    def __repr__(self):
+        return f"<HostScheduler hosts: {len(self.hosts)}>"
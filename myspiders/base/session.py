@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# 同一个event loop中所有spider、Request、Item共用的aiohttp.ClientSession
+import asyncio
+
+import aiohttp
+
+from config import Config
+
+
+SESSION = Config.SESSION_DICT
+
+
+def make_connector() -> aiohttp.TCPConnector:
+    """按Config.SESSION_DICT创建连接池: 总连接数、每个host的连接数、DNS缓存、keep-alive"""
+    return aiohttp.TCPConnector(
+        limit=SESSION['limit'],
+        limit_per_host=SESSION['limit_per_host'],
+        use_dns_cache=SESSION['ttl_dns_cache'] != 0,
+        ttl_dns_cache=SESSION['ttl_dns_cache'] or None,
+        keepalive_timeout=SESSION['keepalive_timeout'],
+        force_close=SESSION['force_close'],
+        enable_cleanup_closed=SESSION['enable_cleanup_closed'],
+    )
+
+
+class SessionPool(object):
+    """
+    Shared ClientSession per event loop
+    (1) ClientSession和event loop绑定，每个loop只创建一个，第一次get()时才创建
+    (2) spider_console同时运行多个spider时，所有spider共用同一个连接池，keep-alive的连接可以复用
+    (3) spider通过acquire()/release()记录使用者数量，最后一个使用者release()时关闭session
+        没有使用者时(单独使用Request/Item.get_item(url=...))，Request自己创建session并在fetch()结束时关闭
+    HTTP/2: aiohttp只支持HTTP/1.1，这里没有提供HTTP/2的实现
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.users = {}
+
+    @staticmethod
+    def _loop(loop=None):
+        return loop or asyncio.get_event_loop()
+
+    def get(self, loop=None) -> aiohttp.ClientSession:
+        loop = self._loop(loop)
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            session = self.sessions[loop] = aiohttp.ClientSession(connector=make_connector())
+        return session
+
+    def acquire(self, loop=None):
+        loop = self._loop(loop)
+        self.users[loop] = self.users.get(loop, 0) + 1
+
+    def in_use(self, loop=None) -> bool:
+        """是否有spider等使用者acquire()了该loop的session"""
+        return self.users.get(self._loop(loop), 0) > 0
+
+    async def release(self, loop=None):
+        loop = self._loop(loop)
+        self.users[loop] = self.users.get(loop, 0) - 1
+        if self.users[loop] <= 0:
+            await self.close(loop)
+
+    async def close(self, loop=None):
+        loop = self._loop(loop)
+        self.users.pop(loop, None)
+        session = self.sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def __repr__(self):
+        return f"<SessionPool sessions: {len(self.sessions)}>"
+
+
+session_pool = SessionPool()
@@ -1,5 +1,6 @@
 import asyncio
 import collections
+import os
 import typing
 import weakref
 import time
@@ -8,9 +9,8 @@ from functools import reduce
 from inspect import isawaitable
 from signal import SIGINT, SIGTERM
 from types import AsyncGeneratorType
-from aiohttp import ClientSession
-from database import MongoDatabase
-from config import Logger, Vocabulary
+from database import IncrementalIndex, MongoDatabase, MongoItemSink
+from config import Config, Logger, Vocabulary
 from .exceptions import (
     InvalidCallbackResult,
     NotImplementedParseError,
@@ -19,6 +19,15 @@ from .exceptions import (
 from .item import Item
 from .request import Request
 from .response import Response
+from .scheduler import HostScheduler
+from .cache import HttpCache
+from .dupefilter import RequestDupeFilter
+from .frontier import SqliteFrontier, dump_metadata, load_metadata
+from .redis_frontier import RedisFrontier
+from .parse_executor import ParseExecutor
+from . import metrics
+from .profiler import profiler
+from .session import session_pool
 
 
 try:
@@ -31,7 +40,7 @@ except ImportError:
 class SpiderHook:
 
     callback_result_map: dict = None
-    logger = Logger(level='warning').logger
+    logger = Logger(level='warning', name=__name__).logger
 
     async def _run_spider_hook(self, hook_func):
         if callable(hook_func):
@@ -64,7 +73,7 @@ class SpiderHook:
 class Spider(SpiderHook):
     name = None
     request_config = None
-    # request_session = None
+    scheduler_config = None
 
     headers: dict = None
     metadata: dict = None
@@ -73,10 +82,10 @@ class Spider(SpiderHook):
     failed_counts: int = 0
     success_counts: int = 0
 
-    worker_numbers: int = 2
+    worker_numbers: int = 6
     concurrency: int = 3
+    queue_maxsize: int = 1000
 
-    worker_tasks: list = []
     targets: list = []
 
     pattern_date = '20[0-9]{2}[-年/][01]?[0-9][-月/][0123]?[0-9]日?'
@@ -91,6 +100,7 @@ class Spider(SpiderHook):
             loop=None,
             is_async_start: bool = False,
             cancel_tasks: bool = True,
+            concurrency: int = None,
             **kwargs,
     ):
         if name is not None:
@@ -105,10 +115,16 @@ class Spider(SpiderHook):
         if not isinstance(self.start_urls, typing.Iterable):
             raise ValueError("start_urls must be collections.Iterable")
 
+        if concurrency is not None:         # spider_console同时运行多个spider时，按总并发数分配给每个spider
+            self.concurrency = concurrency
+
         self.loop = loop
         asyncio.set_event_loop(self.loop)
-        self.request_queue = asyncio.Queue()
-        self.sem = asyncio.Semaphore(self.concurrency)
+        self.request_queue = asyncio.Queue(maxsize=self.queue_maxsize)
+        self.workers = []
+        # 按host控制并发和速率，全局并发上限仍为concurrency；self.sem保留给Item.get_item(sem=...)等直接使用
+        self.scheduler = HostScheduler(concurrency=self.concurrency, scheduler_config=self.scheduler_config)
+        self.sem = self.scheduler.sem
 
         # Init object-level properties  SpiderHook的类属性
         self.callback_result_map = self.callback_result_map or {}
@@ -117,38 +133,98 @@ class Spider(SpiderHook):
         self.metadata = self.metadata or {}
         self.kwargs = self.kwargs or {}
         self.request_config = self.request_config or {}
-        self.request_session = ClientSession()
+        # 同一个event loop中的spider共用一个ClientSession(连接池)，第一次发起请求时才创建
+        session_pool.acquire(self.loop)
+        # 磁盘HTTP缓存, 由Config.HTTP_CACHE_DICT['enable']开启
+        http_cache = Config.HTTP_CACHE_DICT
+        self.http_cache = HttpCache(http_cache['cache_dir'], ttl=http_cache['ttl'], offline=http_cache['offline']) if http_cache['enable'] else None
+        # 请求去重, 由Config.DUPEFILTER_DICT['enable']开启; persist时按spider名称保存指纹
+        dupefilter = Config.DUPEFILTER_DICT
+        self.dupefilter = RequestDupeFilter(
+            mode=dupefilter['mode'],
+            capacity=dupefilter['capacity'],
+            error_rate=dupefilter['error_rate'],
+            path=os.path.join(dupefilter['dir'], f"{self.name or type(self).__name__}.{dupefilter['mode']}") if dupefilter['persist'] else None,
+        ) if dupefilter['enable'] else None
+        # 分布式模式, 由Config.DISTRIBUTED_DICT['enable']开启; 多个进程/主机从Redis中领取请求, 请求已保存在Redis中, 不再使用SqliteFrontier
+        distributed = Config.DISTRIBUTED_DICT
+        self.distributed = RedisFrontier(
+            distributed['url'],
+            key=f"{distributed['key_prefix']}:{self.name or type(self).__name__}",
+            lease_seconds=distributed['lease_seconds'],
+        ) if distributed['enable'] else None
+        self.leases = set()             # 本节点已领取、还没有确认的请求id
+        self.lease_released = asyncio.Event()
+        # 持久化待爬取请求, 由Config.FRONTIER_DICT['enable']开启; 中断后再次启动时从未完成的请求继续
+        frontier = Config.FRONTIER_DICT
+        self.frontier = SqliteFrontier(
+            os.path.join(frontier['dir'], f"{self.name or type(self).__name__}.sqlite3"),
+            batch_size=frontier['batch_size'],
+            flush_interval=frontier['flush_interval'],
+        ) if frontier['enable'] and self.distributed is None else None
+        # 解析网页的进程池, 由Config.PARSE_EXECUTOR_DICT['workers']设置, 回调中通过await self.parse_executor.extract(plan, html)使用
+        self.parse_executor = ParseExecutor(workers=Config.PARSE_EXECUTOR_DICT['workers'])
         self.cancel_tasks = cancel_tasks
         self.is_async_start = is_async_start
 
-        # Mongo数据库
-        self.mongo = MongoDatabase()
+        # Mongo数据库, 同一进程内的spider共用一个MongoClient
+        self.mongo = MongoDatabase().acquire()
         mongo_db = self.mongo.db()
         self.collection = mongo_db['english_dict']
+        # 增量模式, 由Config.INCREMENTAL_DICT['enable']开启; 回调中用self.incremental跳过没有变化的页面和单词
+        incremental = Config.INCREMENTAL_DICT
+        self.incremental = IncrementalIndex(self.collection, mongo_db[incremental['pages_collection']]) if incremental['enable'] else None
+        self.item_sink = MongoItemSink(
+            self.collection,
+            mode='set' if self.incremental is not None else 'insert',
+            insert_only=incremental['insert_only'],
+            on_written=self.incremental.words_written if self.incremental is not None else None,
+        )
+
+    @property
+    def request_session(self):
+        return session_pool.get(self.loop)
 
     # 重要！处理异步回调函数的方法，在start_worker()方法中，启动该方法
     # 从返回结果callback_results中迭代每一个返回结果callback_result, 根据其不同的类别，套用不同的执行方法
     async def _process_async_callback(self, callback_results: AsyncGeneratorType, response: Response = None):
+        # 只统计回调函数本身的用时(两次yield之间), 不包括处理其yield结果的时间
+        callback_name = getattr(callback_results, '__qualname__', type(callback_results).__name__)
+        callback_elapsed, begin = 0.0, time.perf_counter()
+        if profiler.enabled:
+            callback_results = profiler.iter_async(callback_results, 'callback:' + callback_name)
         try:
             async for callback_result in callback_results:
+                callback_elapsed += time.perf_counter() - begin
                 if isinstance(callback_result, AsyncGeneratorType):
                     await self._process_async_callback(callback_result)
                 elif isinstance(callback_result, Request):
-                    self.request_queue.put_nowait(self.handle_request(request=callback_result))
+                    if self.dupefilter is not None and self.dupefilter.request_seen(callback_result):
+                        self.logger.info(f"<Duplicate request: {callback_result.url}>")
+                        continue
+                    if self.distributed is not None and await self._distribute_request(callback_result):
+                        continue
+                    self._persist_request(callback_result)
+                    await self._enqueue(self.handle_request(request=callback_result), callback_result)
                 elif isinstance(callback_result, typing.Coroutine):
-                    self.request_queue.put_nowait(self.handle_callback(aws_callback=callback_result, response=response))
+                    await self._enqueue(self.handle_callback(aws_callback=callback_result, response=response))
                 elif isinstance(callback_result, Item):
                     await self.process_item(callback_result)
                 else:
                     await self.process_callback_result(callback_result=callback_result)
+                begin = time.perf_counter()
+            callback_elapsed += time.perf_counter() - begin
         except NothingMatchedError as e:
             error_info = f"<Field: {str(e).lower()}" + f", error url: {response.url}>"
             self.logger.error(error_info)
         except Exception as e:
             self.logger.error(e)
+        finally:
+            metrics.callback_seconds.observe(callback_elapsed, callback_name)
 
     async def _process_response(self, request: Request, response: Response):
         if response:
+            metrics.responses.inc(self.name, 'success' if response.ok else 'failed')
             if response.ok:
                 self.success_counts += 1
                 await self.process_succeed_response(request, response)
@@ -167,18 +243,84 @@ class Spider(SpiderHook):
             except NotImplementedError:
                 pass
 
+        # 统计指标: 输出前采样队列长度和写入数量; 按Config.METRICS_DICT启动HTTP接口和定时汇总
+        metrics_config = Config.METRICS_DICT
+        metrics.registry.add_collector(self._collect_metrics)
+        items_rate = metrics.RateMeter()               # 结束时输出整个运行期间的平均写入速度
+        reporter = asyncio.ensure_future(self._report_metrics(metrics_config['log_interval'])) if metrics_config['log_interval'] else None
+
+        # 阶段用时统计, 由Config.PROFILER_DICT['enable']开启
+        profiler_config = Config.PROFILER_DICT
+        if profiler_config['enable']:
+            profiler.start(tool=profiler_config['tool'])
+            profiler.patch_instance(self, 'handle_request', 'handle_request')
+            profiler.patch_instance(self.item_sink, 'add', 'item_sink.add')
+            profiler.patch_instance(self.item_sink, 'flush', 'item_sink.flush')
+
         # Actually run crawling  真正开始爬取了。。。
+        completed = False
         try:
+            if metrics_config['port']:
+                await metrics.metrics_server.start(metrics_config['port'])
+            if self.incremental is not None:
+                await self.incremental.load()
             await self._run_spider_hook(after_start)
             await self.start_master()
+            completed = True
             await self._run_spider_hook(before_stop)
         finally:
-            await self.request_session.close()
+            if self.frontier is not None:
+                self.frontier.close(clear=completed)    # 正常结束时清空，否则保留未完成的请求供下次继续
+            if self.distributed is not None:
+                await self.distributed.close(clear=completed)   # 所有节点都已完成时才会清空
+            await self.item_sink.close()
+            if self.incremental is not None:
+                await self.incremental.close()          # 单词写入后再保存页面hash
+            self.parse_executor.close()
+            if self.dupefilter is not None:
+                self.dupefilter.close()
+            await session_pool.release(self.loop)
+            self.mongo.release()
+            if reporter is not None:
+                reporter.cancel()
+            self._collect_metrics()
+            metrics.registry.remove_collector(self._collect_metrics)
+            if metrics_config['port']:
+                await metrics.metrics_server.stop()
+            print(self._metrics_line(items_rate))
+            if profiler_config['enable']:
+                profiler.stop(dump_dir=profiler_config['dir'], top=profiler_config['top'])
 
             # Display logs about this crawl task 本次蜘蛛爬取工作的日志处理，成功次数，失败次数，用时多久
             end_time = datetime.now()
             print('----------- 用时：%s ------------' % (end_time - start_time))
 
+    def _collect_metrics(self):
+        metrics.queue_depth.set(self.request_queue.qsize(), self.name)
+        metrics.items_written.set(self.item_sink.inserted_counts + self.item_sink.existed_counts, self.name)
+
+    def _metrics_line(self, items_rate: metrics.RateMeter) -> str:
+        items = metrics.items_written.get(self.name)
+        return '【%s】队列: %s 进行中: %s 成功: %s 失败: %s 重试: %s 平均响应: %.3fs 下载: %.1fMB 写入: %s (%.1f条/秒)' % (
+            self.name,
+            self.request_queue.qsize(),
+            int(metrics.in_flight.get(self.name)),
+            self.success_counts,
+            self.failed_counts,
+            int(metrics.retries.total()),
+            metrics.request_latency.mean(),
+            metrics.response_bytes.total() / 1024 / 1024,
+            int(items),
+            items_rate.rate(items),
+        )
+
+    async def _report_metrics(self, interval: float):
+        items_rate = metrics.RateMeter()
+        while True:
+            await asyncio.sleep(interval)
+            self._collect_metrics()
+            print(self._metrics_line(items_rate))
+
     @classmethod
     async def async_start(
             cls,
@@ -228,7 +370,11 @@ class Spider(SpiderHook):
     async def handle_request(self, request: Request) -> typing.Tuple[AsyncGeneratorType, Response]:
         callback_result, response = None, None
         try:
-            callback_result, response = await request.fetch_callback(self.sem)
+            metrics.in_flight.inc(self.name)
+            try:
+                callback_result, response = await request.fetch_callback(scheduler=self.scheduler)
+            finally:
+                metrics.in_flight.dec(self.name)
             await self._process_response(request=request, response=response)
         except NotImplementedParseError as e:
             self.logger.error(e)
@@ -240,33 +386,97 @@ class Spider(SpiderHook):
 
         return callback_result, response
 
-    # 6、处理多个handle_request方法，如果form_datas值不为空，则执行POST请求
-    # 用来解决asyncio出现too many file descriptors in select()问题的web请求, 防止一下子请求过多，而被封IP,
-    # list中有超过500个以上的请求，则使用multiple_requests
-    async def multiple_request(self, urls: list, form_datas: list = None, is_gather: bool = False, **kwargs):
-        if is_gather:
-            if form_datas:
-                tasks = [self.handle_request(self.request(url=urls[0], form_data=one, **kwargs)) for one in form_datas]
-            else:
-                tasks = [self.handle_request(self.request(url=url, **kwargs)) for url in urls]
-
-            resp_results = await asyncio.gather(*tasks, return_exceptions=True)
-            for index, task_result in enumerate(resp_results):
-                if not isinstance(task_result, RuntimeError) and task_result:
-                    _, response = task_result
-                    response.index = index
-                    yield response
+    # 6、批量请求：urls(或同一url的多个form_datas)逐个生成Request，最多concurrency个同时进行，按完成先后yield Response
+    # 每个response.index为其在urls/form_datas中的位置；ordered=True时按index顺序yield
+    # 单个请求失败时yield一个ok为False的Response，不会中断整个批次；回调返回的异步生成器在这里直接处理
+    # 与回调中yield的Request一样经过去重过滤器(重复的请求不会yield)，开启FRONTIER时保存到frontier，回调处理完后标记完成；
+    # 分布式模式下批量请求属于调用它的请求(其租约在批次结束前一直续期)，不经过去重: 该请求被其他节点重新领取时需要重新请求整个批次
+    async def batch_request(
+            self,
+            urls: typing.Iterable,
+            form_datas: typing.Iterable = None,
+            concurrency: int = None,
+            ordered: bool = False,
+            **kwargs,
+    ) -> typing.AsyncGenerator[Response, None]:
+        def make_request(**one):
+            # 每个请求单独的metadata/headers/request_config: 回调修改response.metadata、缓存的验证头等不会影响同一批次的其他请求
+            options = dict(kwargs, **one)
+            for key in ('metadata', 'headers', 'request_config'):
+                if options.get(key) is not None:
+                    options[key] = dict(options[key])
+            return self.request(**options)
+
+        if form_datas:
+            url = next(iter(urls))
+            requests = (make_request(url=url, form_data=one) for one in form_datas)
         else:
-            if form_datas:
-                for index, one in enumerate(form_datas):
-                    _, response = await self.handle_request(self.request(url=urls[0], form_data=one, **kwargs))
-                    response.index = index
-                    yield response
-            else:
-                for index, one in enumerate(urls):          # 因为遍历集合方法中，存在异步 await方法，所以不能再call_back回原来的方法中去，否则会导致无限循环
-                    _, response = await self.handle_request(self.request(url=one, **kwargs))
+            requests = (make_request(url=one) for one in urls)
+        requests = enumerate(requests)          # 惰性生成Request，不会一下子创建全部请求
+        concurrency = max(1, concurrency or self.concurrency)
+
+        dupefilter = self.dupefilter if self.distributed is None else None
+        pending = {}            # task -> (index, request)
+        finished = {}           # ordered=True时暂存已完成但还不能yield的response
+        skipped = set()         # 重复的请求的index
+        next_index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    try:
+                        index, request_ins = next(requests)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if dupefilter is not None and dupefilter.request_seen(request_ins):
+                        self.logger.info(f"<Duplicate request: {request_ins.url}>")
+                        skipped.add(index)
+                        continue
+                    self._persist_request(request_ins)
+                    pending[asyncio.ensure_future(self.handle_request(request_ins))] = (index, request_ins)
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, request_ins = pending.pop(task)
+                    response = await self._batch_response(task, request_ins)
                     response.index = index
-                    yield response
+                    if ordered:
+                        finished[index] = response
+                    else:
+                        yield response
+                while next_index in finished or next_index in skipped:
+                    if next_index in finished:
+                        yield finished.pop(next_index)
+                    next_index += 1
+        finally:
+            # 调用方提前结束迭代(break)时，取消还未完成的请求
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _batch_response(self, task: asyncio.Future, request: Request) -> Response:
+        try:
+            callback_results, response = task.result()
+        except Exception as e:
+            self.logger.error(f"<Batch request: {request.url} {e}>")
+            return request._failed_response()       # 与_run_request_item()相同，不标记完成，下次继续时重新请求
+        if response is None:
+            response = request._failed_response()
+        if isinstance(callback_results, AsyncGeneratorType):
+            await self._process_async_callback(callback_results, response)
+        if self.frontier is not None:
+            self.frontier.done(request.frontier_id)
+        return response
+
+    # 兼容原来的接口: is_gather为True时同时发起全部请求，否则逐个请求；均按index顺序yield
+    async def multiple_request(self, urls: list, form_datas: list = None, is_gather: bool = False, **kwargs):
+        concurrency = len(form_datas or urls) if is_gather else 1
+        async for response in self.batch_request(urls, form_datas=form_datas, concurrency=concurrency, ordered=True, **kwargs):
+            yield response
 
     async def parse(self, response):
         raise NotImplementedParseError("<!!! parse function is expected !!!>")
@@ -301,9 +511,13 @@ class Spider(SpiderHook):
         request_session = request_session or self.request_session
         form_data = form_data
 
-        headers.update(self.headers.copy())
-        request_config.update(self.request_config.copy())
-        kwargs.update(self.kwargs.copy())
+        headers.update(self.headers)
+        request_config.update(self.request_config)
+        request_config.setdefault('CACHE', self.http_cache)
+        target = metadata.get('target')
+        if getattr(target, 'cache_ttl', None) is not None:
+            request_config.setdefault('CACHE_TTL', target.cache_ttl)
+        kwargs.update(self.kwargs)
         # 如果存在form_data，则method为POST，否则为默认的GET
         if form_data:
             method = 'POST'
@@ -321,51 +535,205 @@ class Spider(SpiderHook):
         )
 
     async def start_master(self):
-        if self.targets:
-            async for request_ins in self.process_start_urls():
-                self.request_queue.put_nowait(self.handle_request(request_ins))
-        else:
-            async for request_ins in self.manual_start_urls():
-                self.request_queue.put_nowait(self.handle_request(request_ins))
-
-        workers = [asyncio.ensure_future(self.start_worker()) for i in range(self.worker_numbers)]
-        for worker in workers:
+        # 先启动worker, 再放入起始请求；request_queue有容量上限，put()会在队列满时等待worker消费
+        self.workers = [asyncio.ensure_future(self.start_worker()) for i in range(self.worker_numbers)]
+        for worker in self.workers:
             self.logger.info(f"Worker started: {id(worker)}")
+
+        if self.frontier is not None and self.frontier.pending_counts():
+            start_requests = self.resume_requests()
+        elif self.targets:
+            start_requests = self.process_start_urls()
+        else:
+            start_requests = self.manual_start_urls()
+        async for request_ins in start_requests:
+            # 分布式模式下每个节点都放入起始请求, 由共用的去重集合保证只有一个节点的请求进入队列
+            if self.distributed is not None and await self._distribute_request(request_ins):
+                continue
+            self._persist_request(request_ins)
+            await self.request_queue.put((self.handle_request(request_ins), request_ins))
+
+        if self.distributed is not None:
+            await self.pull_leases()
         await self.request_queue.join()      # 阻塞至队列中所有的元素都被接收和处理完毕。当未完成计数降到零的时候， join() 阻塞被解除。
 
         # 运行到此处，代表request_queue队列中的任务都执行完成了，不再受到requests_queue.join()方法的阻塞了。
-        # 然后执行的是关闭任务，和关闭loop的操作了。
-        if not self.is_async_start:          # 如果不是is_async_start，即不是异步启动的，则等待执行stop()方法
-            await self.stop(SIGINT)
-        else:
-            if self.cancel_tasks:            # 如果是异步启动的，在async_start()方法中，实例化Spider类时定义cancel_tasks为True, 则，取消前面的tasks, 执行当前异步启动的task
-                await self._cancel_tasks()
+        # 先结束本spider的worker, 然后执行的是关闭任务，和关闭loop的操作了。
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+        # 如果不是is_async_start，即不是异步启动的，或者异步启动时定义cancel_tasks为True, 则取消其余的tasks；
+        # 这里不调用stop()停止loop，让_start()的finally部分(写入剩余数据、关闭session)正常执行完，run_until_complete()自然返回
+        if not self.is_async_start or self.cancel_tasks:
+            await self._cancel_tasks()
+
+    # 每个worker各自取出一个任务，执行完毕后立即处理其回调结果（子请求直接进入request_queue），
+    # 不再等待同一批次的其他任务，一个慢页面只会占用一个worker
+    async def start_worker(self):
+        while True:
+            request_item, request = await self.request_queue.get()
+            try:
+                await self._run_request_item(request_item, request)
+            finally:
+                self.request_queue.task_done()    # 每当消费协程调用 task_done() 表示这个条目item已经被回收，该条目所有工作已经完成，未完成计数就会减少。
 
+    async def _run_request_item(self, request_item: typing.Coroutine, request: Request = None):
+        try:
+            task_result = await request_item
+        except Exception as e:
+            self.logger.error(e)
+            if request is not None and request.frontier_id in self.leases:
+                await self._ack_lease(request.frontier_id)      # 不再续期也不确认的话，所有节点都无法结束
+            return
+        if task_result:
+            callback_results, response = task_result
+            if isinstance(callback_results, AsyncGeneratorType):
+                await self._process_async_callback(callback_results, response)
+        # 子请求都已保存后才标记完成，中断时不会丢失子请求
+        if request is not None and self.frontier is not None:
+            self.frontier.done(request.frontier_id)
+        elif request is not None and request.frontier_id in self.leases:
+            await self._ack_lease(request.frontier_id)
+
+    # 子请求放入request_queue; 队列已满时由当前worker直接执行该任务(caller-runs)，
+    # 既限制了排队中的任务数量，又避免所有worker都阻塞在put()上造成死锁
+    async def _enqueue(self, request_item: typing.Coroutine, request: Request = None):
+        try:
+            self.request_queue.put_nowait((request_item, request))
+        except asyncio.QueueFull:
+            await self._run_request_item(request_item, request)
+
+    def _request_descriptor(self, request: Request):
+        """frontier中保存的请求描述；callback必须是本spider的方法，否则返回None"""
+        callback = request.callback
+        if callback is not None and getattr(callback, '__self__', None) is not self:
+            self.logger.warning(f"<Frontier: callback of {request.url} is not a spider method, not persisted>")
+            return None
+        return {
+            'url': request.url,
+            'method': request.method,
+            'form_data': request.form_data,
+            'headers': request.headers,
+            'encoding': request.encoding,
+            'callback': callback.__name__ if callback is not None else None,
+            'metadata': dump_metadata(request.metadata),
+        }
+
+    def _request_from_descriptor(self, descriptor: dict) -> Request:
+        return self.request(
+            url=descriptor['url'],
+            method=descriptor['method'],
+            callback=getattr(self, descriptor['callback']) if descriptor['callback'] else None,
+            encoding=descriptor['encoding'],
+            headers=descriptor['headers'],
+            metadata=load_metadata(descriptor['metadata'], self.targets),
+            form_data=descriptor['form_data'],
+        )
 
-    async def start_worker(self):
+    def _persist_request(self, request: Request):
+        """把请求描述写入frontier；metadata必须能保存为json"""
+        if self.frontier is None or request.frontier_id is not None:
+            return
+        descriptor = self._request_descriptor(request)
+        if descriptor is None:
+            return
+        try:
+            request.frontier_id = self.frontier.push(descriptor)
+        except (TypeError, ValueError) as e:
+            self.logger.warning(f"<Frontier: {request.url} not persisted: {e}>")
+
+    async def resume_requests(self):
+        """从frontier中恢复上次未完成的请求，已保存过的请求同时加入去重过滤器"""
+        if self.dupefilter is not None:
+            for method, url, form_data in self.frontier.iter_seen():
+                self.dupefilter.add(method, url, form_data)
+        for descriptor in self.frontier.iter_pending():
+            request_ins = self._request_from_descriptor(descriptor)
+            request_ins.frontier_id = descriptor['id']
+            yield request_ins
+
+    async def _distribute_request(self, request: Request) -> bool:
+        """
+        分布式模式: 请求放入Redis中的共用队列，由某个节点领取后处理，返回True；重复的请求直接丢弃，也返回True
+        不能保存的请求(callback不是本spider的方法、metadata不能保存为json)返回False，由本节点直接处理
+        """
+        descriptor = self._request_descriptor(request)
+        if descriptor is None:
+            return False
+        try:
+            request_id = await self.distributed.push_request(descriptor, dont_filter=request.metadata.get('dont_filter', False))
+        except (TypeError, ValueError) as e:
+            self.logger.warning(f"<RedisFrontier: {request.url} not distributed: {e}>")
+            return False
+        if request_id is None:
+            self.logger.info(f"<Duplicate request: {request.url}>")
+        return True
+
+    async def pull_leases(self):
+        """
+        分布式模式: 本节点持有的请求少于prefetch个时从Redis领取，放入request_queue由worker处理
+        队列中没有可领取的请求时，等本节点的任务完成后检查所有节点是否都已完成: 是则结束，否则等待其他节点产生新请求或租约过期
+        """
+        distributed = Config.DISTRIBUTED_DICT
+        prefetch = distributed['prefetch'] or self.worker_numbers
+        renewer = asyncio.ensure_future(self._renew_leases(self.distributed.lease_seconds / 3))
+        try:
+            while True:
+                self.lease_released.clear()
+                leased = await self.distributed.lease(prefetch - len(self.leases))
+                for request_id, descriptor in leased:
+                    self.leases.add(request_id)
+                    try:
+                        request_ins = self._request_from_descriptor(descriptor)
+                    except (TypeError, KeyError, AttributeError) as e:
+                        self.logger.error(f"<RedisFrontier: invalid request {request_id}: {descriptor} {e!r}>")
+                        await self._ack_lease(request_id)
+                        continue
+                    request_ins.frontier_id = request_id
+                    await self.request_queue.put((self.handle_request(request_ins), request_ins))
+                if leased:
+                    continue
+                if self.leases:
+                    # 等本节点确认一个请求后再领取，最多等待poll_interval秒
+                    try:
+                        await asyncio.wait_for(self.lease_released.wait(), distributed['poll_interval'])
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.request_queue.join()
+                if not await self.distributed.pending_counts():
+                    break
+                await asyncio.sleep(distributed['poll_interval'])
+        finally:
+            renewer.cancel()
+
+    async def _renew_leases(self, interval: float):
         while True:
-            request_item = await self.request_queue.get()
-            self.worker_tasks.append(request_item)
-            if self.request_queue.empty():
-                results = await asyncio.gather(*self.worker_tasks, return_exceptions=True)
-                for task_result in results:
-                    if not isinstance(task_result, RuntimeError) and task_result:
-                        callback_results, response = task_result
-                        if isinstance(callback_results, AsyncGeneratorType):
-                            await self._process_async_callback(callback_results, response)
-                self.worker_tasks = []
-            self.request_queue.task_done()    # 每当消费协程调用 task_done() 表示这个条目item已经被回收，该条目所有工作已经完成，未完成计数就会减少。
+            await asyncio.sleep(interval)
+            try:
+                await self.distributed.renew(self.leases)
+            except Exception as e:
+                self.logger.error(f"<RedisFrontier: renew leases failed: {e!r}>")
 
+    async def _ack_lease(self, request_id: int):
+        """子请求都已放入Redis后才确认，节点中途退出时不会丢失子请求"""
+        self.leases.discard(request_id)
+        self.lease_released.set()
+        await self.distributed.ack(request_id)
 
     async def stop(self, _signal):
         self.logger.info(f"Stopping spider: {self.name}")
+        if self.frontier is not None:
+            self.frontier.close()                       # loop停止前保存未完成的请求
         await self._cancel_tasks()
         self.loop.stop()
 
     async def _cancel_tasks(self):
         tasks = []
-        for task in asyncio.Task.all_tasks():
-            if task is not asyncio.tasks.Task.current_task():
+        current_task = asyncio.current_task()
+        for task in asyncio.all_tasks():
+            if task is not current_task:
                 tasks.append(task)
                 task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
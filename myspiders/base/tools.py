@@ -4,6 +4,7 @@ import aiohttp
 import asyncio
 import async_timeout
 import random
+import time
 from config import Config
 import re
 from urllib.parse import urlencode, urlparse, urljoin, quote, unquote, urlunparse
@@ -108,9 +109,78 @@ async def request_html_by_aiohttp(url, proxy=None, params=None, timeout=15):
         return html if html else None
 
 
+class UserAgentPool(object):
+    """
+    启动时读取一次user_agents.txt并缓存，每次请求直接从内存中取，不再每次都读文件
+    (1) 每行一个user agent，行尾可以用tab分隔一个权重，例如 "Mozilla/5.0 ...\t5"，weighted为True时按权重随机
+    (2) sticky为True时，同一个host始终使用同一个user agent
+    (3) 修改文件后调用reload()重新读取
+    """
+
+    def __init__(self, filename: str = 'user_agents.txt', default: str = Config.USER_AGENT, weighted: bool = False, sticky: bool = False):
+        self.filename = os.path.join(os.path.dirname(__file__), filename)
+        self.default = default
+        self.weighted = weighted
+        self.sticky = sticky
+        self.user_agents = []
+        self.weights = []
+        self.host_agents = {}
+        self.loaded = False
+
+    def load(self):
+        user_agents, weights = [], []
+        try:
+            with open(self.filename, mode='r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    user_agent, _, weight = line.partition('\t')
+                    try:
+                        weight = float(weight) if weight else 1.0
+                    except ValueError:
+                        weight = 1.0
+                    user_agents.append(user_agent.strip())
+                    weights.append(weight)
+        except OSError:
+            pass
+        if not user_agents:
+            user_agents, weights = [self.default], [1.0]
+        self.user_agents = user_agents
+        self.weights = weights
+        self.host_agents = {}
+        self.loaded = True
+        return self
+
+    def reload(self):
+        return self.load()
+
+    def choice(self, host: str = None) -> str:
+        if not self.loaded:
+            self.load()
+        if self.sticky and host:
+            user_agent = self.host_agents.get(host)
+            if user_agent is None:
+                user_agent = self.host_agents[host] = self._choice()
+            return user_agent
+        return self._choice()
+
+    def _choice(self) -> str:
+        if self.weighted:
+            return random.choices(self.user_agents, weights=self.weights)[0]
+        return random.choice(self.user_agents)
+
+    def __len__(self):
+        if not self.loaded:
+            self.load()
+        return len(self.user_agents)
+
+
+user_agent_pool = UserAgentPool()
+
+
 async def get_random_user_agent():
-    user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.95 Safari/537.36'
-    return random.choice(await _get_data('user_agents.txt', user_agent))
+    return user_agent_pool.choice()
 
 
 async def _get_data(filename, default=''):
@@ -149,6 +219,33 @@ g_news_postfix = ['.html?', '.htm?', '.shtml?', '.shtm?']
 g_pattern_tag_a = re.compile(r'<a[^>]*?href=[\'"]?([^> \'"]+)[^>]*?>(.*?)</a>', re.I | re.S | re.M)
 
 
+# re中\s匹配的全部字符(即str.isspace()为True的字符)，remove_whitespace()与re.sub(r'\s+', '', string)结果相同，但只需一次translate
+g_whitespace = '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+g_whitespace_table = str.maketrans('', '', g_whitespace)
+
+
+def remove_whitespace(string: str) -> str:
+    return string.translate(g_whitespace_table)
+
+
+# 网页之外的内容，例如pdf、图片、压缩包
+def is_binary_url(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    if any(path.endswith(one) for one in suffix_file):
+        return True
+    return '.' in path.rsplit('/', 1)[-1] and path.rsplit('.', 1)[-1] in g_bin_postfix
+
+
+g_text_content_types = ('text/', 'application/json', 'application/javascript', 'application/xhtml+xml', 'application/xml')
+
+
+def is_binary_content_type(content_type: str) -> bool:
+    content_type = (content_type or '').lower()
+    if not content_type or content_type.endswith('+xml') or content_type.endswith('+json'):
+        return False
+    return not content_type.startswith(g_text_content_types)
+
+
 # 按照设定的规则，过滤出来需要的url链接
 def clean_url(url):
     # 1. 是否为合法的http url
@@ -208,7 +305,51 @@ def extract_links_re(url, html):
     return newlinks
 
 
+async def _benchmark_user_agent(total=2000, concurrency=20):
+    """
+    在本地启动一个aiohttp服务代替目标网站, 对比每次读取user_agents.txt与使用user_agent_pool时的requests/second
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text='<html><body>ok</body></html>', content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = 'http://127.0.0.1:%s/' % port
+
+    async def read_file_user_agent():
+        return random.choice(await _get_data('user_agents.txt', Config.USER_AGENT))
+
+    async def pool_user_agent():
+        return user_agent_pool.choice(host='127.0.0.1')
+
+    async def run(get_user_agent):
+        sem = asyncio.Semaphore(concurrency)
+        async with aiohttp.ClientSession() as client:
+            async def one():
+                async with sem:
+                    headers = {'User-Agent': await get_user_agent()}
+                    async with client.get(url, headers=headers) as response:
+                        await response.text()
+
+            begin = time.perf_counter()
+            await asyncio.gather(*[one() for _ in range(total)])
+            return total / (time.perf_counter() - begin)
+
+    try:
+        for name, func in (('read file per request', read_file_user_agent), ('user_agent_pool', pool_user_agent)):
+            print('%-24s %8.1f requests/second' % (name, await run(func)))
+    finally:
+        await runner.cleanup()
+
+
 if __name__ == '__main__':
     import asyncio
-    print(asyncio.get_event_loop().run_until_complete(get_random_user_agent()))
-
+    print(user_agent_pool.choice())
+    asyncio.get_event_loop().run_until_complete(_benchmark_user_agent())
@@ -1,11 +1,17 @@
 import os
 import sys
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
 from config import Config
 from importlib import import_module
 
 # sys.path.append('../')
 
 
+SPIDER_CONSOLE = Config.SPIDER_CONSOLE_DICT
+
+
 def file_name(file_dir=os.path.join(Config.BASE_DIR, 'myspiders/spider_news')):
     all_files = []
     for file in os.listdir(file_dir):
@@ -14,7 +20,111 @@ def file_name(file_dir=os.path.join(Config.BASE_DIR, 'myspiders/spider_news')):
     return all_files
 
 
-def spider_console():
+# 从*_spider.py模块中找出其中定义的Spider子类
+def spider_classes(spider_module):
+    from myspiders.base import Spider
+    classes = []
+    for one in vars(spider_module).values():
+        if isinstance(one, type) and issubclass(one, Spider) and one is not Spider and one.__module__ == spider_module.__name__:
+            classes.append(one)
+    return classes
+
+
+def _share_concurrency(spider_numbers: int, concurrency: int = None) -> int:
+    concurrency = concurrency or SPIDER_CONSOLE['concurrency']
+    return max(1, concurrency // max(1, spider_numbers))
+
+
+def _spider_concurrency(spider_class, share: int) -> int:
+    # 分配的并发数只能降低spider自身声明的concurrency，不能超过(例如对网站限速的spider)
+    return max(1, min(share, spider_class.concurrency))
+
+
+def _print_summary(results: list, start_time: float):
+    print('【=======================================汇总：%s个spider=========================================】' % len(results))
+    for name, success_counts, failed_counts, elapsed, error in results:
+        if error:
+            print('%-20s 失败: %s' % (name, error))
+        else:
+            print('%-20s 成功: %-8s 失败: %-8s 用时: %.2fs' % (name, success_counts, failed_counts, elapsed))
+    print('----------- 总用时：%.2fs ------------' % (time.time() - start_time))
+
+
+async def _async_start_spider(spider_class, concurrency: int):
+    start_time = time.time()
+    try:
+        spider_ins = await spider_class.async_start(cancel_tasks=False, concurrency=_spider_concurrency(spider_class, concurrency))
+    except Exception as e:
+        return spider_class.name, 0, 0, time.time() - start_time, e
+    return spider_ins.name, spider_ins.success_counts, spider_ins.failed_counts, time.time() - start_time, None
+
+
+async def async_spider_console(concurrency: int = None):
+    """在同一个event loop中同时运行所有spider，总并发数concurrency平均分配给每个spider，但不超过spider自身的concurrency"""
+    start_time = time.time()
+    all_classes = []
+    for spider in file_name():
+        spider_module = import_module("myspiders.spider_news.{}".format(spider))
+        all_classes.extend(spider_classes(spider_module))
+    if not all_classes:
+        return []
+
+    share = _share_concurrency(len(all_classes), concurrency)
+    results = await asyncio.gather(*[_async_start_spider(one, share) for one in all_classes])
+    _print_summary(results, start_time)
+    return results
+
+
+def _process_start_spider(spider: str, concurrency: int):
+    spider_module = import_module("myspiders.spider_news.{}".format(spider))
+    results = []
+    for spider_class in spider_classes(spider_module):
+        start_time = time.time()
+        try:
+            spider_ins = spider_class.start(concurrency=_spider_concurrency(spider_class, concurrency))
+        except Exception as e:
+            results.append((spider_class.name, 0, 0, time.time() - start_time, repr(e)))
+            continue
+        results.append((spider_ins.name, spider_ins.success_counts, spider_ins.failed_counts, time.time() - start_time, None))
+    return results
+
+
+def process_spider_console(processes: int = None, concurrency: int = None):
+    """每个*_spider.py模块在单独的进程中运行，适用于解析占用CPU较多的spider"""
+    start_time = time.time()
+    all_files = file_name()
+    if not all_files:
+        return []
+
+    processes = processes or SPIDER_CONSOLE['processes'] or len(all_files)
+    share = _share_concurrency(len(all_files), concurrency)
+    results = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for one in executor.map(_process_start_spider, all_files, [share] * len(all_files)):
+            results.extend(one)
+    _print_summary(results, start_time)
+    return results
+
+
+def spider_console(mode: str = None):
+    """
+    mode: 'sequential' 依次运行每个spider模块的start()
+          'concurrent' 在同一个event loop中同时运行所有spider
+          'process'    每个spider模块在单独的进程中运行
+    concurrent和process模式直接运行模块中的Spider子类，不会调用模块的start()
+    """
+    mode = mode or SPIDER_CONSOLE['mode']
+    if mode == 'concurrent':
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(async_spider_console())
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+    elif mode == 'process':
+        return process_spider_console()
+
     all_files = file_name()
     for spider in all_files:
         spider_module = import_module("myspiders.spider_news.{}".format(spider))
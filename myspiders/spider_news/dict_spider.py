@@ -1,4 +1,4 @@
-from myspiders.base import Spider
+from myspiders.base import Spider, VocabularyCleaner
 from config import Rules, Target, Vocabulary
 from urllib.parse import urlencode, urlparse, urljoin, quote, unquote
 import re
@@ -7,15 +7,22 @@ import re
 class DictSpider(Spider):
     name = 'DictSpider'
     targets = Rules.RULES_DICT
+    # 所有页面都在word.iciba.com上，实际并发受HostScheduler的PER_HOST(默认3)限制，concurrency只是全局上限；
+    # 需要更高的并发时在scheduler_config中调大PER_HOST。worker数量高于并发数，命中HttpCache的请求不占用并发名额
+    worker_numbers = 12
+    concurrency = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cleaner = VocabularyCleaner()        # 每个spider实例单独计数
 
     async def parse(self, response):
         url_old = response.url
         domain = urlparse(url_old).netloc
 
-        html = await response.text()
         target: Target = response.metadata['target']
 
-        list_chapter = target.selectors[0].extract(soup=html)
+        list_chapter = target.selectors[0].extract(soup=response)
         for one in list_chapter:
             url = urljoin(url_old, one)
             yield self.request(url=url, callback=self.parse_next, metadata={'target': target})
@@ -27,35 +34,29 @@ class DictSpider(Spider):
         class_id = param.split('=')[-1]
 
         url_prefix = 'http://word.iciba.com/?action=words&class=%s&course=%s'
-        html = await response.text()
-        list_chapter = target.selectors[1].extract(soup=html)
-        if len(list_chapter) > 0:
-            for i in range(1, len(list_chapter) + 1):
-                url = url_prefix % (class_id, i)
-                yield self.request(url=url, callback=self.parse_final, metadata={'target': target})
+        list_chapter = target.selectors[1].extract(soup=response)
+        # 同一个class的全部课程页一起交给batch_request，parse_final在各页面完成时依次执行
+        urls = (url_prefix % (class_id, i) for i in range(1, len(list_chapter) + 1))
+        async for one in self.batch_request(urls, callback=self.parse_final, metadata={'target': target}):
+            if not one.ok:
+                self.logger.error(f"<Course {one.index + 1} failed: {one.url}>")
 
     async def parse_final(self, response):
         target: Target = response.metadata['target']
-        html = await response.text()
-        selector_english = target.selectors[3]
-        selector_chinese = target.selectors[4]
-        selector_phonetic = target.selectors[5]
-        selector_voice = target.selectors[6]
-
-        list_row = target.selectors[2].extract(soup=html)
-        for one in list_row:
-            english = selector_english.extract(soup=one)
-            chinese = selector_chinese.extract(soup=one)
-            phonetic = selector_phonetic.extract(soup=one)
-            voice = selector_voice.extract(soup=one)
-
-            chinese = re.sub(r'\s+', '', chinese)
-            vocabulary = Vocabulary(name_english=english, name_chinese=chinese, phonetic=phonetic, voice=voice)
-            await self.save_db(vocabulary)
-
-    async def save_db(self, vocabulary: Vocabulary):
-        data = vocabulary.do_dump()
-        self.mongo.do_insert_one(self.collection,  {'_id': data['_id']}, data)
+        incremental = self.incremental
+        if incremental is not None and not incremental.page_changed(response.url, response.html):
+            return                                  # 增量模式下内容没有变化的课程页面不再解析
+        # Target中声明的words规则, PARSE_WORKERS大于0时在子进程中解析; 整页的单词按列一起清洗、去重
+        rows = await self.parse_executor.extract(target.plan('words'), response)
+        for document in self.cleaner.clean(rows):
+            await self.save_db(document, url=response.url)
+        if incremental is not None:
+            incremental.page_done(response.url)
+
+    async def save_db(self, document: dict, url: str = None):
+        """document为Vocabulary.do_dump()格式的文档，url为其所在的页面"""
+        if self.incremental is None or self.incremental.word_changed(document, url=url):
+            await self.item_sink.add(document)
 
 
 def start():
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 仓库根目录有__init__.py，pytest不会把它加入sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config -> rules -> myspiders.base -> database -> config: 与run.py一样先导入config
+import config  # noqa: E402,F401
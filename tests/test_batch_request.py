@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import database.mongo_database as mongo_database
+from myspiders.base import Spider, SqliteFrontier, session_pool
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class _BatchSpider(Spider):
+    name = 'BatchSpider'
+    request_config = {'RETRIES': 0}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed = []
+
+    async def parse(self, response):
+        self.parsed.append(response.url)
+        if False:
+            yield None
+
+
+async def _serve():
+    async def handler(request):
+        page = int(request.query['page'])
+        await asyncio.sleep(0.01 * (3 - page % 3))
+        if page == 4:
+            return web.Response(status=500)
+        return web.Response(text='<html><body>%s</body></html>' % page, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/list', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, 'http://127.0.0.1:%s/list?page=%%s' % site._server.sockets[0].getsockname()[1]
+
+
+@pytest.fixture
+def make_spider(monkeypatch, tmp_path):
+    monkeypatch.setattr(mongo_database, 'MongoClient', mongomock.MongoClient)
+    spiders = []
+
+    def make(loop, spider_class=_BatchSpider):
+        spider = spider_class(loop=loop)
+        spider.frontier = SqliteFrontier(str(tmp_path / ('frontier%s.sqlite3' % len(spiders))))
+        spiders.append(spider)
+        return spider
+
+    yield make
+    for spider in spiders:
+        spider.frontier.close()
+        spider.mongo.release()
+
+
+def test_batch_request_dedup_order_and_frontier(make_spider):
+    async def run():
+        spider = make_spider(asyncio.get_event_loop())
+        runner, url = await _serve()
+        try:
+            urls = [url % page for page in (1, 2, 1, 3, 4, 2)]
+            responses = [one async for one in spider.batch_request(urls, callback=spider.parse, concurrency=3, ordered=True)]
+        finally:
+            await session_pool.release()
+            await runner.cleanup()
+        return spider, url, responses
+
+    spider, url, responses = asyncio.run(run())
+    # 重复的第2、5个url不会请求，也不会yield；失败的页面yield ok为False的Response
+    assert [(one.index, one.ok) for one in responses] == [(0, True), (1, True), (3, True), (4, False)]
+    assert sorted(spider.parsed) == [url % page for page in (1, 2, 3, 4)]      # 失败的页面也会调用回调
+    # 每个请求都已保存到frontier，回调处理完后标记完成
+    assert len(list(spider.frontier.iter_seen())) == 4
+    assert spider.frontier.pending_counts() == 0
+
+
+def test_interrupted_batch_keeps_requests_pending(make_spider):
+    async def run():
+        spider = make_spider(asyncio.get_event_loop())
+        runner, url = await _serve()
+        try:
+            async for one in spider.batch_request([url % page for page in (1, 2, 3, 5)], callback=spider.parse, concurrency=2):
+                break
+        finally:
+            await session_pool.release()
+            await runner.cleanup()
+        return spider
+
+    spider = asyncio.run(run())
+    # 第一个完成时只开始了2个请求；另一个已开始但没有处理完，留在frontier中，下次继续时恢复
+    assert len(list(spider.frontier.iter_seen())) == 2
+    assert spider.frontier.pending_counts() == 1
+
+
+class _MetadataSpider(_BatchSpider):
+    async def parse(self, response):
+        response.metadata['page'] = response.url            # 回调修改自己的metadata
+        if False:
+            yield None
+
+
+def test_batch_requests_do_not_share_metadata(make_spider):
+    async def run():
+        spider = make_spider(asyncio.get_event_loop(), _MetadataSpider)
+        runner, url = await _serve()
+        metadata, headers = {'target': 'words'}, {'Referer': 'http://word.iciba.com/'}
+        try:
+            responses = [one async for one in spider.batch_request([url % page for page in (1, 2, 3)], callback=spider.parse,
+                                                                   metadata=metadata, headers=headers, ordered=True)]
+        finally:
+            await session_pool.release()
+            await runner.cleanup()
+        return url, metadata, headers, responses
+
+    url, metadata, headers, responses = asyncio.run(run())
+    assert [one.metadata for one in responses] == [{'target': 'words', 'page': url % page} for page in (1, 2, 3)]
+    assert metadata == {'target': 'words'}                  # 调用方的dict不会被修改
+    assert headers == {'Referer': 'http://word.iciba.com/'}
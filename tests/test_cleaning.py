@@ -0,0 +1,67 @@
+import pytest
+
+from myspiders.base import VocabularyCleaner
+from myspiders.base.cleaning import migrate_phonetic
+
+
+def _row(english, phonetic='', chinese='', voice=''):
+    return {'name_english': english, 'name_chinese': chinese, 'phonetic': phonetic, 'voice': voice}
+
+
+# word.iciba.com课程页中的音标写法
+@pytest.mark.parametrize('phonetic, expected', [
+    ("[ ə'bændən ]", '[əˈbændən]'),
+    ('[ˈæbsənt]', '[ˈæbsənt]'),
+    ("[ ig'zɑ:mpl ]", '[igˈzɑːmpl]'),
+    ('[ɪɡˈzɑːmpl]', '[ɪɡˈzɑːmpl]'),             # IPA的ɡ(U+0261)保持不变
+    ("/ə'baut/", '[əˈbaut]'),
+    ("[ 'æbsənt/æb'sent ]", '[ˈæbsənt/æbˈsent]'),   # 两种读音之间的/保留
+    ('', ''),
+    ('  ', ''),
+])
+def test_phonetic(phonetic, expected):
+    assert VocabularyCleaner(phonetic_format='ipa').clean([_row('word', phonetic=phonetic)])[0]['phonetic'] == expected
+
+
+def test_phonetic_column_keeps_rows_apart():
+    rows = [_row('a', "/ə'/"), _row('b', ''), _row('c', "[ 'siː ]"), _row('d', '/')]
+    assert [one['phonetic'] for one in VocabularyCleaner(phonetic_format='ipa').clean(rows)] == ['[əˈ]', '', '[ˈsiː]', '']
+
+
+def test_phonetic_raw_by_default():
+    # 默认与原来一样保存网页中的音标，已有集合中不会出现两种格式
+    rows = [_row('a', "[ ə'bændən ]"), _row('b', None)]
+    assert [one['phonetic'] for one in VocabularyCleaner().clean(rows)] == ["[ ə'bændən ]", '']
+    with pytest.raises(ValueError):
+        VocabularyCleaner(phonetic_format='IPA')
+
+
+def test_migrate_phonetic():
+    mongomock = pytest.importorskip('mongomock')
+    collec = mongomock.MongoClient().db.english_dict
+    collec.insert_many([
+        {'_id': 'abandon', 'phonetic': "[ ə'bændən ]", 'status': 'done'},
+        {'_id': 'about', 'phonetic': '[əˈbaut]'},
+        {'_id': 'absent', 'phonetic': ''},
+        {'_id': 'accept'},
+    ] + [{'_id': 'w%s' % i, 'phonetic': "/w'%s/" % i} for i in range(5)])
+    assert migrate_phonetic(collec, batch_size=3) == 6
+    assert collec.find_one({'_id': 'abandon'}) == {'_id': 'abandon', 'phonetic': '[əˈbændən]', 'status': 'done'}
+    assert collec.find_one({'_id': 'w4'})['phonetic'] == '[wˈ4]'
+    assert collec.find_one({'_id': 'accept'}) == {'_id': 'accept'}
+    assert migrate_phonetic(collec) == 0                # 已经是ipa格式
+
+
+def test_clean_documents():
+    cleaner = VocabularyCleaner(phonetic_format='ipa')
+    rows = [
+        _row('abandon', "[ ə'bændən ]", ' v. 放弃;\n 遗弃 ', 'abandon'),
+        _row('abandon', '[x]', '重复', 'x'),
+        _row('', '[y]', '空', 'y'),
+        _row('absent', '[ˈæbsənt]', 'adj. 缺席的', 'bad voice!'),
+    ]
+    assert cleaner.clean(rows) == [
+        {'name_chinese': 'v.放弃;遗弃', 'name_english': 'abandon', 'phonetic': '[əˈbændən]', 'status': 'undo', 'voice': 'abandon', '_id': 'abandon'},
+        {'name_chinese': 'adj.缺席的', 'name_english': 'absent', 'phonetic': '[ˈæbsənt]', 'status': 'undo', 'voice': '', '_id': 'absent'},
+    ]
+    assert cleaner.counts == {'rows': 4, 'empty': 1, 'duplicates': 1, 'invalid_voice': 1}
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+import database.mongo_database as mongo_database
+from myspiders.base import session_pool
+from myspiders.spider_news.dict_spider import DictSpider
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def test_each_spider_has_its_own_cleaner(monkeypatch):
+    monkeypatch.setattr(mongo_database, 'MongoClient', mongomock.MongoClient)
+    loop = asyncio.new_event_loop()
+    spiders = [DictSpider(loop=loop), DictSpider(loop=loop)]
+    try:
+        first, second = spiders
+        assert first.cleaner is not second.cleaner
+        first.cleaner.clean([{'name_english': 'a', 'name_chinese': '', 'phonetic': '', 'voice': ''}])
+        assert first.cleaner.counts['rows'] == 1 and second.cleaner.counts['rows'] == 0
+    finally:
+        for spider in spiders:
+            spider.mongo.release()
+            loop.run_until_complete(session_pool.release(loop))
+        loop.close()
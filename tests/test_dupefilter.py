@@ -0,0 +1,37 @@
+from myspiders.base.dupefilter import RequestDupeFilter, canonical_url
+
+
+class _Request(object):
+    method, form_data = 'GET', None
+
+    def __init__(self, url, metadata=None):
+        self.url = url
+        self.metadata = metadata or {}
+
+
+ROLL_URL = 'https://news.sina.com.cn/roll/index.d.html?cid=%s&page=%s'
+
+
+def test_query_is_part_of_the_fingerprint():
+    assert RequestDupeFilter.fingerprint('GET', ROLL_URL % (56261, 1)) != RequestDupeFilter.fingerprint('GET', ROLL_URL % (56261, 2))
+
+
+def test_listing_pages_are_not_duplicates():
+    dupefilter = RequestDupeFilter()
+    urls = [ROLL_URL % (cid, page) for cid in (56261, 56262) for page in (1, 2)]
+    assert [dupefilter.request_seen(_Request(url)) for url in urls] == [False] * 4
+    assert dupefilter.request_seen(_Request(urls[1]))
+
+
+def test_canonical_url():
+    assert canonical_url('HTTP://News.Sina.com.cn:80/a.html?page=2&cid=1&utm_source=x&spm=a.b#top') == 'http://news.sina.com.cn/a.html?cid=1&page=2'
+    assert canonical_url('https://example.com') == 'https://example.com/'
+    assert canonical_url('https://example.com:8443/a?b=1') == 'https://example.com:8443/a?b=1'
+    assert canonical_url('https://example.com/Path?q=') == 'https://example.com/Path?q='
+
+
+def test_tracking_params_and_fragment_are_ignored():
+    dupefilter = RequestDupeFilter(mode='bloom', capacity=1000)
+    assert not dupefilter.request_seen(_Request('http://example.com/a?page=1#comments'))
+    assert dupefilter.request_seen(_Request('http://EXAMPLE.com/a?utm_medium=feed&page=1'))
+    assert not dupefilter.request_seen(_Request('http://example.com/a?page=1', metadata={'dont_filter': True}))
@@ -0,0 +1,27 @@
+import pytest
+
+from myspiders.base.encoding import EncodingDetector, normalize_encoding
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('latin-1', 'cp1252'),
+    ('ISO-8859-1', 'cp1252'),
+    ('latin1', 'cp1252'),
+    ('us-ascii', 'utf-8'),
+    ('GB2312', 'gb18030'),
+    ('gbk', 'gb18030'),
+    ('UTF-8', 'utf-8'),
+    ('"windows-1251"', 'cp1251'),
+    ('no-such-charset', None),
+    ('', None),
+])
+def test_normalize_encoding(name, expected):
+    assert normalize_encoding(name) == expected
+
+
+def test_latin1_declared_page_decodes_as_cp1252():
+    # iso-8859-1声明的页面中的“”和€实际是cp1252字符
+    body = '<html><body><p>“price” 5€</p></body></html>'.encode('cp1252')
+    text, encoding = EncodingDetector().decode(body, charset='iso-8859-1')
+    assert encoding == 'cp1252'
+    assert '“price” 5€' in text
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from config import Rules
+from myspiders.base.exceptions import NothingMatchedError
+from myspiders.base.field import compare_engines, _normalize_result
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGES = sorted(one for one in os.listdir(FIXTURES) if one.endswith('.html'))
+
+# 与field.py __main__中相同: Rules里所有同时支持bs4和lxml的field
+FIELDS = [field for rules in (Rules.RULES_DICT, Rules.RULES_NEWS, Rules.RULES) for target in rules
+          for field in target.selectors or [] if hasattr(field, '_get_lxml_elements')]
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _extract(field, document):
+    try:
+        return _normalize_result(field.extract(document))
+    except NothingMatchedError:
+        return None
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_engines_agree(name):
+    mismatches = compare_engines(_read(name), FIELDS)
+    assert [(field.name, field.attrs, field.css_select, bs4_result, lxml_result) for field, bs4_result, lxml_result in mismatches] == []
+
+
+def test_fixtures_cover_dict_fields():
+    # 每个RULES_DICT的field至少在一个页面上有结果，否则上面的对比没有意义
+    html_etrees = [etree.HTML(_read(name)) for name in PAGES]
+    for target in Rules.RULES_DICT:
+        for field in target.selectors:
+            assert any(_extract(field, one) for one in html_etrees), (field.name, field.attrs, field.css_select)
+
+
+def test_engines_agree_on_word_rows():
+    # 单词页面按plans逐行解析: 先取出每个<li>，再在每一行上执行其他field
+    target = next(iter(Rules.RULES_DICT))
+    plan = target.plan('words')
+    page = _read('iciba_words.html')
+    bs4_rows = plan.rows.extract(BeautifulSoup(page, 'lxml'))
+    lxml_rows = plan.rows.extract(etree.HTML(page))
+    assert len(bs4_rows) == len(lxml_rows) == 5
+    for bs4_row, lxml_row in zip(bs4_rows, lxml_rows):
+        for name, field in plan.fields.items():
+            assert _extract(field, bs4_row) == _extract(field, lxml_row), name
@@ -0,0 +1,134 @@
+import asyncio
+
+from aiohttp import web
+
+from myspiders.base import HttpCache, Request, session_pool
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 01 Apr 2020 08:00:00 GMT'
+
+
+class _Site:
+    """本地服务器: /etag和/modified分别用ETag、Last-Modified验证缓存，记录每次请求的验证头"""
+
+    def __init__(self):
+        self.pages = {'etag': '<html><body><p>第1课 单词列表</p></body></html>', 'modified': '<html><body><p>第2课 单词列表</p></body></html>'}
+        self.etag = ETAG
+        self.requests = []
+
+    async def handler(self, request):
+        name = request.match_info['name']
+        self.requests.append((name, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')))
+        if name == 'etag':
+            if request.headers.get('If-None-Match') == self.etag:
+                return web.Response(status=304, headers={'ETag': self.etag})
+            return web.Response(text=self.pages[name], content_type='text/html', headers={'ETag': self.etag})
+        if request.headers.get('If-Modified-Since') == LAST_MODIFIED:
+            return web.Response(status=304)
+        return web.Response(text=self.pages[name], content_type='text/html', headers={'Last-Modified': LAST_MODIFIED})
+
+
+async def _serve(site: _Site, run):
+    app = web.Application()
+    app.router.add_get('/{name}', site.handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    server = web.TCPSite(runner, '127.0.0.1', 0)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    try:
+        return await run('http://127.0.0.1:%s/' % port)
+    finally:
+        await session_pool.close()
+        await runner.cleanup()
+
+
+def _fetch(url, cache, **config):
+    return Request(url, request_config=dict({'CACHE': cache, 'RETRIES': 0}, **config)).fetch()
+
+
+def _age(cache: HttpCache, url: str, seconds: float):
+    """把缓存时间提前seconds秒，模拟ttl过期"""
+    entry = cache.get('GET', url)
+    entry['stored_at'] -= seconds
+    cache._write_meta(cache._path(cache.fingerprint('GET', url)), {key: value for key, value in entry.items() if key != 'body'})
+
+
+def test_revalidate_with_etag_and_last_modified(tmp_path):
+    site = _Site()
+    cache = HttpCache(str(tmp_path), ttl=0)
+
+    async def run(base):
+        results = {}
+        for name in ('etag', 'modified'):
+            first = await _fetch(base + name, cache)
+            stored_at = cache.get('GET', base + name)['stored_at']
+            second = await _fetch(base + name, cache)               # ttl为0，每次都验证，304时使用缓存
+            results[name] = (first, second, stored_at, cache.get('GET', base + name)['stored_at'])
+        return results
+
+    results = asyncio.run(_serve(site, run))
+    assert site.requests == [
+        ('etag', None, None), ('etag', ETAG, None),
+        ('modified', None, None), ('modified', None, LAST_MODIFIED),
+    ]
+    for name, (first, second, stored_at, refreshed_at) in results.items():
+        assert first.status == second.status == 200, name
+        assert second.html == first.html == site.pages[name]
+        assert refreshed_at >= stored_at                           # 304时刷新缓存时间
+
+
+def test_changed_page_replaces_cache(tmp_path):
+    site = _Site()
+    cache = HttpCache(str(tmp_path), ttl=0)
+
+    async def run(base):
+        await _fetch(base + 'etag', cache)
+        site.etag, site.pages['etag'] = '"v2"', '<html><body><p>第1课 新单词</p></body></html>'
+        changed = await _fetch(base + 'etag', cache)
+        return changed, cache.get('GET', base + 'etag')
+
+    changed, entry = asyncio.run(_serve(site, run))
+    assert site.requests[-1] == ('etag', ETAG, None)
+    assert '新单词' in changed.html
+    assert entry['headers']['ETag'] == '"v2"' and '新单词' in entry['body'].decode('utf-8')
+
+
+def test_ttl_expiry(tmp_path):
+    site = _Site()
+    cache = HttpCache(str(tmp_path), ttl=60)
+
+    async def run(base):
+        url = base + 'etag'
+        await _fetch(url, cache)
+        fresh = await _fetch(url, cache)                            # ttl内不访问网络
+        requests_when_fresh = len(site.requests)
+        _age(cache, url, 120)
+        expired = await _fetch(url, cache)                          # 过期后带ETag重新验证
+        no_ttl = await _fetch(url, cache, CACHE_TTL=0)              # Target(cache_ttl=0)覆盖HttpCache.ttl
+        return fresh, requests_when_fresh, expired, no_ttl
+
+    fresh, requests_when_fresh, expired, no_ttl = asyncio.run(_serve(site, run))
+    assert requests_when_fresh == 1
+    assert site.requests == [('etag', None, None), ('etag', ETAG, None), ('etag', ETAG, None)]
+    assert fresh.html == expired.html == no_ttl.html == site.pages['etag']
+
+
+def test_offline_replay(tmp_path):
+    site = _Site()
+
+    async def record(base):
+        await _fetch(base + 'etag', HttpCache(str(tmp_path)))
+        return base
+
+    base = asyncio.run(_serve(site, record))
+
+    async def replay():
+        # 服务器已经关闭，离线模式只使用缓存，不管是否过期
+        cache = HttpCache(str(tmp_path), ttl=0, offline=True)
+        return await _fetch(base + 'etag', cache), await _fetch(base + 'modified', cache)
+
+    cached, missing = asyncio.run(replay())
+    assert len(site.requests) == 1
+    assert cached.ok and cached.html == site.pages['etag']
+    assert not missing.ok
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from database import IncrementalIndex, MongoItemSink
+from test_mongo_sink import _FlakyCollection, _word
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def collec():
+    return mongomock.MongoClient().db.words
+
+
+def test_incremental_index_waits_for_written_words(collec, tmp_path):
+    """写入失败时不记录页面和单词的hash，下次运行仍会解析该页面"""
+    pages = mongomock.MongoClient().db.pages
+    url, html = 'http://word.iciba.com/?action=words&class=1&course=1', '<html>w0 w1</html>'
+
+    async def crawl(target):
+        index = IncrementalIndex(collec, pages)
+        await index.load()
+        sink = MongoItemSink(target, mode='set', insert_only=('status',), on_written=index.words_written, spill_path=str(tmp_path / 'spill.jsonl'))
+        if index.page_changed(url, html):
+            for i in range(2):
+                if index.word_changed(_word(i), url=url):
+                    await sink.add(_word(i))
+            index.page_done(url)
+        await sink.close(retries=0)
+        await index.close()
+        return index
+
+    failed = asyncio.run(crawl(_FlakyCollection(collec, failures=100)))
+    assert failed.pages == {} and failed.words == {} and pages.count_documents({}) == 0
+
+    (tmp_path / 'spill.jsonl').unlink()
+    first = asyncio.run(crawl(collec))
+    assert first.counts['pages_changed'] == 1 and collec.count_documents({}) == 2
+    assert pages.count_documents({}) == 1
+
+    again = asyncio.run(crawl(collec))
+    assert again.counts['pages_skipped'] == 1
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from config import Config, Logger
+
+
+def _stop(path):
+    # 只停止这个文件的QueueListener，写出队列中剩余的日志
+    Logger.listeners[path].stop()
+    Logger.running.discard(path)
+
+
+def _read(path):
+    _stop(path)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_invalid_level(monkeypatch, tmp_path):
+    monkeypatch.setitem(Config.LOG_DICT, 'levels', {'myspiders.base': 'verbose'})
+    with pytest.raises(ValueError, match="'verbose' for myspiders.base.request"):
+        Logger(filename=str(tmp_path / 'a.log'), name='myspiders.base.request')
+    # 大小写和空白不影响
+    monkeypatch.setitem(Config.LOG_DICT, 'levels', {'myspiders.base': ' ERROR'})
+    logger = Logger(filename=str(tmp_path / 'a.log'), name='myspiders.base.request').logger
+    assert logger.level == 40
+    _stop(str(tmp_path / 'a.log'))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_logging_after_fork(tmp_path):
+    path = str(tmp_path / 'fork.log')
+    logger = Logger(filename=path, level='info', name='test_log').logger
+    logger.info('before fork')
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logger.info('in child')
+            Logger.stop()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    logger.info('after fork')
+    content = _read(path)
+    assert 'before fork' in content and 'in child' in content and 'after fork' in content
@@ -0,0 +1,146 @@
+import os
+import traceback
+
+import lxml.html
+import pytest
+from lxml.html import HtmlComment
+
+from myspiders.base.encoding import encoding_detector
+from myspiders.base.maincontent import MainContent
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'maincontent')
+PAGES = sorted(one for one in os.listdir(FIXTURES) if one.endswith('.html'))
+
+
+class _LegacyMainContent(MainContent):
+    """优化之前的get_main_block/clean_node(list.pop(0)、每个节点xpath('.//a') + text_content())，用于对比结果"""
+
+    def get_main_block(self, url, html, clean_title=True):
+        try:
+            doc = lxml.html.fromstring(html)
+            doc.make_links_absolute(base_url=url)
+        except :
+            traceback.print_exc()
+            return None, None
+
+        self.title = self.get_title(doc)
+        if clean_title:
+            self.title = self.clean_title(self.title)
+
+        body = doc.xpath('//body')
+        if not body:
+            return self.title, None
+
+        candidates = []
+        nodes = body[0].getchildren()
+        while nodes:
+            node = nodes.pop(0)
+            children = node.getchildren()
+            tlen = 0
+            for child in children:
+                if isinstance(child, HtmlComment):
+                    continue
+                if child.tag in self.non_content_tag:
+                    continue
+                if child.tag == 'a':
+                    continue
+                if child.tag == 'textarea':
+                    continue
+                attr = '%s%s%s' % (child.get('class', ''),
+                                   child.get('id', ''),
+                                   child.get('style'))
+                if 'display' in attr and 'none' in attr:
+                    continue
+
+                nodes.append(child)
+
+                if child.tag == 'p':
+                    weight = 3
+                else:
+                    weight = 1
+
+                text = '' if not child.text else child.text.strip()
+                tail = '' if not child.tail else child.tail.strip()
+
+                tlen += (len(text) + len(tail)) * weight
+
+            if tlen < 10:
+                continue
+
+            weight = self.calc_node_weight(node)
+            candidates.append((node, tlen*weight))
+
+        if not candidates:
+            return self.title, None
+
+        candidates.sort(key=lambda a: a[1], reverse=True)
+
+        good = candidates[0][0]
+        if good.tag in ['p', 'pre', 'code', 'blockquote']:
+            for i in range(5):
+                good = good.getparent()
+                if good.tag == 'div':
+                    break
+
+        good = self.clean_node(good, url)
+        return self.title, good
+
+    def clean_node(self, tree, url=''):
+        to_drop = []
+        drop_left = False
+        for node in tree.iterdescendants():
+            if drop_left:
+                to_drop.append(node)
+                continue
+            if isinstance(node, HtmlComment):
+                to_drop.append(node)
+                if self.p_content_stop.search(node.text):
+                    drop_left = True
+                continue
+            if node.tag in self.non_content_tag:
+                to_drop.append(node)
+                continue
+            attr = '%s %s' % (
+                node.get('class', ''),
+                node.get('id', '')
+            )
+            if self.p_clean_tree.search(attr):
+                to_drop.append(node)
+                continue
+            aa = node.xpath('.//a')
+            if aa:
+                text_node = len(self.p_space.sub('', node.text_content()))
+                text_aa = 0
+                for a in aa:
+                    alen = len(self.p_space.sub('', a.text_content()))
+                    if alen > 5:
+                        text_aa += alen
+                if text_aa > text_node * 0.4:
+                    to_drop.append(node)
+        for node in to_drop:
+            try:
+                node.drop_tree()
+            except:
+                pass
+        return tree
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_same_result_as_legacy(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        html, encoding = encoding_detector.decode(f.read())
+    url = 'http://www.boc.cn/custserv/bi2/%s' % name
+    title, content = MainContent().extract(url, html)
+    assert content
+    assert (title, content) == _LegacyMainContent().extract(url, html)
+
+
+def test_text_stats():
+    tree = lxml.html.fromstring('<div>ab <p>c d<a href="#">链接文字很长的</a>e</p><a href="#">短</a> f<!-- x --></div>')
+    stats = MainContent().text_stats(tree)
+    p, = tree.xpath('//p')
+    # 与text_content()去掉空白后的长度相同，只统计超过5个字符的链接
+    assert stats[tree] == (len('abcd链接文字很长的e短f'), len('链接文字很长的'), True)
+    assert stats[p] == (len('cd链接文字很长的e'), len('链接文字很长的'), True)
+    assert stats[tree.xpath('//a')[1]] == (1, 0, False)
@@ -0,0 +1,64 @@
+import asyncio
+
+import aiohttp
+
+from myspiders.base import metrics
+from myspiders.base.metrics import MetricsRegistry
+
+
+def test_histogram_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Request latency', ('host',), buckets=(0.1, 0.5, 1))
+    for value in (0.05, 0.1, 0.3, 0.7, 2):               # 等于上限的值计入该bucket(le)
+        latency.observe(value, 'word.iciba.com')
+    assert registry.render().splitlines() == [
+        '# HELP latency_seconds Request latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{host="word.iciba.com",le="0.1"} 2',
+        'latency_seconds_bucket{host="word.iciba.com",le="0.5"} 3',
+        'latency_seconds_bucket{host="word.iciba.com",le="1"} 4',
+        'latency_seconds_bucket{host="word.iciba.com",le="+Inf"} 5',
+        'latency_seconds_sum{host="word.iciba.com"} 3.15',
+        'latency_seconds_count{host="word.iciba.com"} 5',
+    ]
+    assert latency.count('word.iciba.com') == 5 and latency.count('other') == 0
+
+
+def test_label_escaping_and_collectors():
+    registry = MetricsRegistry()
+    errors = registry.counter('errors_total', 'Errors by reason', ('reason',))
+    depth = registry.gauge('queue_depth', 'Queue depth')
+    errors.inc('say "hi"\\n\nnext', amount=2)
+    registry.add_collector(lambda: depth.set(7))          # 输出前采样当前值
+    lines = registry.render().splitlines()
+    assert r'errors_total{reason="say \"hi\"\\n\nnext"} 2.0' in lines
+    assert 'queue_depth 7' in lines
+    assert registry.counter('errors_total', 'ignored') is errors     # 同名指标只创建一次
+
+
+def test_metrics_endpoint():
+    gauge = metrics.registry.gauge('test_endpoint_value', 'Value sampled by the test collector')
+
+    def collector():
+        gauge.set(42)
+
+    async def run():
+        metrics.registry.add_collector(collector)
+        await metrics.metrics_server.start(port=0)
+        await metrics.metrics_server.start(port=0)          # 第二个spider共用同一个接口
+        try:
+            port = metrics.metrics_server.runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.get('http://127.0.0.1:%s/metrics' % port) as resp:
+                    return resp.status, resp.headers['Content-Type'], await resp.text()
+        finally:
+            metrics.registry.remove_collector(collector)
+            await metrics.metrics_server.stop()
+            still_running = metrics.metrics_server.runner is not None
+            await metrics.metrics_server.stop()
+            assert still_running and metrics.metrics_server.runner is None
+
+    status, content_type, text = asyncio.run(run())
+    assert status == 200 and content_type.startswith('text/plain')
+    assert 'test_endpoint_value 42' in text.splitlines()
+    assert '# TYPE spider_request_latency_seconds histogram' in text
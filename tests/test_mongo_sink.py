@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from database import MongoItemSink
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class _FlakyCollection(object):
+    """前failures次bulk_write失败的collection; fail_index不为None时只有该位置的文档失败(BulkWriteError)"""
+
+    def __init__(self, collec, failures: int = 0, fail_index: int = None):
+        self.collec = collec
+        self.failures = failures
+        self.fail_index = fail_index
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.collec, name)
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.fail_index is None:
+                raise AutoReconnect('connection refused')
+            result = self.collec.bulk_write([one for i, one in enumerate(operations) if i != self.fail_index], ordered=ordered)
+            raise BulkWriteError({
+                'writeErrors': [{'index': self.fail_index, 'code': 11000, 'errmsg': 'duplicate key'}],
+                'nUpserted': result.upserted_count, 'nMatched': result.matched_count, 'nModified': result.modified_count,
+            })
+        return self.collec.bulk_write(operations, ordered=ordered)
+
+
+@pytest.fixture
+def collec():
+    return mongomock.MongoClient().db.words
+
+
+def _word(i, chinese='中文'):
+    return {'_id': 'w%s' % i, 'name_english': 'w%s' % i, 'name_chinese': chinese, 'status': 'undo'}
+
+
+def test_flush_on_batch_size(collec, tmp_path):
+    async def run():
+        sink = MongoItemSink(collec, batch_size=3, flush_interval=3600, spill_path=str(tmp_path / 'spill.jsonl'))
+        for i in range(5):
+            await sink.add(_word(i))
+        written = collec.count_documents({})
+        await sink.close()
+        return written, sink
+
+    written, sink = asyncio.run(run())
+    assert written == 3
+    assert collec.count_documents({}) == 5
+    assert sink.inserted_counts == 5
+
+
+def test_flush_on_interval(collec, tmp_path):
+    async def run():
+        sink = MongoItemSink(collec, batch_size=100, flush_interval=0.05, spill_path=str(tmp_path / 'spill.jsonl'))
+        await sink.add(_word(0))
+        assert collec.count_documents({}) == 0
+        await asyncio.sleep(0.06)
+        await sink.add(_word(1))
+        return collec.count_documents({})
+
+    assert asyncio.run(run()) == 2
+
+
+def test_insert_mode_keeps_existing_documents(collec, tmp_path):
+    async def run():
+        sink = MongoItemSink(collec, spill_path=str(tmp_path / 'spill.jsonl'))
+        await sink.add(_word(0, chinese='旧'))
+        await sink.close()
+        await sink.add(_word(0, chinese='新'))
+        await sink.close()
+        setter = MongoItemSink(collec, mode='set', insert_only=('status',), spill_path=str(tmp_path / 'spill.jsonl'))
+        collec.update_one({'_id': 'w0'}, {'$set': {'status': 'done'}})
+        await setter.add(_word(0, chinese='新'))
+        await setter.close()
+
+    asyncio.run(run())
+    assert collec.find_one({'_id': 'w0'}) == {'_id': 'w0', 'name_english': 'w0', 'name_chinese': '新', 'status': 'done'}
+
+
+def test_failed_batch_is_retried(collec, tmp_path):
+    flaky = _FlakyCollection(collec, failures=1)
+    written = []
+
+    async def run():
+        sink = MongoItemSink(flaky, batch_size=2, flush_interval=3600, on_written=written.extend, spill_path=str(tmp_path / 'spill.jsonl'))
+        for i in range(3):
+            await sink.add(_word(i))
+        assert len(sink.buffer) == 3 and written == []     # 失败后不丢弃，也不再每条文档重试一次
+        await sink.close(retry_delay=0)
+
+    asyncio.run(run())
+    assert collec.count_documents({}) == 3
+    assert sorted(written) == ['w0', 'w1', 'w2']
+
+
+def test_partial_bulk_write_error(collec, tmp_path):
+    flaky = _FlakyCollection(collec, failures=1, fail_index=1)
+    written = []
+
+    async def run():
+        sink = MongoItemSink(flaky, batch_size=3, flush_interval=3600, on_written=written.extend, spill_path=str(tmp_path / 'spill.jsonl'))
+        for i in range(3):
+            await sink.add(_word(i))
+        assert [_id for _id, update in sink.buffer] == ['w1']
+        assert written == ['w0', 'w2']
+        await sink.close(retry_delay=0)
+
+    asyncio.run(run())
+    assert written == ['w0', 'w2', 'w1']
+
+
+def test_spill_and_replay(collec, tmp_path):
+    spill_path = str(tmp_path / 'spill.jsonl')
+    flaky = _FlakyCollection(collec, failures=100)
+
+    async def run():
+        sink = MongoItemSink(flaky, batch_size=2, spill_path=spill_path)
+        for i in range(3):
+            await sink.add(_word(i))
+        await sink.close(retries=1, retry_delay=0)
+        assert sink.failed_counts == 3 and collec.count_documents({}) == 0
+
+        replay = MongoItemSink(collec, spill_path=spill_path)
+        assert len(replay.buffer) == 3
+        await replay.close()
+
+    asyncio.run(run())
+    assert collec.count_documents({}) == 3
+    assert not (tmp_path / 'spill.jsonl').exists()
+
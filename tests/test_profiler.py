@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+
+from myspiders.base.profiler import StageProfiler
+
+
+def _busy(seconds):
+    # 用busy wait代替sleep，避免系统调度误差让自身用时变成负数
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_nested_stages_and_self_time():
+    profiler = StageProfiler()
+    profiler.start()
+    with profiler.stage('request'):
+        _busy(0.02)
+        for i in range(2):
+            with profiler.stage('extract'):
+                _busy(0.01)
+    profiler.stop()
+
+    assert profiler.stats[('request',)][0] == 1
+    assert profiler.stats[('request', 'extract')][0] == 2
+    assert ('extract',) not in profiler.stats
+    self_times = profiler._self_times()
+    total = profiler.stats[('request',)][1]
+    assert self_times[('request',)] == total - profiler.stats[('request', 'extract')][1]
+    assert 0.015 < self_times[('request',)] < total
+    assert self_times[('request', 'extract')] >= 0.02
+
+    lines = dict(line.rsplit(' ', 1) for line in profiler.folded().splitlines())
+    assert set(lines) == {'request', 'request;extract'}
+    assert int(lines['request;extract']) >= 20000
+    report = profiler.report().splitlines()
+    assert report[2].endswith(' request') and report[3].endswith('   extract')
+
+
+def test_stage_paths_are_per_task():
+    profiler = StageProfiler()
+
+    async def worker(name):
+        async def callback():
+            with profiler.stage('callback:' + name):
+                await asyncio.sleep(0.01)
+        await profiler.wrap(callback, 'handle_request')()
+
+    async def main():
+        await asyncio.gather(worker('a'), worker('b'))
+
+    asyncio.run(main())
+    assert sorted(profiler.stats) == [('handle_request',), ('handle_request', 'callback:a'), ('handle_request', 'callback:b')]
+    assert profiler.stats[('handle_request',)][0] == 2
+
+
+def test_stop_with_tool_and_without_dump_dir(tmp_path):
+    profiler = StageProfiler()
+    profiler.start(tool='cprofile')
+    with profiler.stage('request'):
+        pass
+    profiler.stop(dump_dir=None)
+    assert profiler.tool is None
+    assert os.listdir(tmp_path) == []
+
+    profiler.start(tool='cprofile')
+    profiler.stop(dump_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['spider.prof', 'spider_stages.folded']
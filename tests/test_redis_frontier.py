@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from myspiders.base.redis_frontier import RedisFrontier
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')                 # fakeredis执行Lua脚本需要lupa
+
+
+def _descriptor(url):
+    return {'url': url, 'method': 'GET', 'callback': 'parse'}
+
+
+def test_push_request_keeps_listing_pages():
+    async def run():
+        frontier = RedisFrontier(key='test', client=fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer()))
+        ids = [await frontier.push_request(_descriptor('https://news.sina.com.cn/roll/index.d.html?cid=56261&page=%s' % page)) for page in (1, 2, 1)]
+        await frontier.close()
+        return ids
+
+    first, second, again = asyncio.run(run())
+    assert first is not None and second is not None and first != second
+    assert again is None
+
+
+def _frontiers(count, lease_seconds=60):
+    """共用一个FakeServer的多个节点"""
+    server = fakeredis.FakeServer()
+    return [RedisFrontier(key='test', lease_seconds=lease_seconds, client=fakeredis.FakeAsyncRedis(server=server)) for i in range(count)]
+
+
+async def _close(*frontiers):
+    for frontier in frontiers:
+        await frontier.close()
+
+
+def test_lease_and_ack():
+    async def run():
+        frontier, = _frontiers(1)
+        ids = [await frontier.push_request(_descriptor('http://word.iciba.com/?action=words&class=11&course=%s' % i)) for i in range(3)]
+        leased = await frontier.lease(2)
+        assert [one for one, descriptor in leased] == ids[:2]
+        assert leased[0][1] == _descriptor('http://word.iciba.com/?action=words&class=11&course=0')
+        # 已领取的请求在租约期间不会再被领取，但仍然计入pending
+        assert [one for one, descriptor in await frontier.lease(5)] == ids[2:]
+        assert await frontier.lease(5) == []
+        assert await frontier.pending_counts() == 3
+
+        for request_id in ids[:2]:
+            await frontier.ack(request_id)
+        assert await frontier.pending_counts() == 1
+        assert await frontier.clear() is False          # 还有没有确认的请求
+        await frontier.ack(ids[2])
+        assert await frontier.pending_counts() == 0
+        assert await frontier.clear() is True
+        # clear()后去重集合也已删除
+        assert await frontier.push_request(_descriptor('http://word.iciba.com/?action=words&class=11&course=0')) is not None
+        counts = dict(frontier.counts)
+        await _close(frontier)
+        return counts
+
+    counts = asyncio.run(run())
+    assert counts == {'pushed': 4, 'duplicates': 0, 'leased': 3, 'requeued': 0, 'acked': 3}
+
+
+def test_requeue_after_lease_expiry():
+    async def run():
+        crashed, other = _frontiers(2, lease_seconds=0.2)
+        request_id = await crashed.push_request(_descriptor('http://word.iciba.com/'))
+        assert [one for one, descriptor in await crashed.lease(1)] == [request_id]
+        assert await other.lease(1) == []               # 租约还没有过期
+        await asyncio.sleep(0.3)                        # crashed没有确认就退出了
+        leased = await other.lease(1)
+        assert leased == [(request_id, _descriptor('http://word.iciba.com/'))]
+        await other.ack(request_id)
+        assert await other.pending_counts() == 0
+        counts = other.counts['requeued']
+        await _close(crashed, other)
+        return counts
+
+    assert asyncio.run(run()) == 1
+
+
+def test_renew_keeps_the_lease():
+    async def run():
+        owner, other = _frontiers(2, lease_seconds=0.3)
+        first = await owner.push_request(_descriptor('http://word.iciba.com/?a=1'))
+        second = await owner.push_request(_descriptor('http://word.iciba.com/?a=2'))
+        await owner.lease(2)
+        await owner.ack(second)
+        await asyncio.sleep(0.2)
+        # 已确认的请求不在队列中，不会被renew重新加入
+        assert await owner.renew([first, second]) == 1
+        await asyncio.sleep(0.2)                        # 超过最初的租约，但没有超过续期后的租约
+        assert await other.lease(2) == []
+        assert await owner.pending_counts() == 1
+        await asyncio.sleep(0.2)
+        assert [one for one, descriptor in await other.lease(2)] == [first]
+        await _close(owner, other)
+
+    asyncio.run(run())
+
+
+def test_competing_consumers_lease_each_request_once():
+    async def run():
+        seed, *nodes = _frontiers(5)
+        ids = {await seed.push_request(_descriptor('http://word.iciba.com/?a=%s' % i)) for i in range(7)}
+        results = await asyncio.gather(*[node.lease(1) for node in nodes] + [node.lease(2) for node in nodes])
+        leased = [request_id for result in results for request_id, descriptor in result]
+        await _close(seed, *nodes)
+        return ids, leased, [len(result) for result in results[:len(nodes)]]
+
+    ids, leased, singles = asyncio.run(run())
+    assert sorted(leased) == sorted(ids)                # 每个请求只被一个节点领取
+    assert singles == [1, 1, 1, 1]
+
+    async def race():
+        seed, first, second = _frontiers(3)
+        request_id = await seed.push_request(_descriptor('http://word.iciba.com/'))
+        results = await asyncio.gather(first.lease(1), second.lease(1))
+        await _close(seed, first, second)
+        return request_id, results
+
+    request_id, results = asyncio.run(race())
+    assert sorted(results, key=len) == [[], [(request_id, _descriptor('http://word.iciba.com/'))]]
+
+
+def test_lease_of_removed_request():
+    async def run():
+        frontier, = _frontiers(1)
+        request_id = await frontier.push_request(_descriptor('http://word.iciba.com/'))
+        await frontier.client.hdel(frontier.keys['requests'], request_id)
+        leased = await frontier.lease(1)
+        await _close(frontier)
+        return request_id, leased
+
+    request_id, leased = asyncio.run(run())
+    assert leased == [(request_id, None)]               # 请求描述已不存在，由调用方直接ack()
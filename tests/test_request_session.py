@@ -0,0 +1,62 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+import myspiders.base.request as request_module
+from myspiders.base import Request, session_pool
+
+
+async def _serve():
+    async def handler(request):
+        return web.Response(text='<html><body><p>ok</p></body></html>', content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, 'http://127.0.0.1:%s/' % site._server.sockets[0].getsockname()[1]
+
+
+def test_standalone_request_closes_its_session(monkeypatch):
+    created = []
+    client_session = aiohttp.ClientSession
+
+    def _session(*args, **kwargs):
+        created.append(client_session(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(request_module.aiohttp, 'ClientSession', _session)
+
+    async def run():
+        runner, url = await _serve()
+        try:
+            request = Request(url)
+            response = await request.fetch()
+            assert response.ok and request.request_session is None
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+    assert len(created) == 1 and created[0].closed
+    assert not session_pool.sessions
+
+
+def test_request_uses_shared_session_while_acquired():
+    async def run():
+        runner, url = await _serve()
+        session_pool.acquire()
+        try:
+            first, second = Request(url), Request(url)
+            await first.fetch()
+            await second.fetch()
+            assert first.request_session is second.request_session is session_pool.get()
+            assert not first.request_session.closed
+        finally:
+            await session_pool.release()
+            await runner.cleanup()
+        assert not session_pool.sessions
+
+    asyncio.run(run())
@@ -0,0 +1,117 @@
+import asyncio
+
+from aiohttp import web
+
+from myspiders.base import Request, session_pool
+
+TEXT = '中国工商银行关于调整个人存款利率的公告'
+PAGES = {
+    # 响应头声明utf-8，实际为<meta>声明的gbk
+    'mislabeled': (('<html><head><meta charset="gbk"></head><body><p>%s</p></body></html>' % TEXT).encode('gbk'), 'text/html; charset=utf-8'),
+    'gbk': (('<html><body><p>%s</p></body></html>' % TEXT).encode('gbk'), 'text/html; charset=gbk'),
+}
+
+
+async def _fetch_all():
+    async def handler(request):
+        body, content_type = PAGES[request.match_info['name']]
+        return web.Response(body=body, headers={'Content-Type': content_type})
+
+    app = web.Application()
+    app.router.add_get('/{name}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        responses = {}
+        for name in PAGES:
+            responses[name] = await Request('http://127.0.0.1:%s/%s' % (port, name), request_config={'STREAM': True, 'RETRIES': 0}).fetch()
+        return responses
+    finally:
+        await session_pool.close()
+        await runner.cleanup()
+
+
+def test_streamed_etree_matches_detected_encoding():
+    responses = asyncio.run(_fetch_all())
+    for name, response in responses.items():
+        assert TEXT in response.html, name
+        assert response.html_etree.xpath('string(//p)') == TEXT, name
+    assert responses['mislabeled'].encoding == 'gb18030'
+
+
+async def _serve_stream_pages(run):
+    hits = []
+
+    async def page(request):
+        hits.append(request.path)
+        name = request.match_info['name']
+        if name == 'big':
+            return web.Response(body=b'<html><body>' + b'x' * 5000 + b'</body></html>', headers={'Content-Type': 'text/html; charset=utf-8'})
+        if name == 'chunked':
+            # 没有Content-Length，只能在读取时累计大小
+            resp = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+            resp.enable_chunked_encoding()
+            await resp.prepare(request)
+            for i in range(10):
+                await resp.write(b'<p>' + b'x' * 1000 + b'</p>')
+            await resp.write_eof()
+            return resp
+        if name == 'report.html':
+            return web.Response(body=b'%PDF-1.4 ...', headers={'Content-Type': 'application/pdf'})
+        if name == 'logo':
+            return web.Response(body=b'\x89PNG\r\n', headers={'Content-Type': 'image/png'})
+        if name == 'feed':
+            return web.Response(body=b'<rss><item>x</item></rss>', headers={'Content-Type': 'application/rss+xml'})
+        return web.Response(body=b'%PDF-1.4 ...', headers={'Content-Type': 'application/octet-stream'})
+
+    app = web.Application()
+    app.router.add_get('/{name}', page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await run('http://127.0.0.1:%s/' % port), hits
+    finally:
+        await session_pool.close()
+        await runner.cleanup()
+
+
+def _stream(url, **config):
+    # RETRIES大于0: 被跳过的响应不应该重试
+    return Request(url, request_config=dict({'STREAM': True, 'RETRIES': 2, 'MAX_BODY_SIZE': 4096}, **config)).fetch()
+
+
+def test_stream_size_cap():
+    async def run(base):
+        return await _stream(base + 'big'), await _stream(base + 'chunked'), await _stream(base + 'big', MAX_BODY_SIZE=0), \
+            await Request(base + 'big', request_config={'RETRIES': 0}).fetch()
+
+    (big, chunked, unlimited, not_streamed), hits = asyncio.run(_serve_stream_pages(run))
+    assert not big.ok and big.status == 200                 # Content-Length超过上限，不读取内容
+    assert not chunked.ok                                   # 读取时超过上限
+    assert unlimited.ok and not_streamed.ok                 # MAX_BODY_SIZE为0或不使用STREAM时不限制
+    assert hits == ['/big', '/chunked', '/big', '/big']
+
+
+def test_stream_rejects_binary_content_type():
+    async def run(base):
+        return [await _stream(base + name) for name in ('report.html', 'logo', 'feed')]
+
+    (pdf, png, feed), hits = asyncio.run(_serve_stream_pages(run))
+    assert not pdf.ok and not png.ok                        # 按Content-Type判断，与url无关
+    assert feed.ok and '<item>' in feed.html                # +xml是文本
+    assert hits == ['/report.html', '/logo', '/feed']
+
+
+def test_stream_skips_binary_url():
+    async def run(base):
+        return [await _stream(base + name) for name in ('notice.pdf', 'files.ZIP?id=1')]
+
+    responses, hits = asyncio.run(_serve_stream_pages(run))
+    assert [one.ok for one in responses] == [False, False]
+    assert hits == []                                       # 不访问网络
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+from myspiders.base.scheduler import HostScheduler
+
+URL = 'http://word.iciba.com/?action=courses&classid=11'
+OTHER = 'http://finance.sina.com.cn/money/bank/'
+
+
+def _delay(scheduler, url=URL):
+    return scheduler._get_host(url).delay
+
+
+def test_backoff_on_429_5xx_and_errors():
+    scheduler = HostScheduler(scheduler_config={'MIN_DELAY': 0.5, 'MAX_DELAY': 3, 'BACKOFF': 2.0})
+    delays = []
+    for status in (429, 503, None, 500, 502):          # None: 超时或连接错误
+        scheduler.feedback(URL, status=status)
+        delays.append(_delay(scheduler))
+    assert delays == [0.5, 1.0, 2.0, 3, 3]                # 最多MAX_DELAY
+    assert _delay(scheduler, OTHER) == 0                  # 只影响出错的host
+    scheduler.feedback(URL, status=404)                   # 4xx不是服务器过载
+    assert _delay(scheduler) == pytest.approx(3 * 0.8)
+
+
+def test_recover_after_success():
+    scheduler = HostScheduler(scheduler_config={'MIN_DELAY': 0.5, 'RECOVER': 0.5})
+    scheduler.feedback(URL, status=429)
+    scheduler.feedback(URL, status=429)
+    assert _delay(scheduler) == 1.0
+    scheduler.feedback(URL, status=200)
+    assert _delay(scheduler) == 0.5
+    scheduler.feedback(URL, status=200)
+    assert _delay(scheduler) == 0                         # 低于MIN_DELAY时直接恢复为0
+
+
+def test_latency_slowdown_and_recovery():
+    scheduler = HostScheduler(scheduler_config={'MIN_DELAY': 0.5, 'RECOVER': 0.5, 'LATENCY_FACTOR': 3.0, 'LATENCY_FLOOR': 0.1})
+    scheduler.feedback(URL, status=200, latency=0.2)      # 基准0.2s，超过0.6s时减速
+    scheduler.feedback(URL, status=200, latency=2.0)      # 移动平均0.56s，还没有超过
+    assert _delay(scheduler) == 0
+    scheduler.feedback(URL, status=200, latency=2.0)      # 移动平均0.848s
+    assert _delay(scheduler) == 0.5
+    delays = []
+    for i in range(5):                                    # 响应恢复正常，移动平均逐步回落到0.6s以下
+        scheduler.feedback(URL, status=200, latency=0.2)
+        delays.append(_delay(scheduler))
+    assert delays == [1.0, 2.0, 1.0, 0.5, 0]
+    assert scheduler._get_host(URL).baseline == 0.2
+
+
+def test_latency_floor():
+    scheduler = HostScheduler(scheduler_config={'LATENCY_FACTOR': 3.0, 'LATENCY_FLOOR': 0.1})
+    scheduler.feedback(URL, status=200, latency=0.005)    # 个别极快的响应
+    for i in range(10):
+        scheduler.feedback(URL, status=200, latency=0.25)   # 超过基准的3倍，但没有超过LATENCY_FLOOR的3倍
+    assert _delay(scheduler) == 0
+
+
+def test_token_bucket():
+    scheduler = HostScheduler(scheduler_config={'RATE': 50, 'BURST': 2})
+
+    async def run(url, count):
+        begin = time.monotonic()
+        for i in range(count):
+            await scheduler.wait(url)
+        return time.monotonic() - begin
+
+    async def main():
+        burst = await run(URL, 2)                         # 突发的2个请求不等待
+        limited = await run(URL, 4)                       # 之后每秒50个
+        other = await run(OTHER, 2)                       # 每个host单独的令牌桶
+        return burst, limited, other
+
+    burst, limited, other = asyncio.run(main())
+    assert burst < 0.02 and other < 0.02
+    assert 4 / 50 * 0.9 <= limited < 0.5
+
+
+def test_no_rate_limit_and_delay():
+    scheduler = HostScheduler(scheduler_config={'RATE': 0})
+
+    async def main():
+        begin = time.monotonic()
+        for i in range(100):
+            await scheduler.wait(URL)
+        unlimited = time.monotonic() - begin
+        scheduler._get_host(URL).delay = 0.05             # 自适应的额外间隔
+        begin = time.monotonic()
+        await scheduler.wait(URL)
+        return unlimited, time.monotonic() - begin
+
+    unlimited, delayed = asyncio.run(main())
+    assert unlimited < 0.05
+    assert delayed >= 0.045
+
+
+def test_per_host_and_global_concurrency():
+    scheduler = HostScheduler(concurrency=3, scheduler_config={'PER_HOST': 2, 'RATE': 0})
+    running = {URL: 0, OTHER: 0}
+    peaks = {URL: 0, OTHER: 0, 'all': 0}
+
+    async def request(url):
+        async with scheduler.slot(url):
+            running[url] += 1
+            peaks[url] = max(peaks[url], running[url])
+            peaks['all'] = max(peaks['all'], sum(running.values()))
+            await asyncio.sleep(0.01)
+            running[url] -= 1
+
+    async def main():
+        await asyncio.gather(*[request(URL) for i in range(6)] + [request(OTHER) for i in range(6)])
+
+    asyncio.run(main())
+    assert peaks == {URL: 2, OTHER: 2, 'all': 3}
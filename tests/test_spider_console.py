@@ -0,0 +1,58 @@
+import asyncio
+from importlib import import_module
+
+from myspiders.base import Spider
+from myspiders.spider_news.dict_spider import DictSpider
+
+# myspiders/__init__.py导出的spider_console是函数，这里需要模块
+spider_console = import_module('myspiders.spider_console')
+
+
+class _PoliteSpider(Spider):
+    name = '_PoliteSpider'
+    concurrency = 2
+
+
+def _record_starts(monkeypatch, *spider_classes):
+    """替换async_start/start，只记录spider实例的concurrency，不发送请求"""
+    started = {}
+
+    def make(cls):
+        def start(*args, **kwargs):
+            spider_ins = cls(loop=asyncio.new_event_loop(), **kwargs)
+            started[cls.name] = spider_ins.concurrency
+            spider_ins.loop.close()
+            return spider_ins
+
+        async def async_start(*args, cancel_tasks=True, **kwargs):
+            return start(**kwargs)
+        return start, async_start
+
+    for cls in spider_classes:
+        start, async_start = make(cls)
+        monkeypatch.setattr(cls, 'start', start)
+        monkeypatch.setattr(cls, 'async_start', async_start)
+    return started
+
+
+def test_share_never_exceeds_declared_concurrency(monkeypatch):
+    started = _record_starts(monkeypatch, DictSpider, _PoliteSpider)
+    monkeypatch.setattr(spider_console, 'file_name', lambda: ['dict_spider'])
+    monkeypatch.setattr(spider_console, 'spider_classes', lambda module: [DictSpider, _PoliteSpider])
+
+    asyncio.run(spider_console.async_spider_console(concurrency=30))
+    assert started == {'DictSpider': DictSpider.concurrency, '_PoliteSpider': 2}
+
+    # 总并发数低于声明的concurrency时按份额降低
+    asyncio.run(spider_console.async_spider_console(concurrency=4))
+    assert started == {'DictSpider': 2, '_PoliteSpider': 2}
+
+
+def test_process_mode_share_never_exceeds_declared_concurrency(monkeypatch):
+    started = _record_starts(monkeypatch, DictSpider)
+    spider_console._process_start_spider('dict_spider', 30)
+    assert started == {'DictSpider': DictSpider.concurrency}
+
+
+def test_default_mode_runs_module_start():
+    assert spider_console.SPIDER_CONSOLE['mode'] == 'sequential'